@@ -0,0 +1,134 @@
+"""
+Бенчмарк: пропускная способность одного воркера при конкурентных ходах диалога.
+
+Сравнивает:
+- sync  — синхронный FSM, вызываемый прямо из корутины (как /chat до async FSM):
+           каждый вызов Redis блокирует event loop;
+- async — AsyncFSM на redis.asyncio.
+
+Без --redis-url используется in-memory Redis (fakeredis) с искусственной
+задержкой сети на каждую команду (--latency-ms), чтобы воспроизвести
+round trip до настоящего Redis.
+
+Запуск:
+    python benchmarks/bench_async_fsm.py --users 200 --latency-ms 1
+    python benchmarks/bench_async_fsm.py --redis-url redis://localhost:6379/0
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(ROOT / "services" / "orchestrator"))
+
+from app.catalog import CatalogStore  # noqa: E402
+from app.fsm import FSM, AsyncFSM  # noqa: E402
+from app import main  # noqa: E402
+
+SCENARIO = "Аренда зала"
+TURNS = [
+    ("", "button", "Рассчитать стоимость аренды"),
+    ("после 16", "text", None),
+    ("12", "text", None),
+    ("занятие", "text", None),
+]
+
+
+class SlowRedis:
+    """Синхронный Redis с задержкой на каждую команду"""
+
+    def __init__(self, client, latency: float):
+        self._client = client
+        self._latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            time.sleep(self._latency)
+            return attr(*args, **kwargs)
+        return call
+
+
+class SlowAsyncRedis:
+    """Асинхронный Redis с задержкой на каждую команду"""
+
+    def __init__(self, client, latency: float):
+        self._client = client
+        self._latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            await asyncio.sleep(self._latency)
+            return await attr(*args, **kwargs)
+        return call
+
+
+def make_fsms(redis_url, latency):
+    sync_fsm = FSM(redis_url or "redis://localhost:6379/0")
+    async_fsm = AsyncFSM(redis_url or "redis://localhost:6379/0")
+    if not redis_url:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        sync_fsm.redis_client = SlowRedis(
+            fakeredis.FakeStrictRedis(server=server, decode_responses=True), latency)
+        async_fsm.redis_client = SlowAsyncRedis(
+            fakeredis.FakeAsyncRedis(server=server, decode_responses=True), latency)
+    return sync_fsm, async_fsm
+
+
+async def run_sync(users: int, catalog) -> float:
+    async def dialog(user_id):
+        for text, action_type, action_name in TURNS:
+            main.process_state_machine(SCENARIO, text, action_type, action_name,
+                                       "bench", "bench", user_id, catalog)
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(dialog(f"sync_{i}") for i in range(users)))
+    return time.perf_counter() - start
+
+
+async def run_async(users: int, catalog) -> float:
+    async def dialog(user_id):
+        for text, action_type, action_name in TURNS:
+            await main.process_state_machine_async(SCENARIO, text, action_type, action_name,
+                                                   "bench", "bench", user_id, catalog)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(dialog(f"async_{i}") for i in range(users)))
+    return time.perf_counter() - start
+
+
+async def bench(args):
+    catalog = CatalogStore(ROOT / "data" / "dikidi_stub.json", poll_interval=0).snapshot
+    sync_fsm, async_fsm = make_fsms(args.redis_url, args.latency_ms / 1000)
+    main.set_fsm(sync_fsm)
+    main.set_async_fsm(async_fsm)
+
+    turns = args.users * len(TURNS)
+    print(f"users={args.users} turns={turns} "
+          f"redis={'%s' % args.redis_url if args.redis_url else 'fakeredis+%.1fms' % args.latency_ms}")
+    for name, runner in (("sync", run_sync), ("async", run_async)):
+        elapsed = await runner(args.users, catalog)
+        print(f"{name:>5}: {elapsed:8.3f} s  {turns / elapsed:10.1f} turns/s")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    parser.add_argument("--redis-url", default=None)
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_cli()
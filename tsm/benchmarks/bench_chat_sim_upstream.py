@@ -0,0 +1,116 @@
+"""
+Запрос chat-sim -> оркестратор: новый httpx.AsyncClient на сообщение
+(прежний /api/send) против общего пула с keep-alive (app/upstream.py).
+
+Меряет задержку хода /chat и сообщений в секунду для одного пользователя
+и для --users одновременных; для пула — сколько TCP-соединений открыто.
+Без --url запускается uvicorn с FSM на fakeredis (как bench_cold_start.py).
+
+Запуск:
+    python benchmarks/bench_chat_sim_upstream.py --messages 500 --users 20
+    python benchmarks/bench_chat_sim_upstream.py --url http://localhost:8001 --users 50
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(Path(__file__).parent))
+
+from bench_cold_start import FAKE_REDIS_LAUNCHER, ORCHESTRATOR, free_port, wait_for  # noqa: E402
+from flows import FLOWS, chat_payload  # noqa: E402
+from load_chat import percentiles  # noqa: E402
+
+_spec = importlib.util.spec_from_file_location(
+    "chat_sim_upstream", ROOT / "services" / "chat-sim" / "app" / "upstream.py")
+upstream = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(upstream)
+
+
+def payloads(user_id: str, count: int) -> list:
+    """Ходы диалога аренды по кругу"""
+    turns = FLOWS["rent"][1]
+    return [chat_payload("rent", turns[i % len(turns)], user_id) for i in range(count)]
+
+
+async def per_message(url: str, payload: dict) -> None:
+    async with httpx.AsyncClient() as client:
+        response = await client.post(f"{url}/chat", json=payload, timeout=10.0)
+        response.raise_for_status()
+
+
+async def run(url: str, mode: str, users: int, messages: int, settings) -> dict:
+    client = upstream.UpstreamClient(url, settings) if mode == "pool" else None
+    latencies = []
+
+    async def user(index: int):
+        for payload in payloads(f"sim_{mode}_{os.getpid()}_{users}_{index}", messages // users):
+            started = time.perf_counter()
+            if client is None:
+                await per_message(url, payload)
+            else:
+                response = await client.post_json("/chat", payload)
+                response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(users)))
+    elapsed = time.perf_counter() - started
+    stats = None
+    if client is not None:
+        stats = client.pool_stats()
+        await client.aclose()
+    return {"messages": len(latencies), "per_sec": len(latencies) / elapsed,
+            "percentiles": percentiles(latencies), "stats": stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", help="адрес запущенного оркестратора; без него — uvicorn на fakeredis")
+    parser.add_argument("--messages", type=int, default=500, help="сообщений на прогон")
+    parser.add_argument("--users", type=int, default=20, help="одновременных пользователей во втором прогоне")
+    parser.add_argument("--max-connections", type=int, default=20)
+    args = parser.parse_args()
+
+    settings = upstream.UpstreamSettings(max_connections=args.max_connections,
+                                         max_keepalive=args.max_connections)
+    process = None
+    url = args.url
+    if url is None:
+        port = free_port()
+        env = {**os.environ, "DIKIDI_STUB_PATH": str(ROOT / "data" / "dikidi_stub.json")}
+        process = subprocess.Popen([sys.executable, "-c", FAKE_REDIS_LAUNCHER, str(port)],
+                                   cwd=ORCHESTRATOR, env=env)
+        url = f"http://127.0.0.1:{port}"
+        with httpx.Client(base_url=url) as client:
+            if wait_for(client, "/ready", time.perf_counter(), 30.0) is None:
+                process.terminate()
+                raise SystemExit("оркестратор не стал готов за 30 с")
+    try:
+        print(f"{'клиент':<22}{'польз.':>7}{'сообщений':>10}{'сообщ/с':>9}{'p50 мс':>9}{'p95 мс':>9}"
+              f"{'p99 мс':>9}{'TCP':>6}")
+        for users in (1, args.users):
+            for mode in ("per_message", "pool"):
+                # Первый прогон прогревает сервер и не печатается
+                asyncio.run(run(url, mode, users, args.messages // 4, settings))
+                result = asyncio.run(run(url, mode, users, args.messages, settings))
+                p50, p95, p99 = result["percentiles"]
+                connects = result["stats"]["connects"] if result["stats"] else result["messages"]
+                title = "клиент на сообщение" if mode == "per_message" else "общий пул"
+                print(f"{title:<22}{users:>7}{result['messages']:>10}{result['per_sec']:>9.0f}"
+                      f"{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}{connects:>6}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
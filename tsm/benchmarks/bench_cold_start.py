@@ -0,0 +1,155 @@
+"""
+Бюджет холодного старта оркестратора.
+
+Меряет:
+- время импорта app.main (python -X importtime) и самые дорогие модули;
+- от запуска процесса uvicorn до /health (порт слушается), до /ready
+  (прогрев завершен) и до первого ответа /chat; задержку первого и
+  второго хода — с прогревом при старте и без (WARMUP_ON_STARTUP=0).
+
+С --budget-ms / --import-budget-ms выход с кодом 1 при превышении бюджета
+(для CI). Без рабочего Redis — флаг --fake-redis: FSM на fakeredis в
+процессе сервера, прогрев Redis тогда проверяет только пул fakeredis.
+
+Запуск:
+    python benchmarks/bench_cold_start.py --redis-url redis://localhost:6379/0
+    python benchmarks/bench_cold_start.py --fake-redis --budget-ms 3000
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).parents[1]
+ORCHESTRATOR = ROOT / "services" / "orchestrator"
+sys.path.insert(0, str(Path(__file__).parent))
+
+from flows import FLOWS, chat_payload  # noqa: E402
+
+FAKE_REDIS_LAUNCHER = """
+import sys
+import fakeredis
+import uvicorn
+from app.fsm import AsyncFSM
+from app.main import app, set_async_fsm
+fsm = AsyncFSM("redis://localhost:6379/0")
+fsm.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+set_async_fsm(fsm)
+uvicorn.run(app, port=int(sys.argv[1]), log_level="warning")
+"""
+
+
+def import_times(env: dict, top: int):
+    """(мс на импорт app.main, [(модуль, собственное время мс)]) по -X importtime"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                            cwd=ORCHESTRATOR, env=env, capture_output=True, text=True, check=True)
+    total = 0.0
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(own) / 1000))
+        if name.strip() == "app.main":
+            total = int(cumulative) / 1000
+    modules.sort(key=lambda item: item[1], reverse=True)
+    return total, modules[:top]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(client: httpx.Client, path: str, started: float, timeout: float):
+    """Миллисекунды от started до первого 200 на path или None по таймауту"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if client.get(path).status_code == 200:
+                return (time.perf_counter() - started) * 1000
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    return None
+
+
+def cold_start(env: dict, warmup: bool, fake_redis: bool, timeout: float) -> dict:
+    port = free_port()
+    env = {**env, "WARMUP_ON_STARTUP": "1" if warmup else "0"}
+    if fake_redis:
+        cmd = [sys.executable, "-c", FAKE_REDIS_LAUNCHER, str(port)]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"]
+    started = time.perf_counter()
+    process = subprocess.Popen(cmd, cwd=ORCHESTRATOR, env=env)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            listening = wait_for(client, "/health", started, timeout)
+            ready = wait_for(client, "/ready", started, timeout)
+            latencies = []
+            for i, turn in enumerate(FLOWS["rent"][1][:2]):
+                sent = time.perf_counter()
+                response = client.post("/chat", json=chat_payload("rent", turn, f"cold_{port}"))
+                latencies.append((time.perf_counter() - sent) * 1000)
+                response.raise_for_status()
+                if i == 0:
+                    first_response = (time.perf_counter() - started) * 1000
+    finally:
+        process.terminate()
+        process.wait()
+    return {"listening": listening, "ready": ready, "first_response": first_response,
+            "first_turn": latencies[0], "second_turn": latencies[1]}
+
+
+def _ms(value) -> str:
+    return f"{value:.0f}" if value is not None else "—"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    parser.add_argument("--fake-redis", action="store_true", help="FSM на fakeredis (без рабочего Redis)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--budget-ms", type=float, help="бюджет: запуск процесса -> первый ответ /chat")
+    parser.add_argument("--import-budget-ms", type=float, help="бюджет импорта app.main")
+    args = parser.parse_args()
+
+    env = {**os.environ, "REDIS_URL": args.redis_url,
+           "DIKIDI_STUB_PATH": str(ROOT / "data" / "dikidi_stub.json")}
+
+    imported, modules = import_times(env, args.top)
+    print(f"импорт app.main: {imported:.1f} мс; дороже всего (собственное время):")
+    for name, own in modules:
+        print(f"  {own:8.1f} мс  {name}")
+
+    print(f"\n{'прогрев':<9}{'/health':>9}{'/ready':>9}{'1-й ответ':>11}{'1-й ход':>9}{'2-й ход':>9}  (мс)")
+    worst = 0.0
+    for warmup in (True, False):
+        for _ in range(args.runs):
+            run = cold_start(env, warmup, args.fake_redis, args.timeout)
+            if warmup:
+                worst = max(worst, run["first_response"])
+            print(f"{'да' if warmup else 'нет':<9}{_ms(run['listening']):>9}{_ms(run['ready']):>9}"
+                  f"{_ms(run['first_response']):>11}{run['first_turn']:>9.1f}{run['second_turn']:>9.1f}")
+
+    failed = False
+    if args.import_budget_ms is not None and imported > args.import_budget_ms:
+        print(f"импорт {imported:.0f} мс превышает бюджет {args.import_budget_ms:.0f} мс")
+        failed = True
+    if args.budget_ms is not None and worst > args.budget_ms:
+        print(f"первый ответ {worst:.0f} мс превышает бюджет {args.budget_ms:.0f} мс")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Микробенчмарк извлечения сущностей: пять отдельных extract_* против
+скомпилированного EntityExtractor (один проход по сообщению).
+
+Запуск:
+    python benchmarks/bench_extractor.py
+"""
+import argparse
+import json
+import random
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(ROOT / "services" / "orchestrator"))
+
+from app.extractor import EntityExtractor  # noqa: E402
+from app.fsm import (  # noqa: E402
+    extract_age, extract_direction, extract_people_count,
+    extract_rent_format, extract_rent_time_bucket
+)
+
+DIRECTIONS = json.loads((ROOT / "data" / "dikidi_stub.json").read_text(encoding="utf-8"))["directions"]
+
+NOISE = ("привет как дела мы хотели бы узнать подробнее про ваши цены и абонементы "
+         "спасибо большое подскажите пожалуйста можно ли прийти с подругой").split()
+
+
+def messages(seed: int = 1):
+    rng = random.Random(seed)
+    noisy = " ".join(rng.choice(NOISE) for _ in range(200))
+    return {
+        "short": "Латина",
+        "typical": "Хочу на латину в среду после 18, нас будет 12 человек",
+        "no_match": "Подскажите, пожалуйста, где вы находитесь?",
+        "long_noisy": noisy + " репетиция после 16 " + noisy,
+        "very_long": " ".join(rng.choice(NOISE) for _ in range(5000)) + " йога",
+    }
+
+
+def reference(text: str):
+    return (
+        extract_age(text),
+        extract_people_count(text),
+        extract_rent_time_bucket(text),
+        extract_direction(text, DIRECTIONS),
+        extract_rent_format(text),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    extractor = EntityExtractor(DIRECTIONS)
+    print(f"{'message':<12}{'chars':>8}{'extract_* us':>15}{'compiled us':>14}{'speedup':>9}")
+    for name, text in messages().items():
+        number = max(10, args.number * 50 // max(len(text), 50))
+        old = timeit.timeit(lambda: reference(text), number=number) / number * 1e6
+        new = timeit.timeit(lambda: extractor.extract(text), number=number) / number * 1e6
+        print(f"{name:<12}{len(text):>8}{old:>15.2f}{new:>14.2f}{old / new:>8.1f}x")
+
+    build = timeit.timeit(lambda: EntityExtractor(DIRECTIONS), number=100) / 100 * 1e3
+    print(f"\nкомпиляция извлекателя: {build:.2f} ms (один раз на версию каталога)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Бенчмарк сериализации JSON: stdlib json против orjson (JSON_BACKEND).
+
+Три части:
+- запись состояния диалога: encode_session + decode_session;
+- тела ответов: /chat с debug (для сравнения — прежний путь через модель
+  ChatResponse и JSONResponse) и /dikidi;
+- /chat целиком через ASGI на fakeredis по диалогам из tests/conversations:
+  ходов в секунду и p99.
+
+Запуск:
+    python benchmarks/bench_json.py --users 100
+"""
+import argparse
+import asyncio
+import sys
+import time
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(ROOT / "services" / "orchestrator"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from app import main as orchestrator  # noqa: E402
+from app import serialization  # noqa: E402
+from app.catalog import CatalogStore  # noqa: E402
+from app.fsm import AsyncFSM  # noqa: E402
+from app.session import decode_session, encode_session  # noqa: E402
+from flows import FLOWS, chat_payload  # noqa: E402
+
+SESSION = ("Детские группы", "kids_need_age", {"direction": "Азбука танца", "age": 6,
+                                               "note": "хочет в группу с подругой"})
+CHAT_BODY = {
+    "reply": "Стоимость аренды зала после 16:00 на 12 человек для занятия — 1500 руб/час. "
+             "Хотите забронировать время?",
+    "intent": "calculate_rental",
+    "version": orchestrator.PRODUCT_VERSION,
+    "debug": {"state_before": "rent_need_format", "scenario": "Аренда зала", "action_type": "text",
+              "action_name": None, "data_collected": {"rent_time_bucket": "evening", "people_count": 12},
+              "catalog_version": 1, "state_after": "idle", "rule_used": "rent: формат -> цена"},
+}
+
+
+def per_call_us(fn, number: int) -> float:
+    fn()
+    return timeit.timeit(fn, number=number) / number * 1e6
+
+
+def session_roundtrip():
+    decode_session(encode_session(*SESSION))
+
+
+def fastapi_chat_body():
+    """Прежний путь /chat: модель ответа, dict в режиме json и JSONResponse"""
+    JSONResponse(orchestrator.ChatResponse(**CHAT_BODY).model_dump(mode="json")).body
+
+
+def fast_chat_body():
+    serialization.FastJSONResponse(CHAT_BODY).body
+
+
+async def measure_http(users: int) -> dict:
+    import fakeredis
+    import httpx
+    from httpx import ASGITransport
+
+    fsm = AsyncFSM("redis://localhost:6379/0")
+    fsm.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    orchestrator.set_async_fsm(fsm)
+    latencies = []
+    started = time.perf_counter()
+    async with httpx.AsyncClient(transport=ASGITransport(app=orchestrator.app), base_url="http://bench") as client:
+        for i in range(users):
+            for flow, (_, turns) in FLOWS.items():
+                for turn in turns:
+                    payload = chat_payload(flow, turn, f"{serialization.backend}_{flow}_{i}")
+                    sent = time.perf_counter()
+                    response = await client.post("/chat", json=payload)
+                    latencies.append(time.perf_counter() - sent)
+                    assert response.status_code == 200, response.text
+    elapsed = time.perf_counter() - started
+    orchestrator.set_async_fsm(None)
+    latencies.sort()
+    return {
+        "turns_per_sec": len(latencies) / elapsed,
+        "p99_us": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--number", type=int, default=50000)
+    args = parser.parse_args()
+
+    if serialization.orjson is None:
+        print("orjson не установлен: сравнение недоступно, измеряется только stdlib")
+    backends = ("stdlib", "orjson") if serialization.orjson is not None else ("stdlib",)
+    orchestrator.set_catalog_store(CatalogStore(ROOT / "data" / "dikidi_stub.json", poll_interval=0))
+    catalog = orchestrator.get_catalog()
+
+    print(f"{'бэкенд':<8}{'сессия мкс':>12}{'/chat мкс':>11}{'/dikidi мкс':>13}{'ходов/с':>10}{'p99 мкс':>10}")
+    for name in backends:
+        serialization.set_backend(name)
+        session = per_call_us(session_roundtrip, args.number)
+        chat = per_call_us(fast_chat_body, args.number)
+        dikidi = per_call_us(lambda: orchestrator.encode_catalog(catalog), args.number // 10)
+        http = asyncio.run(measure_http(args.users))
+        print(f"{name:<8}{session:>12.2f}{chat:>11.2f}{dikidi:>13.1f}"
+              f"{http['turns_per_sec']:>10.0f}{http['p99_us']:>10.0f}")
+    print(f"\nпрежний путь /chat (ChatResponse + JSONResponse): {per_call_us(fastapi_chat_body, args.number):.2f} мкс")
+    print("/dikidi отдает закодированное тело снимка: кодирование — один раз на версию каталога")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Бенчмарк режимов ответа /chat: full (с debug) против lean (reply/intent/version).
+
+Две части:
+- ход без Redis: decide_turn и сериализация ответа — время, пик выделенной
+  памяти (tracemalloc) на ход и размер тела ответа;
+- /chat целиком через ASGI на fakeredis — средняя задержка и p99.
+
+Запуск:
+    python benchmarks/bench_lean_response.py --users 200
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(ROOT / "services" / "orchestrator"))
+
+from app import main as orchestrator  # noqa: E402
+from app.catalog import CatalogStore  # noqa: E402
+from app.fsm import AsyncFSM, StateChange  # noqa: E402
+from app.session import SessionState  # noqa: E402
+
+SCENARIO = "Аренда зала"
+TURNS = [
+    ("", "button", "Рассчитать стоимость аренды"),
+    ("после 16", "text", None),
+    ("12", "text", None),
+    ("занятие", "text", None),
+]
+SESSIONS = [
+    None,
+    SessionState(SCENARIO, "rent_need_time", {}),
+    SessionState(SCENARIO, "rent_need_people", {"rent_time_bucket": "evening"}),
+    SessionState(SCENARIO, "rent_need_format", {"rent_time_bucket": "evening", "people_count": 12}),
+]
+
+
+def core_turns(catalog, lean: bool):
+    """Один проход воронки аренды без Redis; возвращает тела ответов"""
+    bodies = []
+    for (text, action_type, action_name), session in zip(TURNS, SESSIONS):
+        reply, intent, debug = orchestrator.decide_turn(SCENARIO, text, action_type, action_name,
+                                                session, catalog, StateChange(), None, lean)
+        if lean:
+            bodies.append(orchestrator.lean_response(reply, intent).body)
+        else:
+            response = orchestrator.ChatResponse(reply=reply, intent=intent, version=orchestrator.PRODUCT_VERSION, debug=debug)
+            bodies.append(orchestrator.Response(response.model_dump_json()).body)
+    return bodies
+
+
+def measure_core(catalog, lean: bool, number: int) -> dict:
+    core_turns(catalog, lean)
+    started = time.perf_counter()
+    for _ in range(number):
+        core_turns(catalog, lean)
+    per_turn = (time.perf_counter() - started) / number / len(TURNS)
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    core_turns(catalog, lean)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {
+        "us_per_turn": per_turn * 1e6,
+        "peak_bytes_per_turn": peak / len(TURNS),
+        "body_bytes": sum(len(b) for b in core_turns(catalog, lean)) / len(TURNS),
+    }
+
+
+async def measure_http(users: int, lean: bool) -> dict:
+    import fakeredis
+    import httpx
+    from httpx import ASGITransport
+
+    fsm = AsyncFSM("redis://localhost:6379/0")
+    fsm.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    orchestrator.set_async_fsm(fsm)
+    latencies = []
+    mode = "lean" if lean else "full"
+    async with httpx.AsyncClient(transport=ASGITransport(app=orchestrator.app), base_url="http://bench") as client:
+        for i in range(users):
+            for text, action_type, action_name in TURNS:
+                payload = {"user_id": f"{mode}_{i}", "text": text, "scenario": SCENARIO,
+                           "action_type": action_type, "action_name": action_name, "response_mode": mode}
+                started = time.perf_counter()
+                response = await client.post("/chat", json=payload)
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.text
+    orchestrator.set_async_fsm(None)
+    latencies.sort()
+    return {
+        "mean_us": statistics.fmean(latencies) * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--number", type=int, default=5000)
+    args = parser.parse_args()
+
+    catalog = CatalogStore(ROOT / "data" / "dikidi_stub.json", poll_interval=0).snapshot
+    print(f"{'режим':<8}{'мкс/ход':>10}{'пик B/ход':>12}{'тело B':>9}{'HTTP мкс':>11}{'p99 мкс':>10}")
+    for lean in (False, True):
+        core = measure_core(catalog, lean, args.number)
+        http = asyncio.run(measure_http(args.users, lean))
+        print(f"{'lean' if lean else 'full':<8}{core['us_per_turn']:>10.2f}{core['peak_bytes_per_turn']:>12.0f}"
+              f"{core['body_bytes']:>9.0f}{http['mean_us']:>11.0f}{http['p99_us']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
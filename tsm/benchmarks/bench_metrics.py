@@ -0,0 +1,73 @@
+"""
+Бенчмарк накладных расходов метрик на один запрос /chat.
+
+Меряет отдельно метрики, которые пишет сам ход (два round trip Redis,
+правило, интент), и MetricsMiddleware (запросы в работе, задержка по
+эндпоинту, сценарию и состоянию) вокруг пустого ASGI-приложения против
+того же приложения без middleware.
+
+Запуск:
+    python benchmarks/bench_metrics.py --number 200000
+"""
+import argparse
+import asyncio
+import sys
+import time
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(ROOT / "services" / "orchestrator"))
+
+from app.metrics import REGISTRY, MetricsMiddleware, observe_redis, record_turn  # noqa: E402
+
+DEBUG = {"state_before": "rent_need_people", "rule_used": "rent: количество -> формат"}
+
+
+def record_turn_metrics():
+    """Метрики, которые пишет один ход /chat помимо middleware"""
+    started = time.perf_counter()
+    observe_redis("get", started)
+    observe_redis("transition", started)
+    record_turn("calculate_rental", DEBUG)
+
+
+async def empty_app(scope, receive, send):
+    scope["state"]["metrics_labels"] = ("Аренда зала", "rent_need_people")
+
+
+def middleware_cost(number: int) -> float:
+    scope = {"type": "http", "path": "/chat"}
+    wrapped = MetricsMiddleware(empty_app, paths=("/chat",))
+
+    async def run(handler):
+        started = time.perf_counter()
+        for _ in range(number):
+            await handler({**scope, "state": {}}, None, None)
+        return time.perf_counter() - started
+
+    async def both():
+        await run(wrapped)  # прогрев
+        return (await run(wrapped) - await run(empty_app)) / number
+
+    return asyncio.run(both())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    record_turn_metrics()
+    per_request = timeit.timeit(record_turn_metrics, number=args.number) / args.number
+    middleware = middleware_cost(args.number)
+    render = timeit.timeit(REGISTRY.render, number=100) / 100
+
+    print(f"метрики хода (Redis, правило):  {per_request * 1e6:.2f} мкс")
+    print(f"MetricsMiddleware на запрос:    {middleware * 1e6:.2f} мкс")
+    print(f"итого на запрос /chat:          {(per_request + middleware) * 1e6:.2f} мкс")
+    print(f"рендер /metrics:                {render * 1e3:.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Бенчмарк памяти Redis на состояния диалогов: схема ключей и TTL по состояниям.
+
+Пишет сессии пользователей с типичной воронкой (большинство бросают диалог
+после первой кнопки) и считает память активного набора ключей в пересчете
+на 100k пользователей, активных за последние сутки. Последняя активность
+пользователя равномерно распределена по суткам, поэтому ключ состояния с
+TTL t живет у доли min(t, 24ч) / 24ч пользователей в этом состоянии.
+
+Без --redis-url используется fakeredis, и размер ключа оценивается по длине
+ключа и значения; с --redis-url берется MEMORY USAGE.
+
+Запуск:
+    python benchmarks/bench_redis_memory.py --users 20000
+    python benchmarks/bench_redis_memory.py --redis-url redis://localhost:6379/15
+"""
+import argparse
+import random
+import sys
+import uuid
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(ROOT / "services" / "orchestrator"))
+
+from app.fsm import FSM, encode_state  # noqa: E402
+from app.keyspace import DEFAULT_TTL, KeyLayout, TtlPolicy, memory_report  # noqa: E402
+from app.resilience import RedisSettings  # noqa: E402
+
+DAY = 24 * 60 * 60
+
+# (доля пользователей, сценарий, состояние, data); завершенные диалоги ключа не имеют
+FUNNEL = [
+    (0.25, "Аренда зала", "rent_need_time", {}),
+    (0.20, "Запись на занятие", "booking_need_direction", {}),
+    (0.10, "Детские группы", "kids_need_age", {}),
+    (0.15, "Аренда зала", "rent_need_people", {"rent_time_bucket": "evening"}),
+    (0.10, "Аренда зала", "rent_need_format", {"rent_time_bucket": "evening", "people_count": 12}),
+]
+
+CONFIGS = [
+    ("full + 24ч", "full", TtlPolicy.flat(DEFAULT_TTL)),
+    ("short + TTL по состояниям", "short", TtlPolicy.tiered()),
+    ("hashed + TTL по состояниям", "hashed", TtlPolicy.tiered()),
+]
+
+
+def _users(count: int):
+    rng = random.Random(7)
+    channels = ("telegram", "whatsapp", "instagram")
+    for i in range(count):
+        tenant = f"studio_{i % 20:02d}"
+        channel = channels[i % len(channels)]
+        user_id = str(uuid.UUID(int=rng.getrandbits(128))) if channel == "instagram" else str(79000000000 + i)
+        roll, acc = rng.random(), 0.0
+        for share, scenario, state, data in FUNNEL:
+            acc += share
+            if roll < acc:
+                yield tenant, channel, user_id, scenario, state, data
+                break
+
+
+def _client(redis_url):
+    if redis_url:
+        import redis
+        client = redis.from_url(redis_url, decode_responses=True)
+        client.flushdb()
+        return client
+    import fakeredis
+    return fakeredis.FakeStrictRedis(decode_responses=True)
+
+
+def measure(users: int, redis_url=None):
+    rows = []
+    for title, layout_name, policy in CONFIGS:
+        fsm = FSM(redis_url or "redis://localhost:6379/0", layout=KeyLayout(layout_name),
+                  ttl_policy=policy, settings=RedisSettings(fallback_size=0))
+        fsm.redis_client = _client(redis_url)
+        pipe = fsm.redis_client.pipeline(transaction=False)
+        for tenant, channel, user_id, scenario, state, data in _users(users):
+            key = fsm.get_state_key(tenant, channel, user_id)
+            pipe.setex(key, policy.ttl_for(state), encode_state(scenario, state, data))
+        pipe.execute()
+
+        report = memory_report(fsm.redis_client, fsm.layout, sample=users)
+        live_bytes = live_keys = 0.0
+        for (tenant, state), group in report.groups.items():
+            share = min(policy.ttl_for(state), DAY) / DAY
+            live_keys += group.keys * share
+            live_bytes += group.bytes * share
+        scale = 100_000 / users
+        rows.append({
+            "config": title,
+            "key_bytes": sum(len(k) for k in fsm.redis_client.scan_iter(count=1000)) / max(report.sampled, 1),
+            "per_session": report.per_session,
+            "live_keys": live_keys * scale,
+            "live_mib": live_bytes * scale / 2 ** 20,
+            "estimated": report.estimated,
+        })
+        if redis_url:
+            fsm.redis_client.flushdb()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--redis-url", default=None, help="отдельная БД: будет очищена")
+    args = parser.parse_args()
+
+    rows = measure(args.users, args.redis_url)
+    print(f"{'конфигурация':<30}{'ключ, B':>9}{'B/сессию':>10}{'ключей на 100k':>16}{'MiB на 100k':>13}")
+    for r in rows:
+        print(f"{r['config']:<30}{r['key_bytes']:>9.1f}{r['per_session']:>10.1f}"
+              f"{r['live_keys']:>16.0f}{r['live_mib']:>13.2f}")
+    base = rows[0]["live_mib"]
+    for r in rows[1:]:
+        print(f"{r['config']}: {r['live_mib'] / base:.0%} памяти базовой схемы")
+    if rows[0]["estimated"]:
+        print("\n(размеры оценочные: MEMORY USAGE недоступен, используйте --redis-url)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Бенчмарк офлайн-прогона (python -m app.replay): синтетический корпус из
+диалогов tests/conversations с ожидаемыми intent/rule_used/state_after,
+прогон в одном процессе и пулом.
+
+Запуск:
+    python benchmarks/bench_replay.py --turns 1000000 --workers 8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(ROOT / "services" / "orchestrator"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.catalog import CatalogStore  # noqa: E402
+from app.fsm import StateChange, encode_state  # noqa: E402
+from app.main import decide_turn  # noqa: E402
+from app.replay import replay  # noqa: E402
+from app.session import decode_session  # noqa: E402
+from flows import FLOWS, chat_payload  # noqa: E402
+
+STUB_PATH = ROOT / "data" / "dikidi_stub.json"
+
+
+def expected_turns(catalog) -> dict:
+    """Ожидаемые поля каждого хода каждого диалога для нового пользователя"""
+    result = {}
+    for flow, (scenario, turns) in FLOWS.items():
+        raw, expected = None, []
+        for text, action_type, action_name in turns:
+            change = StateChange()
+            _, intent, debug = decide_turn(scenario, text, action_type, action_name,
+                                           decode_session(raw), catalog, change)
+            if change.op == "set":
+                raw = encode_state(change.scenario, change.state, change.data)
+            elif change.op == "clear":
+                raw = None
+            expected.append({"intent": intent, "rule_used": debug["rule_used"],
+                             "state_after": debug["state_after"]})
+        result[flow] = expected
+    return result
+
+
+def write_corpus(path: Path, turns: int, catalog) -> int:
+    """Диалоги разных пользователей вперемешку, как в живом трафике"""
+    expected = expected_turns(catalog)
+    names = list(FLOWS)
+    written, user = 0, 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < turns:
+            # Окно из 50 пользователей: их ходы чередуются
+            window = [(names[(user + i) % len(names)], f"replay_{user + i}") for i in range(50)]
+            user += len(window)
+            for step in range(max(len(FLOWS[name][1]) for name in names)):
+                for flow, user_id in window:
+                    flow_turns = FLOWS[flow][1]
+                    if step >= len(flow_turns):
+                        continue
+                    record = {"request": chat_payload(flow, flow_turns[step], user_id),
+                              "expected": expected[flow][step]}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    written += 1
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--turns", type=int, default=200000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-turns", type=int, default=5000)
+    args = parser.parse_args()
+
+    catalog = CatalogStore(STUB_PATH, poll_interval=0).snapshot
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = Path(tmp) / "corpus.jsonl"
+        written = write_corpus(corpus, args.turns, catalog)
+        print(f"корпус: {written} ходов, {corpus.stat().st_size / 2 ** 20:.1f} MiB")
+        for workers in sorted({1, args.workers}):
+            report = replay(corpus, workers, args.chunk_turns, str(STUB_PATH))
+            print(f"процессов: {workers:>3}  {report.elapsed:7.1f} с  {report.turns_per_sec:>9.0f} ходов/с  "
+                  f"расхождений: {report.diff_turns}, ошибок: {report.errors}")
+            if workers == 1 and written:
+                print(f"  оценка на 1M ходов: {1_000_000 / report.turns_per_sec / 60:.1f} мин на процесс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Бенчмарк кэша готовых ответов: ходы расписания и записи на большом каталоге
+с фрагментами, отрендеренными один раз на версию, и с рендером на каждом ходе.
+
+Запуск:
+    python benchmarks/bench_reply_cache.py
+    python benchmarks/bench_reply_cache.py --directions 1000 --slots 50
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(ROOT / "services" / "orchestrator"))
+
+from app.catalog import CatalogSnapshot, FragmentCache  # noqa: E402
+from app.dialogs import engine  # noqa: E402
+from app.fsm import StateChange  # noqa: E402
+from app.session import SessionState  # noqa: E402
+
+DAYS = ("Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье")
+
+
+class UncachedFragments(FragmentCache):
+    """Рендер на каждом ходе — поведение до кэша"""
+
+    def get(self, catalog, name, key, render):
+        return render(catalog, key)
+
+
+def large_catalog(directions: int, slots: int) -> dict:
+    return {
+        "directions": [
+            {"id": f"dir_{i}", "name": f"Направление {i}", "trial_price": 300 + i,
+             "age_min": 3 + i % 10, "age_max": 13 + i % 10}
+            for i in range(directions)
+        ],
+        "schedule": [
+            {"direction_id": f"dir_{i}", "day": DAYS[j % 7], "time": f"{9 + j % 12}:00"}
+            for i in range(directions) for j in range(slots)
+        ],
+        "rental": {},
+    }
+
+
+def turns(directions: int):
+    booking = SessionState("Запись на занятие", "booking_need_direction", {})
+    return {
+        "schedule": ("Запись на занятие", "", "button", "Посмотреть расписание", None),
+        "booking_button": ("Запись на занятие", "", "button", "Записаться на пробное занятие", None),
+        "booking_entry": ("Запись на занятие", "привет", "text", None, None),
+        "booking_direction": ("Запись на занятие", f"направление {directions - 1}", "text", None, booking),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--directions", type=int, default=300)
+    parser.add_argument("--slots", type=int, default=20)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    data = large_catalog(args.directions, args.slots)
+    cached = CatalogSnapshot.build(data, version=1)
+    uncached = CatalogSnapshot.build(data, version=2)
+    object.__setattr__(uncached, "fragments", UncachedFragments())
+    uncached.fragments.warmed = True
+
+    warm = timeit.timeit(lambda: engine.warm(CatalogSnapshot.build(data)), number=5) / 5 * 1e3
+    build = timeit.timeit(lambda: CatalogSnapshot.build(data), number=5) / 5 * 1e3
+    print(f"каталог: {args.directions} направлений, {args.directions * args.slots} слотов; "
+          f"рендер фрагментов {warm - build:.2f} ms на версию")
+
+    print(f"{'turn':<20}{'render us':>11}{'cached us':>11}{'speedup':>9}")
+    for name, (scenario, text, action_type, action_name, session) in turns(args.directions).items():
+        def run(catalog):
+            return engine.run(scenario, text, action_type, action_name, session, catalog, StateChange())
+
+        assert run(cached)[0] == run(uncached)[0]
+        old = timeit.timeit(lambda: run(uncached), number=args.number) / args.number * 1e6
+        new = timeit.timeit(lambda: run(cached), number=args.number) / args.number * 1e6
+        print(f"{name:<20}{old:>11.2f}{new:>11.2f}{old / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
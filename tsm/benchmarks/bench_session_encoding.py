@@ -0,0 +1,89 @@
+"""
+Бенчмарк формата состояния диалога: JSON (v1) против компактного формата (v2).
+
+Для типичных сессий каждого состояния считает размер записи в байтах
+и время кодирования/декодирования. С --redis-url дополнительно пишет
+записи в Redis и сравнивает MEMORY USAGE ключей.
+
+Запуск:
+    python benchmarks/bench_session_encoding.py
+    python benchmarks/bench_session_encoding.py --redis-url redis://localhost:6379/0
+"""
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(ROOT / "services" / "orchestrator"))
+
+from app.session import decode_session, encode_session, encode_session_json  # noqa: E402
+
+SESSIONS = [
+    ("Детские группы", "kids_need_age", {}),
+    ("Аренда зала", "rent_need_time", {}),
+    ("Аренда зала", "rent_need_people", {"rent_time_bucket": "evening"}),
+    ("Аренда зала", "rent_need_format", {"rent_time_bucket": "evening", "people_count": 12}),
+    ("Запись на занятие", "booking_need_direction", {}),
+]
+
+
+def measure(number: int):
+    rows = []
+    for scenario, state, data in SESSIONS:
+        legacy = encode_session_json(scenario, state, data)
+        compact = encode_session(scenario, state, data)
+        rows.append({
+            "state": state,
+            "json_bytes": len(legacy.encode("utf-8")),
+            "compact_bytes": len(compact.encode("utf-8")),
+            "json_encode_us": timeit.timeit(lambda: encode_session_json(scenario, state, data), number=number) / number * 1e6,
+            "compact_encode_us": timeit.timeit(lambda: encode_session(scenario, state, data), number=number) / number * 1e6,
+            "json_decode_us": timeit.timeit(lambda: json.loads(legacy), number=number) / number * 1e6,
+            "compact_decode_us": timeit.timeit(lambda: decode_session(compact), number=number) / number * 1e6,
+        })
+    return rows
+
+
+def redis_memory(redis_url: str):
+    import redis
+    client = redis.from_url(redis_url, decode_responses=True)
+    result = []
+    for i, (scenario, state, data) in enumerate(SESSIONS):
+        key = f"state:studio_nexa:simulator:bench_user_{i}"
+        client.set(key, encode_session_json(scenario, state, data))
+        json_mem = client.memory_usage(key)
+        client.set(key, encode_session(scenario, state, data))
+        compact_mem = client.memory_usage(key)
+        client.delete(key)
+        result.append((state, json_mem, compact_mem))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--redis-url", default=None)
+    args = parser.parse_args()
+
+    rows = measure(args.number)
+    print(f"{'state':<24}{'bytes json':>11}{'compact':>9}"
+          f"{'enc json us':>13}{'compact':>9}{'dec json us':>13}{'compact':>9}")
+    for r in rows:
+        print(f"{r['state']:<24}{r['json_bytes']:>11}{r['compact_bytes']:>9}"
+              f"{r['json_encode_us']:>13.2f}{r['compact_encode_us']:>9.2f}"
+              f"{r['json_decode_us']:>13.2f}{r['compact_decode_us']:>9.2f}")
+    json_total = sum(r["json_bytes"] for r in rows)
+    compact_total = sum(r["compact_bytes"] for r in rows)
+    print(f"\nсредний размер: json {json_total / len(rows):.1f} B, "
+          f"compact {compact_total / len(rows):.1f} B ({compact_total / json_total:.0%})")
+
+    if args.redis_url:
+        print(f"\n{'state':<24}{'MEMORY USAGE json':>18}{'compact':>9}")
+        for state, json_mem, compact_mem in redis_memory(args.redis_url):
+            print(f"{state:<24}{json_mem:>18}{compact_mem:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+WebSocket-сессия (/chat/ws) против HTTP (/chat): задержка сообщения и
+сообщений в секунду на одних и тех же диалогах.
+
+HTTP — общий клиент с keep-alive, на каждое сообщение полный запрос с
+заголовками и проверкой всех полей ChatRequest. WebSocket — соединение на
+пользователя, личность сессии задается при подключении, кадр несет только
+текст и действие. Каждый виртуальный пользователь проходит свой диалог
+--rounds раз, сообщения одного пользователя — последовательно.
+
+Без --url запускается uvicorn с FSM на fakeredis (как bench_cold_start.py).
+
+Запуск:
+    python benchmarks/bench_ws.py --users 50 --rounds 20
+    python benchmarks/bench_ws.py --url http://localhost:8001 --mode lean
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+import httpx
+import websockets
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(Path(__file__).parent))
+
+from bench_cold_start import FAKE_REDIS_LAUNCHER, ORCHESTRATOR, free_port, wait_for  # noqa: E402
+from flows import FLOWS, chat_payload  # noqa: E402
+from load_chat import percentiles  # noqa: E402
+
+
+def user_flows(users: int, flows: list, transport: str) -> list:
+    """(диалог, user_id) виртуальных пользователей; у транспортов разные пользователи"""
+    return [(flows[i % len(flows)], f"bench_{transport}_{os.getpid()}_{i}") for i in range(users)]
+
+
+async def http_user(client: httpx.AsyncClient, flow: str, user_id: str, rounds: int, mode: str,
+                    latencies: list):
+    for _ in range(rounds):
+        for turn in FLOWS[flow][1]:
+            payload = chat_payload(flow, turn, user_id, response_mode=mode)
+            started = time.perf_counter()
+            response = await client.post("/chat", json=payload)
+            response.json()
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+
+async def ws_user(ws_url: str, flow: str, user_id: str, rounds: int, mode: str,
+                  latencies: list, connects: list):
+    scenario, turns = FLOWS[flow]
+    query = urlencode({"tenant_id": "studio_nexa", "channel": "simulator", "user_id": user_id,
+                       "scenario": scenario, "response_mode": mode})
+    frames = [json.dumps({"text": text, "action_type": action_type, "action_name": action_name},
+                         ensure_ascii=False) for text, action_type, action_name in turns]
+    started = time.perf_counter()
+    async with websockets.connect(f"{ws_url}/chat/ws?{query}") as ws:
+        connects.append(time.perf_counter() - started)
+        for _ in range(rounds):
+            for frame in frames:
+                started = time.perf_counter()
+                await ws.send(frame)
+                reply = json.loads(await ws.recv())
+                latencies.append(time.perf_counter() - started)
+                if "status" in reply:
+                    raise RuntimeError(f"ошибка кадра: {reply}")
+
+
+async def run(url: str, transport: str, users: int, rounds: int, mode: str, flows: list) -> dict:
+    latencies, connects = [], []
+    started = time.perf_counter()
+    if transport == "http":
+        limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+            await asyncio.gather(*(http_user(client, flow, user_id, rounds, mode, latencies)
+                                   for flow, user_id in user_flows(users, flows, transport)))
+    else:
+        ws_url = "ws" + url[len("http"):]
+        await asyncio.gather(*(ws_user(ws_url, flow, user_id, rounds, mode, latencies, connects)
+                               for flow, user_id in user_flows(users, flows, transport)))
+    elapsed = time.perf_counter() - started
+    return {"messages": len(latencies), "per_sec": len(latencies) / elapsed,
+            "percentiles": percentiles(latencies),
+            "connect_ms": sum(connects) / len(connects) * 1000 if connects else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", help="адрес запущенного оркестратора; без него — uvicorn на fakeredis")
+    parser.add_argument("--users", type=int, default=50, help="одновременных пользователей")
+    parser.add_argument("--rounds", type=int, default=20, help="проходов диалога на пользователя")
+    parser.add_argument("--mode", choices=("full", "lean"), default="full", help="response_mode ответов")
+    parser.add_argument("--flows", default="rent,kids,booking", help=f"через запятую из: {', '.join(FLOWS)}")
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        port = free_port()
+        env = {**os.environ, "DIKIDI_STUB_PATH": str(ROOT / "data" / "dikidi_stub.json")}
+        process = subprocess.Popen([sys.executable, "-c", FAKE_REDIS_LAUNCHER, str(port)],
+                                   cwd=ORCHESTRATOR, env=env)
+        url = f"http://127.0.0.1:{port}"
+        with httpx.Client(base_url=url) as client:
+            if wait_for(client, "/ready", time.perf_counter(), 30.0) is None:
+                process.terminate()
+                raise SystemExit("оркестратор не стал готов за 30 с")
+    try:
+        flows = args.flows.split(",")
+        print(f"{args.users} пользователей x {args.rounds} проходов, ответы {args.mode}")
+        print(f"{'транспорт':<11}{'сообщений':>10}{'сообщ/с':>10}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}")
+        # Каждый транспорт дважды вперемешку: первый проход прогревает сервер
+        for transport in ("http", "ws", "http", "ws"):
+            result = asyncio.run(run(url, transport, args.users, args.rounds, args.mode, flows))
+            p50, p95, p99 = result["percentiles"]
+            connect = f"  (подключение {result['connect_ms']:.1f} мс)" if result["connect_ms"] else ""
+            print(f"{transport:<11}{result['messages']:>10}{result['per_sec']:>10.0f}"
+                  f"{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}{connect}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Диалоги из tests/conversations для бенчмарков: те же сценарии и реплики,
+что проходят тесты, без проверок ответов.
+
+Ход — (text, action_type, action_name); запрос /chat собирает chat_payload.
+"""
+from typing import Dict, List, Optional, Tuple
+
+Turn = Tuple[str, str, Optional[str]]
+
+BOOKING_BUTTON: Turn = ("Записаться на пробное занятие", "button", "Записаться на пробное занятие")
+
+# имя -> (сценарий, ходы)
+FLOWS: Dict[str, Tuple[str, List[Turn]]] = {
+    # test_rent_fsm.py::test_rent_fsm_full_flow
+    "rent": ("Аренда зала", [
+        ("", "button", "Рассчитать стоимость аренды"),
+        ("после 16", "text", None),
+        ("12", "text", None),
+        ("занятие", "text", None),
+    ]),
+    # test_kids_fsm.py
+    "kids": ("Детские группы", [
+        ("", "button", "Уточнить возраст ребёнка"),
+        ("8", "text", None),
+        ("спасибо", "text", None),
+    ]),
+    # test_behavior_v012.py::test_adult_booking_latina_choose_day
+    "booking": ("Запись на занятие", [
+        BOOKING_BUTTON,
+        ("Латина", "text", None),
+        ("среда", "text", None),
+    ]),
+    # test_behavior_v012.py: расписание в контексте записи
+    "schedule": ("Запись на занятие", [
+        BOOKING_BUTTON,
+        ("Азбука", "text", None),
+        ("посмотреть расписание", "text", None),
+        ("среда", "text", None),
+    ]),
+    # test_behavior_v012.py: детский поток с направлением
+    "kids_direction": ("Детские группы", [
+        ("Детские группы", "text", None),
+        ("Азбука", "text", None),
+        ("6", "text", None),
+        ("суббота", "text", None),
+    ]),
+    # test_behavior_v012.py: вопрос о тренере
+    "trainer": ("Вопрос о тренере", [
+        ("Йога", "text", None),
+    ]),
+}
+
+
+def chat_payload(flow: str, turn: Turn, user_id: str, **extra) -> dict:
+    scenario = FLOWS[flow][0]
+    text, action_type, action_name = turn
+    return {"tenant_id": "studio_nexa", "channel": "simulator", "user_id": user_id,
+            "text": text, "scenario": scenario, "action_type": action_type,
+            "action_name": action_name, **extra}
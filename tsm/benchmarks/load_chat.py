@@ -0,0 +1,219 @@
+"""
+Нагрузочный прогон /chat: тысячи одновременных виртуальных пользователей
+проходят диалоги из tests/conversations (benchmarks/flows.py).
+
+Цели:
+- приложение в процессе (ASGI) на fakeredis или локальном Redis (--redis-url);
+- запущенный сервер uvicorn (--url http://host:port).
+
+Отчет: пропускная способность, p50/p95/p99 по сценариям и по переходам
+состояний (state_before -> state_after), ошибки по статусам и нарушения
+порядка состояний:
+- разрыв цепочки — state_before хода не равен state_after предыдущего хода
+  того же пользователя (ход применился не к тому состоянию);
+- расхождение — последовательность переходов пользователя отличается от
+  преобладающей для того же диалога.
+Код выхода 1, если найдены нарушения или ошибки.
+
+Запуск:
+    python benchmarks/load_chat.py --users 2000 --concurrency 200
+    python benchmarks/load_chat.py --url http://localhost:8001 --users 5000 --flows rent,kids,booking
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(ROOT / "services" / "orchestrator"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from flows import FLOWS, chat_payload  # noqa: E402
+
+# (state_before, state_after, intent) одного хода
+Signature = Tuple[str, str, str]
+
+
+@dataclass
+class Conversation:
+    """Один проход диалога виртуальным пользователем"""
+
+    flow: str
+    user_id: str
+    signatures: List[Signature] = field(default_factory=list)
+    broken_chain: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class LoadReport:
+    latencies_by_flow: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    latencies_by_transition: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    statuses: Counter = field(default_factory=Counter)
+    conversations: List[Conversation] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def turns(self) -> int:
+        return sum(len(values) for values in self.latencies_by_flow.values())
+
+    def divergent(self) -> List[Tuple[Conversation, List[Signature]]]:
+        """Диалоги, чьи переходы отличаются от преобладающих для своего сценария"""
+        expected = {}
+        for flow in {c.flow for c in self.conversations}:
+            counts = Counter(tuple(c.signatures) for c in self.conversations
+                             if c.flow == flow and c.error is None)
+            if counts:
+                expected[flow] = list(counts.most_common(1)[0][0])
+        return [(c, expected[c.flow]) for c in self.conversations
+                if c.error is None and c.flow in expected and c.signatures != expected[c.flow]]
+
+
+async def run_conversation(client: httpx.AsyncClient, flow: str, user_id: str,
+                           report: LoadReport, think_time: float) -> Conversation:
+    conversation = Conversation(flow, user_id)
+    previous_after = "idle"
+    for turn in FLOWS[flow][1]:
+        payload = chat_payload(flow, turn, user_id, response_mode="full")
+        started = time.perf_counter()
+        try:
+            response = await client.post("/chat", json=payload)
+        except httpx.HTTPError as e:
+            report.statuses[type(e).__name__] += 1
+            conversation.error = type(e).__name__
+            return conversation
+        latency = time.perf_counter() - started
+        report.statuses[response.status_code] += 1
+        if response.status_code != 200:
+            conversation.error = f"HTTP {response.status_code}"
+            return conversation
+
+        body = response.json()
+        debug = body["debug"]
+        before, after = debug["state_before"], debug["state_after"]
+        if before != previous_after and conversation.broken_chain is None:
+            conversation.broken_chain = (f"ход {len(conversation.signatures) + 1}: ожидалось состояние "
+                                         f"{previous_after}, сервер видел {before}")
+        previous_after = after
+        conversation.signatures.append((before, after, body["intent"]))
+        report.latencies_by_flow[flow].append(latency)
+        report.latencies_by_transition[f"{before} -> {after}"].append(latency)
+        if think_time:
+            await asyncio.sleep(random.uniform(0, 2 * think_time))
+    return conversation
+
+
+async def run_load(client: httpx.AsyncClient, flows: List[str], users: int, iterations: int,
+                   concurrency: int, think_time: float, run_id: str) -> LoadReport:
+    """users виртуальных пользователей, не более concurrency диалогов одновременно"""
+    report = LoadReport()
+    limit = asyncio.Semaphore(concurrency)
+    flow_cycle = itertools.cycle(flows)
+    assignments = [next(flow_cycle) for _ in range(users)]
+
+    async def virtual_user(index: int, flow: str):
+        for iteration in range(iterations):
+            # Новый user_id на каждый проход: диалог начинается с чистого состояния
+            user_id = f"load_{run_id}_{index}_{iteration}"
+            async with limit:
+                report.conversations.append(
+                    await run_conversation(client, flow, user_id, report, think_time))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(i, flow) for i, flow in enumerate(assignments)))
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def percentiles(values: List[float]) -> Tuple[float, float, float]:
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+
+    return at(0.50), at(0.95), at(0.99)
+
+
+def print_report(report: LoadReport) -> bool:
+    """Печатает отчет; возвращает True, если нарушений и ошибок нет"""
+    print(f"ходов: {report.turns}, диалогов: {len(report.conversations)}, "
+          f"за {report.elapsed:.2f} с — {report.turns / report.elapsed:.0f} ходов/с")
+    print("статусы: " + ", ".join(f"{status}: {count}" for status, count in report.statuses.most_common()))
+
+    for title, groups in (("сценарий", report.latencies_by_flow), ("переход", report.latencies_by_transition)):
+        width = max([len(title)] + [len(name) for name in groups]) + 2
+        print(f"\n{title:<{width}}{'ходов':>8}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}")
+        for name, values in sorted(groups.items()):
+            p50, p95, p99 = percentiles(values)
+            print(f"{name:<{width}}{len(values):>8}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}")
+
+    broken = [c for c in report.conversations if c.broken_chain]
+    divergent = report.divergent()
+    errors = [c for c in report.conversations if c.error]
+    print(f"\nразрывов цепочки состояний: {len(broken)}, расхождений с преобладающими переходами: "
+          f"{len(divergent)}, диалогов с ошибкой: {len(errors)}")
+    for conversation in broken[:5]:
+        print(f"  {conversation.user_id} ({conversation.flow}): {conversation.broken_chain}")
+    for conversation, expected in divergent[:5]:
+        print(f"  {conversation.user_id} ({conversation.flow}): {conversation.signatures} вместо {expected}")
+    return not (broken or divergent or errors)
+
+
+async def in_process_client(redis_url: Optional[str], connections: int) -> httpx.AsyncClient:
+    from app import main as orchestrator
+    from app.catalog import CatalogStore
+    from app.fsm import AsyncFSM
+
+    orchestrator.set_catalog_store(CatalogStore(ROOT / "data" / "dikidi_stub.json", poll_interval=0))
+    if redis_url:
+        fsm = AsyncFSM(redis_url, max_connections=connections)
+    else:
+        import fakeredis
+        fsm = AsyncFSM("redis://localhost:6379/0")
+        fsm.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    orchestrator.set_async_fsm(fsm)
+    transport = httpx.ASGITransport(app=orchestrator.app)
+    return httpx.AsyncClient(transport=transport, base_url="http://load")
+
+
+async def main_async(args) -> bool:
+    flows = args.flows.split(",")
+    unknown = set(flows) - set(FLOWS)
+    if unknown:
+        raise SystemExit(f"неизвестные диалоги: {', '.join(sorted(unknown))}; есть: {', '.join(FLOWS)}")
+    if args.url:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout)
+    else:
+        client = await in_process_client(args.redis_url, args.concurrency)
+    async with client:
+        report = await run_load(client, flows, args.users, args.iterations, args.concurrency,
+                                args.think_ms / 1000, args.run_id or f"{int(time.time())}")
+    return print_report(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", help="адрес запущенного оркестратора; без него — приложение в процессе")
+    parser.add_argument("--redis-url", help="Redis для приложения в процессе; без него — fakeredis")
+    parser.add_argument("--flows", default="rent,kids,booking", help=f"через запятую из: {', '.join(FLOWS)}")
+    parser.add_argument("--users", type=int, default=1000, help="виртуальных пользователей")
+    parser.add_argument("--iterations", type=int, default=1, help="проходов диалога на пользователя")
+    parser.add_argument("--concurrency", type=int, default=100, help="диалогов одновременно")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="средняя пауза между ходами")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--run-id", help="префикс user_id (по умолчанию — время запуска)")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main_async(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Набор микробенчмарков горячего пути FSM с базовой линией в репозитории.
+
+Каждый случай — функция, которая выполняется на каждом сообщении
+(extract_*, check_rent_limits, calculate_rental_price, process_state_machine
+по состояниям, FSM.get_state/set_state, load_dikidi_stub), на обычных и
+неудобных входах: большой каталог, длинные сообщения, раздутые данные сессии.
+
+Результат — лучшее из --repeat измерений, мкс на вызов. Перед каждым
+случаем меряется калибровочный цикл на чистом Python; базовая линия
+(benchmarks/baselines/micro.json) хранит оба числа, и при сравнении база
+масштабируется на отношение калибровок. Так сравнение переносит и другую
+машину, и колебания нагрузки соседей по хосту во время прогона.
+
+Запуск:
+    python benchmarks/micro.py                      # прогон и таблица
+    python benchmarks/micro.py -k extract           # только случаи с подстрокой
+    python benchmarks/micro.py --save               # записать базовую линию
+    python benchmarks/micro.py --compare --threshold 0.3
+"""
+import argparse
+import json
+import platform
+import sys
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(ROOT / "services" / "orchestrator"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import fakeredis  # noqa: E402
+
+from app import main as orchestrator  # noqa: E402
+from app.catalog import CatalogSnapshot, CatalogStore, parse_catalog  # noqa: E402
+from app.fsm import (  # noqa: E402
+    FSM, check_rent_limits, extract_age, extract_direction, extract_people_count,
+    extract_rent_format, extract_rent_time_bucket
+)
+from app.pricing import calculate_rental_price  # noqa: E402
+from bench_extractor import messages  # noqa: E402
+from bench_reply_cache import large_catalog  # noqa: E402
+
+BASELINE = Path(__file__).parent / "baselines" / "micro.json"
+STUB_PATH = ROOT / "data" / "dikidi_stub.json"
+TENANT, CHANNEL = "studio_nexa", "simulator"
+
+# setup(number) -> функция без аргументов; вызывается number раз за замер
+Setup = Callable[[int], Callable[[], object]]
+
+
+class Case(NamedTuple):
+    name: str
+    setup: Setup
+    number: int
+
+
+def _const(fn: Callable[[], object]) -> Setup:
+    return lambda number: fn
+
+
+def calibrate(repeat: int = 5) -> float:
+    """Калибровочный цикл на чистом Python, мкс на проход"""
+    def loop():
+        total = 0
+        for i in range(1000):
+            total += i * i % 7
+        return total
+    return min(timeit.repeat(loop, number=100, repeat=repeat)) / 100 * 1e6
+
+
+def _fsm() -> FSM:
+    fsm = FSM("redis://localhost:6379/0")
+    fsm.redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+    return fsm
+
+
+# Ходы process_state_machine: состояние до хода -> (сценарий, данные, text, action_type, action_name)
+STATE_TURNS = {
+    "idle": ("Аренда зала", None, "", "button", "Рассчитать стоимость аренды"),
+    "rent_need_time": ("Аренда зала", {}, "после 16", "text", None),
+    "rent_need_people": ("Аренда зала", {"rent_time_bucket": "evening"}, "12", "text", None),
+    "rent_need_format": ("Аренда зала", {"rent_time_bucket": "evening", "people_count": 12}, "занятие", "text", None),
+    "kids_need_age": ("Детские группы", {}, "8", "text", None),
+    "booking_need_direction": ("Запись на занятие", {}, "Латина", "text", None),
+}
+
+
+def _state_turn(state: str) -> Setup:
+    """Каждый вызов — новый пользователь в состоянии state (заполняется до замера)"""
+    scenario, data, text, action_type, action_name = STATE_TURNS[state]
+
+    def setup(number: int):
+        fsm = _fsm()
+        orchestrator.set_fsm(fsm)
+        users = [f"micro_{state}_{i}" for i in range(number + 1)]
+        if data is not None:
+            for user in users:
+                fsm.set_state(TENANT, CHANNEL, user, scenario, state, data)
+        catalog = orchestrator.get_catalog()
+        users = iter(users)
+        return lambda: orchestrator.process_state_machine(
+            scenario, text, action_type, action_name, TENANT, CHANNEL, next(users), catalog)
+    return setup
+
+
+def _get_state(data: dict) -> Setup:
+    def setup(number: int):
+        fsm = _fsm()
+        fsm.set_state(TENANT, CHANNEL, "micro_get", "Детские группы", "kids_need_age", data)
+        return lambda: fsm.get_state(TENANT, CHANNEL, "micro_get")
+    return setup
+
+
+def _set_state(data: dict) -> Setup:
+    def setup(number: int):
+        fsm = _fsm()
+        return lambda: fsm.set_state(TENANT, CHANNEL, "micro_set", "Детские группы", "kids_need_age", data)
+    return setup
+
+
+def cases() -> List[Case]:
+    stub = json.loads(STUB_PATH.read_text(encoding="utf-8"))
+    directions = stub["directions"]
+    big_directions = large_catalog(300, 1)["directions"]
+    texts = messages()
+    rental = stub["rental"]
+    stub_bytes = STUB_PATH.read_bytes()
+    big = large_catalog(1000, 20)
+    big_session = {"direction": "Латина", "age": 6,
+                   "history": [f"сообщение {i}: хочу записаться на латину" for i in range(50)]}
+
+    result = []
+    for label in ("typical", "no_match", "long_noisy", "very_long"):
+        text = texts[label]
+        number = 2000 if len(text) < 1000 else 50
+        result += [
+            Case(f"extract_age/{label}", _const(lambda t=text: extract_age(t)), number),
+            Case(f"extract_people_count/{label}", _const(lambda t=text: extract_people_count(t)), number),
+            Case(f"extract_rent_time_bucket/{label}", _const(lambda t=text: extract_rent_time_bucket(t)), number),
+            Case(f"extract_rent_format/{label}", _const(lambda t=text: extract_rent_format(t)), number),
+            Case(f"extract_direction/{label}", _const(lambda t=text: extract_direction(t, directions)), number),
+        ]
+    result += [
+        Case("extract_direction/large_catalog", _const(
+            lambda: extract_direction("хочу на направление 299 в среду", big_directions)), 200),
+        Case("check_rent_limits/ok", _const(lambda: check_rent_limits("training", 12)), 20000),
+        Case("check_rent_limits/over_limit", _const(lambda: check_rent_limits("photo_session", 40)), 20000),
+        Case("calculate_rental_price/evening", _const(
+            lambda: calculate_rental_price("evening", 12, "training", rental)), 2000),
+        Case("calculate_rental_price/bulk_hours", _const(
+            lambda: calculate_rental_price("morning", 8, "rehearsal", rental, hours=10)), 2000),
+    ]
+    result += [Case(f"process_state_machine/{state}", _state_turn(state), 500) for state in STATE_TURNS]
+    result += [
+        Case("fsm.get_state/typical", _get_state({"direction": "Латина", "age": 6}), 5000),
+        Case("fsm.set_state/typical", _set_state({"direction": "Латина", "age": 6}), 5000),
+        Case("fsm.get_state/large_data", _get_state(big_session), 2000),
+        Case("fsm.set_state/large_data", _set_state(big_session), 2000),
+        Case("load_dikidi_stub/snapshot", _const(orchestrator.load_dikidi_stub), 20000),
+        Case("parse_catalog/stub", _const(lambda: parse_catalog(stub_bytes)), 2000),
+        Case("catalog_build/1000_directions", _const(lambda: CatalogSnapshot.build(big)), 3),
+    ]
+    return result
+
+
+def measure(case: Case, repeat: int) -> float:
+    """Лучшее из repeat замеров, мкс на вызов"""
+    best = float("inf")
+    for _ in range(repeat):
+        fn = case.setup(case.number)
+        fn()  # прогрев; setup дает number + 1 вызов
+        best = min(best, timeit.timeit(fn, number=case.number) / case.number * 1e6)
+    return best
+
+
+def run(pattern: Optional[str], repeat: int, names: Optional[set] = None) -> Dict[str, dict]:
+    """{случай: {"us": мкс на вызов, "calibration_us": калибровка перед случаем}}"""
+    orchestrator.set_catalog_store(CatalogStore(STUB_PATH, poll_interval=0))
+    results = {}
+    for case in cases():
+        if pattern and pattern not in case.name or names is not None and case.name not in names:
+            continue
+        calibration = calibrate()
+        results[case.name] = {"us": measure(case, repeat), "calibration_us": calibration}
+    orchestrator.set_fsm(None)
+    return results
+
+
+def _relative(result: dict) -> float:
+    return result["us"] / result["calibration_us"]
+
+
+def compare(results: Dict[str, dict], baseline: dict, threshold: float,
+            min_delta_us: float = 1.0) -> List[str]:
+    """
+    Печатает сравнение; возвращает имена случаев, медленнее базы больше чем
+    на threshold и при этом больше чем на min_delta_us (шум субмикросекундных случаев)
+    """
+    width = max(len(name) for name in results) + 2
+    print(f"{'случай':<{width}}{'база мкс':>11}{'сейчас мкс':>12}{'изменение':>11}")
+    regressions = []
+    for name, result in results.items():
+        value = result["us"]
+        base = baseline["cases"].get(name)
+        if base is None:
+            print(f"{name:<{width}}{'—':>11}{value:>12.2f}{'новый':>11}")
+            continue
+        expected = base["us"] * result["calibration_us"] / base["calibration_us"]
+        change = value / expected - 1
+        mark = ""
+        if change > threshold and value - expected > min_delta_us:
+            regressions.append(name)
+            mark = "  РЕГРЕССИЯ"
+        print(f"{name:<{width}}{expected:>11.2f}{value:>12.2f}{change:>+10.0%}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-k", dest="pattern", help="только случаи, в имени которых есть подстрока")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="записать результаты как базовую линию")
+    parser.add_argument("--compare", action="store_true", help="сравнить с базовой линией")
+    parser.add_argument("--threshold", type=float, default=0.3, help="допустимое замедление (0.3 = 30%%)")
+    parser.add_argument("--min-delta-us", type=float, default=1.0,
+                        help="замедление меньше этого числа мкс не считается регрессией")
+    parser.add_argument("--confirm", type=int, default=2,
+                        help="повторных прогонов случаев с регрессией перед итогом")
+    args = parser.parse_args()
+
+    results = run(args.pattern, args.repeat)
+
+    if args.compare:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.threshold, args.min_delta_us)
+        for _ in range(args.confirm):
+            if not regressions:
+                break
+            # Регрессия подтверждается повторным прогоном: разовый всплеск шума не в счет
+            print(f"\nповторный прогон: {', '.join(regressions)}")
+            for name, result in run(None, args.repeat, set(regressions)).items():
+                results[name] = min(results[name], result, key=_relative)
+            regressions = compare({name: results[name] for name in regressions}, baseline,
+                                  args.threshold, args.min_delta_us)
+        if regressions:
+            print(f"\nрегрессий больше {args.threshold:.0%}: {len(regressions)}")
+            sys.exit(1)
+        return
+
+    width = max(len(name) for name in results) + 2
+    for name, result in results.items():
+        print(f"{name:<{width}}{result['us']:>12.2f} мкс")
+    if args.save:
+        if args.pattern and args.baseline.exists():
+            # Частичный прогон обновляет только свои случаи
+            saved = json.loads(args.baseline.read_text(encoding="utf-8"))
+            results = {**saved["cases"], **results}
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({
+            "python": platform.python_version(),
+            "cases": {name: {key: round(value, 3) for key, value in result.items()}
+                      for name, result in results.items()},
+        }, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"базовая линия записана: {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,64 @@
+import asyncio
 import os
+import re
+from contextlib import asynccontextmanager, suppress
 from typing import Optional
+from urllib.parse import urlencode
 
 import httpx
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+import websockets
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 
-app = FastAPI(title="Танцуй со мной - Chat Simulator", version="v0.1.1")
+from app.upstream import UpstreamClient
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Пул соединений к оркестратору живет вместе с приложением"""
+    upstream = get_upstream()
+    yield
+    await upstream.aclose()
+
+
+app = FastAPI(title="Танцуй со мной - Chat Simulator", version="v0.1.1", lifespan=lifespan)
 
 templates = Jinja2Templates(directory="app/templates")
 
 ORCHESTRATOR_URL = os.getenv("ORCHESTRATOR_URL", "http://localhost:8001")
 PRODUCT_VERSION = os.getenv("PRODUCT_VERSION", "v0.1.1")
+ORCHESTRATOR_WS_URL = os.getenv("ORCHESTRATOR_WS_URL") or re.sub(r"^http", "ws", ORCHESTRATOR_URL)
+
+# Пользователь симулятора: тот же, что у /api/send
+SESSION = {"tenant_id": "studio_nexa", "channel": "simulator", "user_id": "test_user"}
+
+_upstream: Optional[UpstreamClient] = None
+
+
+def get_upstream() -> UpstreamClient:
+    """Клиент оркестратора (singleton): ограниченный пул с keep-alive, настройки ORCHESTRATOR_*"""
+    global _upstream
+    if _upstream is None:
+        _upstream = UpstreamClient(ORCHESTRATOR_URL)
+    return _upstream
+
+
+def set_upstream(client: Optional[UpstreamClient]):
+    """Устанавливает клиент оркестратора (для тестов и бенчмарков)"""
+    global _upstream
+    _upstream = client
+
+
+def connection_error(e: Exception) -> dict:
+    return {
+        "error": f"Ошибка соединения с orchestrator: {str(e)}",
+        "reply": "Не удалось связаться с сервером. Проверьте, запущен ли orchestrator.",
+        "intent": "error",
+        "version": PRODUCT_VERSION,
+        "debug": {}
+    }
 
 
 class ChatMessage(BaseModel):
@@ -33,32 +79,22 @@ async def index(request: Request):
 
 @app.post("/api/send")
 async def send_message(message: ChatMessage):
-    """Отправляет сообщение в orchestrator"""
+    """
+    Отправляет сообщение в orchestrator через общий пул соединений.
+    Ход меняет состояние диалога, поэтому повторяется только неотправленный запрос.
+    """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{ORCHESTRATOR_URL}/chat",
-                json={
-                    "tenant_id": "studio_nexa",
-                    "channel": "simulator",
-                    "user_id": "test_user",
-                    "text": message.text,
-                    "scenario": message.scenario,
-                    "action_type": message.action_type,
-                    "action_name": message.action_name
-                },
-                timeout=10.0
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await get_upstream().post_json("/chat", {
+            **SESSION,
+            "text": message.text,
+            "scenario": message.scenario,
+            "action_type": message.action_type,
+            "action_name": message.action_name
+        })
+        response.raise_for_status()
+        return response.json()
     except httpx.RequestError as e:
-        return {
-            "error": f"Ошибка соединения с orchestrator: {str(e)}",
-            "reply": "Не удалось связаться с сервером. Проверьте, запущен ли orchestrator.",
-            "intent": "error",
-            "version": PRODUCT_VERSION,
-            "debug": {}
-        }
+        return connection_error(e)
     except Exception as e:
         return {
             "error": str(e),
@@ -67,3 +103,74 @@ async def send_message(message: ChatMessage):
             "version": PRODUCT_VERSION,
             "debug": {}
         }
+
+
+@app.websocket("/api/ws")
+async def chat_ws(websocket: WebSocket):
+    """
+    Проксирует WebSocket-сессию в orchestrator /chat/ws: сессия привязывается
+    один раз при подключении, кадры и ответы передаются без разбора.
+    Если оркестратор недоступен, соединение закрывается с кодом 1011 —
+    страница отправляет сообщения через /api/send.
+    """
+    await websocket.accept()
+    connected = False
+    try:
+        async with websockets.connect(f"{ORCHESTRATOR_WS_URL}/chat/ws?{urlencode(SESSION)}") as upstream:
+            connected = True
+            await proxy_session(websocket, upstream)
+    except (OSError, websockets.WebSocketException) as e:
+        # Без error-кадра: страница переходит на /api/send, а не повторяет ошибку в чате
+        reason = "" if connected else f"orchestrator недоступен: {e}"[:120]
+        with suppress(RuntimeError):
+            await websocket.close(code=1011, reason=reason)
+        return
+    with suppress(RuntimeError):
+        await websocket.close()
+
+
+async def proxy_session(websocket: WebSocket, upstream):
+    """Передает кадры в обе стороны, пока одна из сторон не закроет соединение"""
+
+    async def to_orchestrator():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            frame = message.get("text")
+            if frame is None and message.get("bytes") is not None:
+                frame = message["bytes"].decode("utf-8", "replace")
+            if not frame:
+                await websocket.send_json({"id": None, "status": 422, "error": "Пустой кадр"})
+                continue
+            await upstream.send(frame)
+
+    async def to_browser():
+        async for frame in upstream:
+            await websocket.send_text(frame if isinstance(frame, str) else frame.decode())
+
+    tasks = [asyncio.create_task(to_orchestrator()), asyncio.create_task(to_browser())]
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    for task in done:
+        # Закрытие любой из сторон — штатный конец сессии
+        task.exception()
+
+
+@app.get("/ready")
+async def ready():
+    """Готовность: оркестратор отвечает на /ready (идемпотентный запрос: повторы и хеджирование)"""
+    try:
+        response = await get_upstream().get("/ready")
+    except httpx.RequestError as e:
+        return JSONResponse({"status": "not_ready", "error": str(e) or type(e).__name__}, status_code=503)
+    status = "ready" if response.status_code == 200 else "not_ready"
+    return JSONResponse({"status": status, "orchestrator": response.status_code},
+                        status_code=200 if status == "ready" else 503)
+
+
+@app.get("/api/upstream/stats")
+async def upstream_stats():
+    """Счетчики клиента оркестратора: запросы, соединения, повторы, хеджирование, пул"""
+    return get_upstream().pool_stats()
@@ -0,0 +1,195 @@
+"""
+Клиент оркестратора: один пул соединений на процесс вместо клиента на
+сообщение.
+
+- пул ограничен, соединения переиспользуются (keep-alive), HTTP/2 по
+  ORCHESTRATOR_HTTP2=1, если установлен пакет h2;
+- у каждого запроса общий дедлайн вместе с повторами;
+- повторы с экспоненциальной задержкой и полным jitter. Идемпотентные
+  запросы повторяются при любой транспортной ошибке и 502/503/504,
+  неидемпотентные (/chat меняет состояние диалога) — только если запрос
+  не ушел на сервер (соединение не установлено);
+- хеджирование: если идемпотентный запрос не ответил за
+  ORCHESTRATOR_HEDGE_AFTER секунд, параллельно уходит второй по другому
+  соединению (другой реплике за балансировщиком), побеждает первый ответ.
+  /chat не хеджируется: ход применился бы дважды.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({502, 503, 504})
+# Запрос не дошел до сервера: повтор безопасен и для неидемпотентных
+NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+@dataclass(frozen=True)
+class UpstreamSettings:
+    """Параметры пула и устойчивости запросов к оркестратору"""
+
+    max_connections: int = 20
+    max_keepalive: int = 10
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    connect_timeout: float = 1.0
+    deadline: float = 10.0  # общий дедлайн запроса вместе с повторами
+    retry_attempts: int = 2  # повторы после первой попытки
+    retry_base_delay: float = 0.05
+    hedge_after: float = 0.0  # 0 — без хеджирования
+
+    @classmethod
+    def from_env(cls) -> "UpstreamSettings":
+        return cls(
+            max_connections=int(os.getenv("ORCHESTRATOR_MAX_CONNECTIONS", "20")),
+            max_keepalive=int(os.getenv("ORCHESTRATOR_MAX_KEEPALIVE", "10")),
+            keepalive_expiry=float(os.getenv("ORCHESTRATOR_KEEPALIVE_EXPIRY", "30")),
+            http2=os.getenv("ORCHESTRATOR_HTTP2", "0") == "1",
+            connect_timeout=float(os.getenv("ORCHESTRATOR_CONNECT_TIMEOUT", "1.0")),
+            deadline=float(os.getenv("ORCHESTRATOR_DEADLINE", "10.0")),
+            retry_attempts=int(os.getenv("ORCHESTRATOR_RETRY_ATTEMPTS", "2")),
+            retry_base_delay=float(os.getenv("ORCHESTRATOR_RETRY_BASE_DELAY", "0.05")),
+            hedge_after=float(os.getenv("ORCHESTRATOR_HEDGE_AFTER", "0")),
+        )
+
+
+@dataclass
+class UpstreamStats:
+    requests: int = 0
+    in_flight: int = 0
+    connects: int = 0  # установленных TCP-соединений; при keep-alive много меньше requests
+    retries: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    failures: int = 0
+
+
+def retry_delay(attempt: int, base: float) -> float:
+    """Экспоненциальная задержка с полным jitter"""
+    return random.uniform(0, base * (2 ** attempt))
+
+
+class UpstreamClient:
+    """Общий клиент оркестратора на время жизни приложения"""
+
+    def __init__(self, base_url: str, settings: Optional[UpstreamSettings] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.settings = settings or UpstreamSettings.from_env()
+        self.stats = UpstreamStats()
+        limits = httpx.Limits(max_connections=self.settings.max_connections,
+                              max_keepalive_connections=self.settings.max_keepalive,
+                              keepalive_expiry=self.settings.keepalive_expiry)
+        if transport is None:
+            transport = self._transport(limits)
+        self._transport_ref = transport
+        # Таймауты отдельных операций не длиннее дедлайна; сам дедлайн — в request()
+        timeout = httpx.Timeout(self.settings.deadline, connect=self.settings.connect_timeout)
+        self.client = httpx.AsyncClient(base_url=base_url, transport=transport, timeout=timeout)
+
+    def _transport(self, limits: httpx.Limits) -> httpx.AsyncBaseTransport:
+        if self.settings.http2:
+            try:
+                return httpx.AsyncHTTPTransport(limits=limits, http2=True)
+            except ImportError:
+                logger.warning("ORCHESTRATOR_HTTP2=1, но пакет h2 не установлен; используется HTTP/1.1")
+        return httpx.AsyncHTTPTransport(limits=limits)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _trace(self, event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            self.stats.connects += 1
+
+    async def request(self, method: str, path: str, idempotent: bool = True,
+                      deadline: Optional[float] = None, **kwargs) -> httpx.Response:
+        """
+        Запрос с дедлайном, повторами и (для идемпотентных) хеджированием.
+        По истечении дедлайна — httpx.TimeoutException.
+        """
+        settings = self.settings
+        expires = time.monotonic() + (deadline if deadline is not None else settings.deadline)
+        kwargs["extensions"] = {"trace": self._trace}
+
+        async def send() -> httpx.Response:
+            return await self.client.request(method, path, **kwargs)
+
+        self.stats.requests += 1
+        self.stats.in_flight += 1
+        try:
+            for attempt in range(settings.retry_attempts + 1):
+                remaining = expires - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError
+                    if idempotent and settings.hedge_after > 0:
+                        response = await asyncio.wait_for(self._hedged(send), remaining)
+                    else:
+                        response = await asyncio.wait_for(send(), remaining)
+                except asyncio.TimeoutError:
+                    self.stats.failures += 1
+                    raise httpx.TimeoutException(f"дедлайн запроса {method} {path} истек")
+                except httpx.TransportError as e:
+                    if not (idempotent or isinstance(e, NOT_SENT)) or not self._retry(attempt, expires):
+                        self.stats.failures += 1
+                        raise
+                else:
+                    if not (idempotent and response.status_code in RETRY_STATUSES and self._retry(attempt, expires)):
+                        return response
+                    await response.aclose()
+                self.stats.retries += 1
+                await asyncio.sleep(retry_delay(attempt, settings.retry_base_delay))
+        finally:
+            self.stats.in_flight -= 1
+
+    def _retry(self, attempt: int, expires: float) -> bool:
+        """Есть ли еще попытка, и успеет ли она до дедлайна с худшей задержкой"""
+        worst_delay = self.settings.retry_base_delay * (2 ** attempt)
+        return attempt < self.settings.retry_attempts and time.monotonic() + worst_delay < expires
+
+    async def _hedged(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        pending = {asyncio.ensure_future(send())}
+        second = error = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.settings.hedge_after)
+            if not done:
+                self.stats.hedges += 1
+                second = asyncio.ensure_future(send())
+                pending.add(second)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.stats.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def post_json(self, path: str, payload: dict, idempotent: bool = False, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, idempotent=idempotent, json=payload, **kwargs)
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, idempotent=True, **kwargs)
+
+    def pool_stats(self) -> dict:
+        """Счетчики запросов и соединения пула (открытые и простаивающие)"""
+        result = asdict(self.stats)
+        pool = getattr(self._transport_ref, "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is not None:
+            result["pool_connections"] = len(connections)
+            result["pool_idle"] = sum(1 for connection in connections if connection.is_idle())
+        result["max_connections"] = self.settings.max_connections
+        result["http2"] = self.settings.http2
+        return result
@@ -0,0 +1,116 @@
+"""
+Пакетная обработка ходов для POST /chat/batch.
+
+Ходы группируются по пользователю: состояния всех пользователей читаются
+одним MGET, ходы одного пользователя применяются по порядку к локальной
+копии состояния, а итоговые переходы записываются одним pipeline.
+Если состояние пользователя изменилось конкурентно, его ходы
+пересчитываются от нового значения.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.catalog import CatalogSnapshot
+from app.fsm import StateChange, encode_state, state_key
+from app.session import decode_session
+
+# (reply, intent, debug_info)
+TurnResult = Tuple[str, str, dict]
+Decide = Callable[..., TurnResult]
+
+
+class BatchItemResult:
+    """Результат одного элемента пакета: ответ или ошибка"""
+
+    __slots__ = ("status", "result", "error")
+
+    def __init__(self, status: int, result: Optional[TurnResult] = None, error: Optional[str] = None):
+        self.status = status
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+
+class UserTurns:
+    """Ходы одного пользователя в пакете, в порядке поступления"""
+
+    __slots__ = ("tenant_id", "channel", "user_id", "items")
+
+    def __init__(self, tenant_id: str, channel: str, user_id: str):
+        self.tenant_id = tenant_id
+        self.channel = channel
+        self.user_id = user_id
+        self.items: list = []  # (индекс в пакете, ChatRequest)
+
+    @property
+    def ids(self) -> Tuple[str, str, str]:
+        return self.tenant_id, self.channel, self.user_id
+
+    def run(self, raw: Optional[str], catalog: CatalogSnapshot, decide: Decide,
+            results: List[Optional[BatchItemResult]]) -> StateChange:
+        """
+        Последовательно выполняет ходы от состояния raw.
+        Возвращает последнее изменение состояния (пустое, если ходы его не меняли).
+        """
+        last = StateChange()
+        for index, request in self.items:
+            change = StateChange()
+            try:
+                result = decide(request.scenario, request.text, request.action_type,
+                                request.action_name, decode_session(raw), catalog, change)
+            except Exception as e:
+                # Ошибка одного хода не отменяет остальные: состояние не меняется
+                results[index] = BatchItemResult(500, error=str(e) or type(e).__name__)
+                continue
+            results[index] = BatchItemResult(200, result)
+            if change.op is not None:
+                last = change
+                raw = encode_state(change.scenario, change.state, change.data) if change.op == "set" else None
+        return last
+
+    def fail(self, results: List[Optional[BatchItemResult]], status: int, error: str):
+        for index, _ in self.items:
+            results[index] = BatchItemResult(status, error=error)
+
+
+class ChatBatch:
+    """Пакет ходов, сгруппированный по пользователям"""
+
+    def __init__(self, size: int):
+        self.results: List[Optional[BatchItemResult]] = [None] * size
+        self._users: Dict[str, UserTurns] = {}
+        # Каталоги тенантов пакета; тенанты без записи используют общий каталог
+        self.catalogs: Dict[str, CatalogSnapshot] = {}
+
+    def add(self, index: int, request):
+        key = state_key(request.tenant_id, request.channel, request.user_id)
+        turns = self._users.get(key)
+        if turns is None:
+            turns = self._users[key] = UserTurns(request.tenant_id, request.channel, request.user_id)
+        turns.items.append((index, request))
+
+    def reject(self, index: int, status: int, error: str):
+        self.results[index] = BatchItemResult(status, error=error)
+
+    @property
+    def users(self) -> List[UserTurns]:
+        return list(self._users.values())
+
+    @property
+    def tenants(self) -> List[str]:
+        return list(dict.fromkeys(turns.tenant_id for turns in self._users.values()))
+
+    def run(self, pending: List[UserTurns], raws: List[Optional[str]],
+            catalog: CatalogSnapshot, decide: Decide) -> List[tuple]:
+        """Выполняет ходы пользователей; возвращает аргументы для transition_many"""
+        catalogs = self.catalogs
+        return [(*turns.ids, raw, turns.run(raw, catalogs.get(turns.tenant_id, catalog), decide, self.results))
+                for turns, raw in zip(pending, raws)]
+
+    @staticmethod
+    def conflicts(pending: List[UserTurns], errors: list) -> Tuple[List[UserTurns], List[Optional[str]]]:
+        """Пользователи с конфликтом записи и их текущие состояния для повтора"""
+        retry = [(turns, e.current) for turns, e in zip(pending, errors) if e is not None]
+        return [turns for turns, _ in retry], [current for _, current in retry]
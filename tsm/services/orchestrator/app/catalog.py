@@ -0,0 +1,312 @@
+"""
+Каталог DIKIDI: неизменяемый снимок данных с горячей перезагрузкой
+"""
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Union
+
+from app.extractor import DIRECTION_KEYWORDS, FORMAT_KEYWORDS, EntityExtractor
+from app.metrics import observe_catalog_load
+from app.pricing import PricingError, RentalPricing
+
+logger = logging.getLogger(__name__)
+
+
+# Верхняя граница возраста направления: directions_by_age хранит каждый год диапазона
+MAX_AGE = 120
+
+
+class CatalogError(ValueError):
+    """Ошибка разбора или валидации каталога"""
+
+
+def validate_catalog(data: Any) -> Dict[str, Any]:
+    """
+    Проверяет структуру каталога и дополняет отсутствующие разделы.
+    Возвращает тот же словарь, при ошибке выбрасывает CatalogError.
+    """
+    if not isinstance(data, dict):
+        raise CatalogError("каталог должен быть JSON-объектом")
+
+    directions = data.setdefault("directions", [])
+    schedule = data.setdefault("schedule", [])
+    rental = data.setdefault("rental", {})
+
+    if not isinstance(directions, list):
+        raise CatalogError("directions должен быть списком")
+    if not isinstance(schedule, list):
+        raise CatalogError("schedule должен быть списком")
+    if not isinstance(rental, dict):
+        raise CatalogError("rental должен быть объектом")
+
+    seen_ids = set()
+    for i, direction in enumerate(directions):
+        if not isinstance(direction, dict) or not direction.get("id") or not direction.get("name"):
+            raise CatalogError(f"directions[{i}]: обязательны поля id и name")
+        if direction["id"] in seen_ids:
+            raise CatalogError(f"directions[{i}]: повторяющийся id '{direction['id']}'")
+        seen_ids.add(direction["id"])
+        for key in ("age_min", "age_max"):
+            if direction.get(key) is not None and not isinstance(direction[key], int):
+                raise CatalogError(f"directions[{i}]: {key} должен быть целым числом")
+            if direction.get(key) is not None and not 0 <= direction[key] <= MAX_AGE:
+                raise CatalogError(f"directions[{i}]: {key} должен быть от 0 до {MAX_AGE}")
+        if (direction.get("age_min") is not None and direction.get("age_max") is not None
+                and direction["age_min"] > direction["age_max"]):
+            raise CatalogError(f"directions[{i}]: age_min больше age_max")
+
+    keywords = data.get("keywords", {})
+    if not isinstance(keywords, dict):
+        raise CatalogError("keywords должен быть объектом")
+    for section in ("directions", "formats"):
+        table = keywords.get(section, {})
+        if not isinstance(table, dict) or not all(
+                isinstance(words, list) and all(isinstance(w, str) for w in words)
+                for words in table.values()):
+            raise CatalogError(f"keywords.{section}: ожидается объект со списками строк")
+
+    for i, item in enumerate(schedule):
+        if not isinstance(item, dict):
+            raise CatalogError(f"schedule[{i}]: ожидается объект")
+        for key in ("direction_id", "day", "time"):
+            if not item.get(key):
+                raise CatalogError(f"schedule[{i}]: обязательно поле {key}")
+
+    return data
+
+
+def parse_catalog(raw: Union[str, bytes]) -> Dict[str, Any]:
+    """Разбирает и валидирует JSON каталога"""
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        raise CatalogError(f"некорректный JSON: {e}") from e
+    return validate_catalog(data)
+
+
+@dataclass(frozen=True)
+class SlotView:
+    """Строка расписания, соединенная с направлением"""
+
+    direction_id: str
+    direction_name: str
+    day: str
+    time: str
+    line: str
+
+
+class FragmentCache:
+    """
+    Готовые фрагменты ответов одного снимка каталога.
+
+    Фрагмент зависит только от каталога, поэтому живет столько же, сколько
+    снимок: новая версия каталога получает новый, пустой кэш.
+    """
+
+    def __init__(self):
+        self._values: Dict[Tuple[str, Hashable], str] = {}
+        self.warmed = False
+
+    def get(self, catalog: "CatalogSnapshot", name: str, key: Hashable,
+            render: Callable[["CatalogSnapshot", Hashable], str]) -> str:
+        value = self._values.get((name, key))
+        if value is None:
+            # Гонка двух потоков безопасна: оба получат одинаковую строку
+            value = self._values[(name, key)] = render(catalog, key)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок каталога.
+
+    Снимок никогда не модифицируется после создания: при изменении файла
+    создается новый снимок со следующим номером версии. Индексы строятся
+    один раз при создании снимка, поэтому поиск на каждом ходе диалога
+    не сканирует списки направлений и расписания.
+    """
+
+    version: int
+    data: Dict[str, Any]
+    mtime_ns: int = 0
+    loaded_at: float = field(default_factory=time.time)
+
+    directions_by_id: Dict[str, dict] = field(init=False, repr=False)
+    direction_names: Tuple[str, ...] = field(init=False, repr=False)
+    slots_by_direction: Dict[str, Tuple[SlotView, ...]] = field(init=False, repr=False)
+    schedule_view: Tuple[SlotView, ...] = field(init=False, repr=False)
+    directions_by_age: Dict[int, Tuple[dict, ...]] = field(init=False, repr=False)
+    extractor: EntityExtractor = field(init=False, repr=False)
+    pricing: RentalPricing = field(init=False, repr=False)
+    fragments: FragmentCache = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        try:
+            pricing = RentalPricing.compile(self.data.get("rental"))
+        except PricingError as e:
+            raise CatalogError(f"rental: {e}") from e
+
+        directions = self.data.get("directions", [])
+        by_id = {d["id"]: d for d in directions}
+
+        schedule_view = []
+        slots: Dict[str, list] = {}
+        for item in self.data.get("schedule", []):
+            dir_id = item["direction_id"]
+            direction = by_id.get(dir_id)
+            name = direction["name"] if direction else dir_id
+            view = SlotView(
+                direction_id=dir_id,
+                direction_name=name,
+                day=item["day"],
+                time=item["time"],
+                line=f"• {item['day']}, {item['time']} — {name}",
+            )
+            schedule_view.append(view)
+            slots.setdefault(dir_id, []).append(view)
+
+        by_age: Dict[int, list] = {}
+        for d in directions:
+            if d.get("age_min") is None or d.get("age_max") is None:
+                continue
+            for age in range(d["age_min"], d["age_max"] + 1):
+                by_age.setdefault(age, []).append(d)
+
+        object.__setattr__(self, "directions_by_id", by_id)
+        object.__setattr__(self, "direction_names", tuple(d["name"] for d in directions))
+        object.__setattr__(self, "slots_by_direction", {k: tuple(v) for k, v in slots.items()})
+        object.__setattr__(self, "schedule_view", tuple(schedule_view))
+        object.__setattr__(self, "directions_by_age", {k: tuple(v) for k, v in by_age.items()})
+        # Ключевые слова студии из каталога, иначе общие таблицы
+        keywords = self.data.get("keywords", {})
+        object.__setattr__(self, "extractor", EntityExtractor(
+            directions,
+            direction_keywords=keywords.get("directions", DIRECTION_KEYWORDS),
+            format_keywords=keywords.get("formats", FORMAT_KEYWORDS),
+        ))
+        object.__setattr__(self, "pricing", pricing)
+        object.__setattr__(self, "fragments", FragmentCache())
+
+    @classmethod
+    def build(cls, data: Dict[str, Any], version: int = 0, mtime_ns: int = 0) -> "CatalogSnapshot":
+        return cls(version=version, data=validate_catalog(data), mtime_ns=mtime_ns)
+
+    @property
+    def directions(self) -> list:
+        return self.data["directions"]
+
+    @property
+    def schedule(self) -> list:
+        return self.data["schedule"]
+
+    @property
+    def rental(self) -> dict:
+        return self.data["rental"]
+
+    def direction(self, direction_id: str) -> Optional[dict]:
+        return self.directions_by_id.get(direction_id)
+
+    def slots_for(self, direction_id: str) -> Tuple[SlotView, ...]:
+        return self.slots_by_direction.get(direction_id, ())
+
+    def groups_for_age(self, age: int) -> Tuple[dict, ...]:
+        return self.directions_by_age.get(age, ())
+
+    def rendered(self, name: str, render: Callable[["CatalogSnapshot", Hashable], str],
+                 key: Hashable = None) -> str:
+        """Фрагмент ответа name для key: рендерится один раз на версию каталога"""
+        return self.fragments.get(self, name, key, render)
+
+
+def empty_catalog_data() -> Dict[str, Any]:
+    return {"directions": [], "schedule": [], "rental": {}}
+
+
+class CatalogStore:
+    """
+    Хранилище текущего снимка каталога.
+
+    Файл читается один раз при создании и затем только фоновым наблюдателем
+    при изменении mtime. Запросы читают `snapshot` — это одно чтение атрибута,
+    поэтому замена снимка атомарна и не требует блокировок на чтении.
+    """
+
+    def __init__(self, path: Union[str, Path], poll_interval: float = 2.0):
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._version = 0
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._snapshot = self._next_snapshot(empty_catalog_data(), mtime_ns=0)
+        self.refresh()
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        return self._snapshot
+
+    def _next_snapshot(self, data: Dict[str, Any], mtime_ns: int) -> CatalogSnapshot:
+        snapshot = CatalogSnapshot.build(data, version=self._version + 1, mtime_ns=mtime_ns)
+        self._version += 1
+        return snapshot
+
+    def refresh(self) -> bool:
+        """
+        Перечитывает файл, если изменился его mtime.
+        Возвращает True, если был установлен новый снимок.
+        При ошибке разбора остается предыдущий снимок.
+        """
+        with self._lock:
+            try:
+                stat = self.path.stat()
+            except FileNotFoundError:
+                return False
+            if stat.st_mtime_ns == self._snapshot.mtime_ns:
+                return False
+            started = time.perf_counter()
+            try:
+                data = parse_catalog(self.path.read_bytes())
+                snapshot = self._next_snapshot(data, mtime_ns=stat.st_mtime_ns)
+            except (OSError, CatalogError) as e:
+                logger.warning("Каталог %s не загружен, используется версия %s: %s",
+                               self.path, self._snapshot.version, e)
+                return False
+            observe_catalog_load(time.perf_counter() - started)
+            self._snapshot = snapshot
+            logger.info("Каталог %s загружен, версия %s", self.path, self._snapshot.version)
+            return True
+
+    def start(self):
+        """Запускает фоновое наблюдение за файлом"""
+        if self._watcher is not None or self.poll_interval <= 0:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        """Останавливает фоновое наблюдение"""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.poll_interval + 1)
+            self._watcher = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception:  # наблюдатель не должен падать
+                logger.exception("Ошибка наблюдения за каталогом %s", self.path)
+
+
+def catalog_poll_interval() -> float:
+    return float(os.getenv("CATALOG_POLL_INTERVAL", "2.0"))
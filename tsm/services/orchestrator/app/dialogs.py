@@ -0,0 +1,250 @@
+"""
+Сценарии студии: таблица состояний, кнопок и стартов диалога
+"""
+from app.engine import IDLE, Engine, TurnContext
+
+engine = Engine()
+
+KIDS_QUESTION = "Для записи в детскую группу нам нужно знать возраст ребенка. Сколько лет вашему ребенку?"
+RENT_QUESTION = "Для расчета стоимости аренды зала мне нужно знать время. Аренда планируется до 16:00 или после?"
+
+# Fallback маппинг по возрасту, если подходящей группы нет в stub
+FALLBACK_KIDS_GROUPS = (
+    (7, 11, {
+        "id": "dance_mix_7_11",
+        "name": "Dance Mix 7-11",
+        "age_min": 7,
+        "age_max": 11,
+        "price_per_month": 2800,
+        "trial_price": 350,
+        "group_limit": 12
+    }),
+    (3, 5, {
+        "id": "azbuka_3_5",
+        "name": "Азбука танца 3-5",
+        "age_min": 3,
+        "age_max": 5,
+        "price_per_month": 2500,
+        "trial_price": 300,
+        "group_limit": 10
+    }),
+    (12, 17, {
+        "id": "choreo_12_17",
+        "name": "Choreo 12-17",
+        "age_min": 12,
+        "age_max": 17,
+        "price_per_month": 3000,
+        "trial_price": 400,
+        "group_limit": 14
+    }),
+)
+
+
+# --- Фрагменты, зависящие только от каталога ------------------------
+
+@engine.fragment("booking_question")
+def booking_question(catalog, key=None) -> str:
+    directions_text = "\n".join([f"• {name}" for name in catalog.direction_names])
+    return f"Отлично! Мы предлагаем пробное занятие для новых учеников. Какое направление вас интересует?\n\n{directions_text}"
+
+
+@engine.fragment("schedule")
+def schedule_reply(catalog, key=None) -> str:
+    schedule_items = [slot.line for slot in catalog.schedule_view[:6]]
+    schedule_text = "\n".join(schedule_items) if schedule_items else "Расписание временно недоступно"
+    return f"Расписание занятий:\n\n{schedule_text}\n\nХотите записаться на пробное занятие?"
+
+
+@engine.fragment("booking_slots", keys=lambda catalog: catalog.directions_by_id)
+def booking_slots_reply(catalog, direction_id: str) -> str:
+    direction = catalog.direction(direction_id)
+    slots = catalog.slots_for(direction_id)
+    if not slots:
+        return f"Выбрано направление «{direction['name']}», но слоты временно недоступны. Обратитесь к администратору."
+    slots_text = "\n".join([slot.line for slot in slots[:3]])
+    return (
+        f"Отлично! Вы выбрали «{direction['name']}».\n\n"
+        f"Доступные слоты:\n{slots_text}\n\n"
+        f"Стоимость пробного занятия: {direction.get('trial_price', 0)} руб."
+    )
+
+
+# --- Кнопки (инициируют сценарии) ------------------------------------
+
+@engine.button("Уточнить возраст ребёнка", next_states=["kids_need_age"])
+def kids_button(ctx: TurnContext):
+    ctx.set_state("Детские группы", "kids_need_age", {})
+    return ctx.reply(KIDS_QUESTION, "ask_age", "kids: начать с возраста")
+
+
+@engine.button("Рассчитать стоимость аренды", next_states=["rent_need_time"])
+def rent_button(ctx: TurnContext):
+    ctx.set_state("Аренда зала", "rent_need_time", {})
+    return ctx.reply(RENT_QUESTION, "calculate_rental", "rent: начать с времени")
+
+
+@engine.button("Записаться на пробное занятие", next_states=["booking_need_direction"])
+def booking_button(ctx: TurnContext):
+    ctx.set_state("Запись на занятие", "booking_need_direction", {})
+    return ctx.reply(ctx.fragment("booking_question"), "book_trial", "booking: начать с направления")
+
+
+@engine.button("Передать администратору", next_states=[IDLE])
+def escalation_button(ctx: TurnContext):
+    ctx.clear_state()
+    return ctx.reply(
+        "Ваш запрос передан администратору. В ближайшее время с вами свяжутся для уточнения деталей.",
+        "escalation", "escalation"
+    )
+
+
+@engine.button("Посмотреть расписание", next_states=[])
+def schedule_button(ctx: TurnContext):
+    return ctx.reply(ctx.fragment("schedule"), "view_schedule", "schedule: показ расписания")
+
+
+# --- Детские группы ----------------------------------------------------
+
+@engine.state(
+    "kids_need_age",
+    extractor=lambda ctx: ctx.entities.age,
+    next_states=[IDLE],
+    retry=("Пожалуйста, укажите возраст ребенка числом (например, 8 лет).",
+           "ask_age", "kids: неверный формат возраста"),
+)
+def kids_age(ctx: TurnContext, age: int):
+    ctx.data["age"] = age
+    suitable_groups = ctx.catalog.groups_for_age(age)
+    if not suitable_groups:
+        suitable_groups = [group for age_min, age_max, group in FALLBACK_KIDS_GROUPS
+                           if age_min <= age <= age_max]
+
+    ctx.clear_state()
+    if not suitable_groups:
+        return ctx.reply(
+            f"Для возраста {age} лет у нас пока нет подходящей группы. Обратитесь к администратору для уточнения.",
+            "children_groups_info", "kids: нет подходящей группы"
+        )
+
+    group = suitable_groups[0]
+    # Формируем короткий продуктовый ответ
+    reply = f"Для возраста {age} лет подходит группа «{group['name']}».\n\n"
+    reply += f"Лимит: {group.get('group_limit', 12)} человек.\n"
+    reply += "Форма на занятии: удобная спортивная одежда. Можно записаться разово или по абонементу.\n\n"
+    reply += "Записать на пробное или подобрать расписание?"
+    return ctx.reply(reply, "children_groups_info", "kids: возраст -> группа", data_collected=ctx.data)
+
+
+# --- Аренда зала -------------------------------------------------------
+
+@engine.state(
+    "rent_need_time",
+    extractor=lambda ctx: ctx.entities.time_bucket,
+    next_states=["rent_need_people"],
+    retry=("Пожалуйста, укажите время: до 16:00 или после 16:00?",
+           "calculate_rental", "rent: неверный формат времени"),
+)
+def rent_time(ctx: TurnContext, time_bucket: str):
+    ctx.data["rent_time_bucket"] = time_bucket
+    ctx.set_state("Аренда зала", "rent_need_people", ctx.data)
+    return ctx.reply("Сколько человек планируется?", "calculate_rental",
+                     "rent: время -> количество людей", data_collected=ctx.data)
+
+
+@engine.state(
+    "rent_need_people",
+    extractor=lambda ctx: ctx.entities.people_count,
+    next_states=["rent_need_format"],
+    retry=("Пожалуйста, укажите количество человек числом (например, 12).",
+           "calculate_rental", "rent: неверный формат количества"),
+)
+def rent_people(ctx: TurnContext, people_count: int):
+    ctx.data["people_count"] = people_count
+    ctx.set_state("Аренда зала", "rent_need_format", ctx.data)
+    return ctx.reply("Какой формат мероприятия? (тренировка, репетиция, фотосессия)",
+                     "calculate_rental", "rent: количество -> формат", data_collected=ctx.data)
+
+
+@engine.state(
+    "rent_need_format",
+    extractor=lambda ctx: ctx.entities.format,
+    next_states=[IDLE],
+    retry=("Пожалуйста, укажите формат: тренировка, репетиция или фотосессия.",
+           "calculate_rental", "rent: неверный формат"),
+)
+def rent_format(ctx: TurnContext, format_type: str):
+    ctx.data["format"] = format_type
+    people_count = ctx.data.get("people_count", 0)
+    ctx.clear_state()
+
+    # Проверка лимитов
+    pricing = ctx.catalog.pricing
+    is_valid, error_msg = pricing.check_limits(format_type, people_count)
+    if not is_valid:
+        return ctx.reply(
+            f"{error_msg}\n\nПожалуйста, измените формат или количество участников, либо обратитесь к администратору.",
+            "calculate_rental", "rent: превышение лимита", data_collected=ctx.data
+        )
+
+    # Расчет цены по таблице каталога
+    time_bucket = ctx.data.get("rent_time_bucket", "evening")
+    quote = pricing.quote(time_bucket, people_count, format_type)
+    return ctx.reply(pricing.message(quote), "calculate_rental", quote.rule, data_collected=ctx.data)
+
+
+# --- Запись на занятие -------------------------------------------------
+
+@engine.state(
+    "booking_need_direction",
+    extractor=lambda ctx: ctx.entities.direction_id,
+    next_states=[IDLE],
+    retry=("Пожалуйста, выберите направление из предложенного списка.",
+           "book_trial", "booking: неверный формат"),
+)
+def booking_direction(ctx: TurnContext, direction_id: str):
+    ctx.data["direction"] = direction_id
+    direction = ctx.catalog.direction(direction_id)
+    if not direction:
+        return ctx.reply("Не удалось найти это направление. Пожалуйста, выберите из списка.",
+                         "book_trial", "booking: неверное направление")
+
+    ctx.clear_state()
+    # Показываем слоты для этого направления
+    reply = ctx.fragment("booking_slots", direction_id)
+    if not ctx.catalog.slots_for(direction_id):
+        return ctx.reply(reply, "book_trial", "booking: нет слотов")
+    return ctx.reply(reply, "book_trial", "booking: направление -> слоты", data_collected=ctx.data)
+
+
+# --- Начало диалога из idle --------------------------------------------
+
+@engine.entry("Детские группы", next_states=["kids_need_age"])
+def kids_entry(ctx: TurnContext):
+    ctx.set_state(ctx.scenario, "kids_need_age", {})
+    return ctx.reply(KIDS_QUESTION, "ask_age", "kids: начало диалога")
+
+
+@engine.entry("Аренда зала", next_states=["rent_need_time"])
+def rent_entry(ctx: TurnContext):
+    ctx.set_state(ctx.scenario, "rent_need_time", {})
+    return ctx.reply(RENT_QUESTION, "calculate_rental", "rent: начало диалога")
+
+
+@engine.entry("Запись на занятие", next_states=["booking_need_direction"])
+def booking_entry(ctx: TurnContext):
+    ctx.set_state(ctx.scenario, "booking_need_direction", {})
+    return ctx.reply(ctx.fragment("booking_question"), "book_trial", "booking: начало диалога")
+
+
+@engine.fallback
+def general(ctx: TurnContext):
+    return ctx.reply("Спасибо за ваш вопрос! Как мы можем вам помочь?", "general_inquiry", "general")
+
+
+@engine.unknown_state
+def unknown_state(ctx: TurnContext):
+    return ctx.reply("Произошла ошибка. Начнем заново. Как мы можем вам помочь?",
+                     "error", "error: неизвестное состояние")
+
+
+engine.compile()
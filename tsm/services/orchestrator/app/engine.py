@@ -0,0 +1,321 @@
+"""
+Табличный движок диалогов.
+
+Каждое состояние регистрирует извлекатель, обработчик и допустимые
+следующие состояния; кнопки и стартовые действия сценариев регистрируются
+отдельно. При старте таблица компилируется в словари диспетчеризации
+и проверяется на недостижимые и тупиковые состояния.
+
+Фрагменты ответов, зависящие только от каталога, регистрируются через
+fragment() и рендерятся один раз на версию каталога.
+"""
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, Optional, Tuple
+
+from app.catalog import CatalogSnapshot
+from app.extractor import Entities
+from app.fsm import StateChange
+from app.profiling import Timings
+from app.session import SessionState
+
+IDLE = "idle"
+
+# (reply, intent, debug_info)
+Reply = Tuple[str, str, dict]
+
+
+class EngineError(Exception):
+    """Ошибка в таблице переходов"""
+
+
+class TurnContext:
+    """Данные одного хода, доступные обработчикам"""
+
+    __slots__ = ("scenario", "text", "action_name", "catalog", "state_before",
+                 "data", "change", "debug", "renderers", "_entities")
+
+    def __init__(self, scenario: str, text: str, action_name: Optional[str],
+                 catalog: CatalogSnapshot, state_before: str, data: dict,
+                 change: StateChange, debug: Optional[dict], renderers: Dict[str, "FragmentSpec"] = None):
+        self.scenario = scenario
+        self.text = text
+        self.action_name = action_name
+        self.catalog = catalog
+        self.state_before = state_before
+        self.data = data
+        self.change = change
+        self.debug = debug
+        self.renderers = renderers or {}
+        self._entities = None
+
+    @property
+    def entities(self) -> Entities:
+        """Сущности сообщения; извлекаются один раз за ход"""
+        if self._entities is None:
+            self._entities = self.catalog.extractor.extract(self.text)
+        return self._entities
+
+    def fragment(self, name: str, key: Hashable = None) -> str:
+        """Готовый фрагмент ответа для текущей версии каталога"""
+        return self.catalog.rendered(name, self.renderers[name].render, key)
+
+    def set_state(self, scenario: str, state: str, data: dict = None):
+        self.change.set_state(scenario, state, data)
+
+    def clear_state(self):
+        self.change.clear_state()
+
+    def reply(self, text: str, intent: str, rule: str, **extra) -> Reply:
+        """
+        Формирует ответ; state_after берется из изменения состояния.
+        В легком режиме (debug is None) — только state_before и rule_used для метрик.
+        """
+        if self.debug is None:
+            return text, intent, {"state_before": self.state_before, "rule_used": rule}
+        if self.change.op == "set":
+            state_after = self.change.state
+        elif self.change.op == "clear":
+            state_after = IDLE
+        else:
+            state_after = self.state_before
+        return text, intent, {**self.debug, "state_after": state_after, "rule_used": rule, **extra}
+
+
+@dataclass(frozen=True)
+class StateSpec:
+    """Состояние, ожидающее текстовый ответ пользователя"""
+
+    name: str
+    extractor: Callable[[TurnContext], Any]
+    handler: Callable[[TurnContext, Any], Reply]
+    next_states: FrozenSet[str]
+    retry: Tuple[str, str, str]  # (reply, intent, rule), если извлечь ничего не удалось
+
+
+@dataclass(frozen=True)
+class ActionSpec:
+    """Кнопка или стартовое действие сценария"""
+
+    name: str
+    handler: Callable[[TurnContext], Reply]
+    next_states: FrozenSet[str]
+
+
+@dataclass(frozen=True)
+class FragmentSpec:
+    """Фрагмент ответа, зависящий только от каталога"""
+
+    name: str
+    render: Callable[[CatalogSnapshot, Hashable], str]
+    keys: Optional[Callable[[CatalogSnapshot], Iterable[Hashable]]]  # None — один фрагмент без ключа
+
+
+class Engine:
+    """Реестр переходов и диспетчер ходов"""
+
+    def __init__(self):
+        self._states: Dict[str, StateSpec] = {}
+        self._buttons: Dict[str, ActionSpec] = {}
+        self._entries: Dict[str, ActionSpec] = {}
+        self._fragments: Dict[str, FragmentSpec] = {}
+        self._fallback: Optional[Callable[[TurnContext], Reply]] = None
+        self._unknown_state: Optional[Callable[[TurnContext], Reply]] = None
+        self.compiled = False
+
+    # --- регистрация -------------------------------------------------
+
+    def state(self, name: str, *, extractor: Callable[[TurnContext], Any],
+              next_states: Iterable[str], retry: Tuple[str, str, str]):
+        """Регистрирует обработчик текстового ответа в состоянии name"""
+        def register(handler):
+            self._register(self._states, name, StateSpec(
+                name, extractor, handler, frozenset(next_states), retry))
+            return handler
+        return register
+
+    def button(self, action_name: str, *, next_states: Iterable[str]):
+        """Регистрирует обработчик кнопки (доступна из любого состояния)"""
+        def register(handler):
+            self._register(self._buttons, action_name, ActionSpec(
+                action_name, handler, frozenset(next_states)))
+            return handler
+        return register
+
+    def entry(self, scenario: str, *, next_states: Iterable[str]):
+        """Регистрирует начало сценария для пользователя в состоянии idle"""
+        def register(handler):
+            self._register(self._entries, scenario, ActionSpec(
+                scenario, handler, frozenset(next_states)))
+            return handler
+        return register
+
+    def fragment(self, name: str, *, keys: Callable[[CatalogSnapshot], Iterable[Hashable]] = None):
+        """
+        Регистрирует рендер фрагмента render(catalog, key) -> str.
+        keys(catalog) перечисляет ключи, которые рендерятся заранее.
+        """
+        def register(render):
+            self._register(self._fragments, name, FragmentSpec(name, render, keys))
+            return render
+        return register
+
+    def fallback(self, handler):
+        """Ответ в idle, если сценарий не зарегистрирован"""
+        self._fallback = handler
+        return handler
+
+    def unknown_state(self, handler):
+        """Ответ для хода, который не обработан ни одним правилом"""
+        self._unknown_state = handler
+        return handler
+
+    def _register(self, table: dict, name: str, spec):
+        if self.compiled:
+            raise EngineError(f"таблица уже скомпилирована, нельзя добавить '{name}'")
+        if name in table:
+            raise EngineError(f"'{name}' зарегистрирован дважды")
+        table[name] = spec
+
+    # --- компиляция и проверка --------------------------------------
+
+    def compile(self) -> "Engine":
+        """Проверяет граф переходов и замораживает таблицы диспетчеризации"""
+        if self.compiled:
+            return self
+        if self._fallback is None or self._unknown_state is None:
+            raise EngineError("не заданы fallback и unknown_state")
+
+        known = set(self._states) | {IDLE}
+        actions = list(self._buttons.values()) + list(self._entries.values())
+        for spec in actions + list(self._states.values()):
+            missing = spec.next_states - known
+            if missing:
+                raise EngineError(f"'{spec.name}': переход в незарегистрированные состояния {sorted(missing)}")
+
+        # Достижимость из idle: кнопки, старты сценариев, затем переходы состояний
+        reachable = {IDLE}
+        frontier = [s for spec in actions for s in spec.next_states]
+        while frontier:
+            name = frontier.pop()
+            if name in reachable:
+                continue
+            reachable.add(name)
+            frontier.extend(self._states[name].next_states)
+        unreachable = set(self._states) - reachable
+        if unreachable:
+            raise EngineError(f"недостижимые состояния: {sorted(unreachable)}")
+
+        # Тупики: из состояния нельзя вернуться в idle своими переходами
+        for name in self._states:
+            seen, frontier = set(), [name]
+            while frontier:
+                current = frontier.pop()
+                if current == IDLE or current in seen:
+                    continue
+                seen.add(current)
+                frontier.extend(self._states[current].next_states)
+            if IDLE not in {s for c in seen for s in self._states[c].next_states}:
+                raise EngineError(f"тупиковое состояние: '{name}' не ведет в idle")
+
+        self._states = MappingProxyType(dict(self._states))
+        self._buttons = MappingProxyType(dict(self._buttons))
+        self._entries = MappingProxyType(dict(self._entries))
+        self._fragments = MappingProxyType(dict(self._fragments))
+        self.compiled = True
+        return self
+
+    @property
+    def states(self):
+        return self._states
+
+    @property
+    def buttons(self):
+        return self._buttons
+
+    @property
+    def entries(self):
+        return self._entries
+
+    @property
+    def fragments(self):
+        return self._fragments
+
+    def warm(self, catalog: CatalogSnapshot):
+        """Заранее рендерит все фрагменты для снимка каталога"""
+        for spec in self._fragments.values():
+            for key in (spec.keys(catalog) if spec.keys is not None else (None,)):
+                catalog.rendered(spec.name, spec.render, key)
+        catalog.fragments.warmed = True
+
+    # --- выполнение хода --------------------------------------------
+
+    def run(
+        self,
+        scenario: str,
+        text: str,
+        action_type: str,
+        action_name: Optional[str],
+        session: Optional[SessionState],
+        catalog: CatalogSnapshot,
+        change: StateChange,
+        timings: Optional[Timings] = None,
+        lean: bool = False
+    ) -> Reply:
+        """
+        Выполняет ход: O(1) поиск обработчика по action_name или состоянию.
+        С timings время извлечения сущностей пишется в фазу "extract".
+        lean — не собирать отладочные данные хода.
+        """
+        if not catalog.fragments.warmed:
+            self.warm(catalog)
+        state_before = session.state if session else IDLE
+        scenario_current = session.scenario if session else scenario
+        data = session.data if session else {}
+
+        debug_info = None if lean else {
+            "state_before": state_before,
+            "scenario": scenario_current,
+            "action_type": action_type,
+            "action_name": action_name,
+            "data_collected": data.copy(),
+            "catalog_version": catalog.version
+        }
+        ctx = TurnContext(scenario, text, action_name, catalog, state_before, data, change,
+                          debug_info, self._fragments)
+
+        if action_type == "button":
+            spec = self._buttons.get(action_name)
+            if spec is not None:
+                return self._checked(spec, spec.handler(ctx), change)
+
+        if action_type == "text":
+            spec = self._states.get(state_before)
+            if spec is not None:
+                if timings is None:
+                    value = spec.extractor(ctx)
+                else:
+                    started = time.perf_counter_ns()
+                    value = spec.extractor(ctx)
+                    timings.add("extract", started)
+                if not value:
+                    return ctx.reply(*spec.retry)
+                return self._checked(spec, spec.handler(ctx, value), change)
+
+        if state_before == IDLE or not session:
+            spec = self._entries.get(scenario)
+            if spec is not None:
+                return self._checked(spec, spec.handler(ctx), change)
+            return self._fallback(ctx)
+
+        ctx.clear_state()
+        return self._unknown_state(ctx)
+
+    @staticmethod
+    def _checked(spec, reply: Reply, change: StateChange) -> Reply:
+        if change.op == "set" and change.state not in spec.next_states:
+            raise EngineError(f"'{spec.name}': переход в '{change.state}' не объявлен в таблице")
+        if change.op == "clear" and IDLE not in spec.next_states:
+            raise EngineError(f"'{spec.name}': переход в idle не объявлен в таблице")
+        return reply
@@ -0,0 +1,162 @@
+"""
+Однопроходный извлекатель сущностей из сообщения пользователя.
+
+Ключевые слова направлений, форматов и времени компилируются один раз
+(при загрузке каталога) в префиксное дерево, записанное регулярным
+выражением: оно находит вхождения всех ключевых слов, включая
+перекрывающиеся, за один проход по тексту. Числа (возраст, количество
+людей, час) берутся из одного прохода по группам цифр.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Ключевые слова направлений (порядок внутри списка — приоритет)
+DIRECTION_KEYWORDS: Dict[str, List[str]] = {
+    "latina_solo_18": ["латина", "латино", "solo"],
+    "high_heels_18": ["хай хилс", "high heels", "каблуки", "хилс"],
+    "choreo_12_17": ["choreo", "хорео", "хореография"],
+    "dance_mix_7_11": ["dance mix", "микс", "танцы"],
+    "azbuka_3_5": ["азбука", "малыши", "детки"],
+    "hatha_yoga": ["йога", "yoga", "хатха"]
+}
+
+# Ключевые слова форматов аренды (порядок словаря — приоритет)
+FORMAT_KEYWORDS: Dict[str, List[str]] = {
+    "training": ["тренировка", "занятие", "training", "урок"],
+    "rehearsal": ["репетиция", "rehearsal", "репет"],
+    "photo_session": ["фотосессия", "фото", "photo", "съемка"]
+}
+
+# "до" проверяется раньше "после", как в extract_rent_time_bucket
+TIME_KEYWORDS: Tuple[Tuple[str, str], ...] = (("до", "daytime"), ("после", "evening"))
+
+DIGITS_RE = re.compile(r'\d+')
+# Числа, которые extract_age/extract_people_count принимают целиком
+_SMALL_NUMBERS = frozenset(str(n) for n in range(1, 101))
+
+_DIRECTION, _FORMAT, _TIME = 0, 1, 2
+
+# (вид сущности, приоритет, значение); меньший приоритет побеждает
+Payload = Tuple[int, tuple, str]
+
+
+@dataclass(slots=True)
+class Entities:
+    """Все сущности, найденные в сообщении"""
+
+    number: Optional[int] = None  # первое число 1..100: возраст или количество людей
+    time_bucket: Optional[str] = None
+    direction_id: Optional[str] = None
+    format: Optional[str] = None
+
+    @property
+    def age(self) -> Optional[int]:
+        return self.number
+
+    @property
+    def people_count(self) -> Optional[int]:
+        return self.number
+
+
+class EntityExtractor:
+    """Скомпилированный извлекатель для конкретного набора направлений"""
+
+    def __init__(self, directions: Sequence[dict],
+                 direction_keywords: Dict[str, List[str]] = DIRECTION_KEYWORDS,
+                 format_keywords: Dict[str, List[str]] = FORMAT_KEYWORDS):
+        payloads: Dict[str, List[Payload]] = {}
+
+        def add(keyword: str, payload: Payload):
+            if keyword:
+                payloads.setdefault(keyword, []).append(payload)
+
+        # Сначала ключевые слова направлений в порядке каталога, затем названия
+        for i, direction in enumerate(directions):
+            for j, keyword in enumerate(direction_keywords.get(direction["id"], ())):
+                add(keyword, (_DIRECTION, (0, i, j), direction["id"]))
+        for i, direction in enumerate(directions):
+            add(direction["name"].lower(), (_DIRECTION, (1, i, 0), direction["id"]))
+        for i, (format_id, keywords) in enumerate(format_keywords.items()):
+            for j, keyword in enumerate(keywords):
+                add(keyword, (_FORMAT, (i, j), format_id))
+        for i, (keyword, bucket) in enumerate(TIME_KEYWORDS):
+            add(keyword, (_TIME, (i,), bucket))
+
+        # Совпадение со словом означает совпадение со всеми словами внутри него
+        self._payloads: Dict[str, Tuple[Payload, ...]] = {}
+        for keyword in payloads:
+            merged = [p for other, ps in payloads.items() if other in keyword for p in ps]
+            self._payloads[keyword] = tuple(merged)
+
+        self._pattern = re.compile(_trie_regex(payloads)) if payloads else None
+
+    def extract(self, text: str) -> Entities:
+        """Один проход по тексту: возвращает все найденные сущности"""
+        best: List[Optional[Tuple[tuple, str]]] = [None, None, None]
+        if self._pattern is not None:
+            payloads = self._payloads
+            search = self._pattern.search
+            lowered = text.lower()
+            seen = set()
+            # Следующий поиск начинается со следующей позиции после начала
+            # совпадения, чтобы не пропустить слова, перекрывающиеся с ним
+            match = search(lowered)
+            while match is not None:
+                keyword = match.group()
+                if keyword not in seen:
+                    seen.add(keyword)
+                    for kind, priority, value in payloads[keyword]:
+                        current = best[kind]
+                        if current is None or priority < current[0]:
+                            best[kind] = (priority, value)
+                match = search(lowered, match.start() + 1)
+
+        entities = Entities()
+        hour = None
+        for match in DIGITS_RE.finditer(text):
+            digits = match.group()
+            if hour is None:
+                hour = int(digits[:2])
+            if digits in _SMALL_NUMBERS and _is_bounded(text, match.start(), match.end()):
+                entities.number = int(digits)
+                break
+        if best[_TIME] is not None:
+            entities.time_bucket = best[_TIME][1]
+        elif hour is not None:
+            entities.time_bucket = "daytime" if hour < 16 else "evening"
+        if best[_DIRECTION] is not None:
+            entities.direction_id = best[_DIRECTION][1]
+        if best[_FORMAT] is not None:
+            entities.format = best[_FORMAT][1]
+        return entities
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def _is_bounded(text: str, start: int, end: int) -> bool:
+    """Граница слова с обеих сторон, как \\b в регулярных выражениях"""
+    return ((start == 0 or not _is_word_char(text[start - 1]))
+            and (end == len(text) or not _is_word_char(text[end])))
+
+
+def _trie_regex(keywords) -> str:
+    """Регулярное выражение в виде префиксного дерева; находит самое длинное слово"""
+    trie: dict = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        terminal = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{pattern})?" if terminal else pattern
+
+    return build(trie)
@@ -1,50 +1,858 @@
 """
 FSM (Finite State Machine) для управления диалогами
 """
-import json
+import asyncio
+import os
 import re
-from typing import Optional, Dict, Any
+import threading
+import time
+import uuid
+from dataclasses import replace
+from typing import Optional, Dict, Any, List
 import redis
+import redis.asyncio as aioredis
 
+from app.extractor import DIRECTION_KEYWORDS, FORMAT_KEYWORDS
+from app.keyspace import KeyLayout, TtlPolicy, key_layout_from_env, ttl_policy_from_env
+from app.metrics import observe_redis
+from app.pricing import default_pricing
+from app.resilience import (
+    CircuitBreaker, FallbackStore, RedisSettings, StoreUnavailable,
+    acall_with_retry, call_with_retry, retry_delay
+)
+from app.session import decode_session, encode_session, session_state
+from app.state_cache import (
+    INVALIDATION_CHANNEL, StateCache, invalidation_message, parse_invalidation
+)
+
+
+def state_key(tenant_id: str, channel: str, user_id: str) -> str:
+    """Идентификатор сессии в исходной схеме ключей (шардирование, группировка)"""
+    return f"state:{tenant_id}:{channel}:{user_id}"
+
+
+def encode_state(scenario: str, state: str, data: Optional[Dict[str, Any]] = None) -> str:
+    """Сериализует состояние для записи в Redis"""
+    return encode_session(scenario, state, data)
+
+
+def decode_state(raw: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Разбирает состояние, прочитанное из Redis"""
+    session = decode_session(raw)
+    return session.as_dict() if session is not None else None
+
+
+# Атомарный переход "ожидаемое состояние -> новое" за один round trip.
+# KEYS[1] — ключ состояния; ARGV: ожидаемое значение ('' — ключа нет),
+# операция (set|clear), TTL, новое значение, канал и сообщение инвалидации
+# ('' — не публиковать).
+# Возвращает {1} при успехе или {0, текущее значение} при конфликте.
+TRANSITION_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current == false then current = '' end
+if current ~= ARGV[1] then
+    return {0, current}
+end
+if ARGV[2] == 'set' then
+    redis.call('SETEX', KEYS[1], ARGV[3], ARGV[4])
+elseif ARGV[2] == 'clear' then
+    redis.call('DEL', KEYS[1])
+end
+if ARGV[5] ~= '' then
+    redis.call('PUBLISH', ARGV[5], ARGV[6])
+end
+return {1}
+"""
+
+
+class StaleStateError(Exception):
+    """
+    Состояние изменилось между чтением и записью (конкурентный ход того же
+    пользователя). current — значение, которое сейчас лежит в Redis.
+    """
+
+    def __init__(self, current: Optional[str]):
+        super().__init__("состояние диалога изменилось конкурентно")
+        self.current = current or None
+
+
+def l1_cache_from_env() -> Optional[StateCache]:
+    """L1-кэш состояний, если он включен через STATE_L1_CACHE_SIZE"""
+    size = int(os.getenv("STATE_L1_CACHE_SIZE", "0"))
+    return StateCache(max_size=size) if size > 0 else None
+
+
+# Ключей режима отказа в одном pipeline сверки
+RECONCILE_BATCH = 100
+# Подписка на инвалидации: ожидание сообщения и задержка переподписки
+LISTENER_POLL = 0.1
+LISTENER_RETRY_DELAY = 0.1
+LISTENER_MAX_DELAY = 5.0
+
+
+class _StateStoreBase:
+    """Общая часть синхронного и асинхронного FSM"""
+
+    def _init_common(self, cache: Optional[StateCache], settings: RedisSettings,
+                     layout: Optional[KeyLayout], ttl_policy: Optional[TtlPolicy]):
+        self.layout = layout or key_layout_from_env()
+        self.ttl_policy = ttl_policy or ttl_policy_from_env()
+        self.ttl_seconds = self.ttl_policy.default
+        self.cache = cache
+        self.settings = settings
+        self.breaker = CircuitBreaker(settings.breaker_threshold, settings.breaker_reset)
+        self.fallback = FallbackStore(settings.fallback_size, self.ttl_seconds)
+        self.degraded_calls = 0
+        self.reconciled = 0
+        self.reconcile_conflicts = 0
+        self._reconciler = None
+        self.instance_id = uuid.uuid4().hex
+        self._transition_script = self.redis_client.register_script(TRANSITION_SCRIPT)
+        self._listener = None
 
-class FSM:
-    """Машина состояний для диалогов"""
-    
-    def __init__(self, redis_url: str):
-        self.redis_client = redis.from_url(redis_url, decode_responses=True)
-        self.ttl_seconds = 24 * 60 * 60  # 24 часа
-    
     def get_state_key(self, tenant_id: str, channel: str, user_id: str) -> str:
         """Генерирует ключ для хранения состояния"""
-        return f"state:{tenant_id}:{channel}:{user_id}"
+        return self.layout.key(tenant_id, channel, user_id)
+
+    def _value_ttl(self, value: str) -> int:
+        """TTL для уже закодированного значения (сверка, время жизни в L1)"""
+        return self.ttl_policy.ttl_for(session_state(value)) or self.ttl_seconds
+
+    def _cache_put(self, key: str, value: Optional[str], epoch: Optional[int] = None,
+                   ttl: Optional[int] = None):
+        """
+        Запись L1 живет не дольше ключа в Redis: TTL записи, если он уже
+        известен, иначе — по состоянию значения
+        """
+        if value is not None and not ttl:
+            ttl = self._value_ttl(value)
+        self.cache.put(key, value, epoch, ttl if value is not None else None)
+
+    def _transition_args(self, key: str, change: "StateChange", expected: Optional[str]) -> list:
+        op, ttl, value = change.op, 0, ""
+        if op == "set":
+            ttl = self.ttl_policy.ttl_for(change.state)
+            if ttl > 0:
+                value = encode_state(change.scenario, change.state, change.data)
+            else:
+                op = "clear"  # терминальное состояние: ключ не храним
+        return [expected or "", op, ttl, value] + self._invalidation_args(key)
+
+    def _invalidation_args(self, key: str) -> list:
+        if self.cache is None:
+            return ["", ""]
+        return [INVALIDATION_CHANNEL, invalidation_message(self.instance_id, key)]
+
+    def _finish_transition(self, key: str, result, args: list, epoch: Optional[int]):
+        """Обновляет L1-кэш по результату перехода и сообщает о конфликте"""
+        if int(result[0]) != 1:
+            current = result[1] or None
+            if self.cache is not None:
+                self._cache_put(key, current, epoch)
+            raise StaleStateError(current)
+        if self.cache is not None:
+            self._cache_put(key, args[3] or None, ttl=args[2])
+
+    def _remember_result(self, key: str, result, args: list):
+        """Запоминает подтвержденное Redis значение в локальном резерве"""
+        self.fallback.remember(key, (args[3] or None) if int(result[0]) == 1 else (result[1] or None))
+
+    def _degraded_transition(self, key: str, args: list) -> list:
+        self.degraded_calls += 1
+        return self.fallback.transition(key, args[0] or None, args[1], args[3] or None)
+
+    def _local(self, key: str) -> bool:
+        """
+        Ключ с несверенной записью режима отказа: до сверки он читается и
+        пишется только в локальном резерве, иначе диалог откатился бы к
+        значению в Redis. Заодно запускает фоновую сверку.
+        """
+        if not self.fallback.is_dirty(key):
+            return False
+        self._schedule_reconcile()
+        return True
+
+    def _split_local(self, prepared: list):
+        """Переходы несверенных ключей (выполняются локально) и остальные"""
+        local = {i: self._degraded_transition(key, args) for i, key, args in prepared if self._local(key)}
+        return local, [item for item in prepared if item[0] not in local]
+
+    @staticmethod
+    def _merge_results(prepared: list, local: dict, remote: list) -> list:
+        remote = iter(remote)
+        return [local[i] if i in local else next(remote) for i, _, _ in prepared]
+
+    def _confirm_many(self, keys: List[str], fetched: list) -> list:
+        """Запоминает прочитанное из Redis; несверенные ключи берутся из резерва"""
+        values = []
+        for key, raw in zip(keys, fetched):
+            if self._local(key):
+                raw = self.fallback.get(key)
+            else:
+                self.fallback.remember(key, raw)
+            values.append(raw)
+        return values
+
+    def _reconcile_batch(self) -> list:
+        """(ключ, значение, аргументы compare-and-set) очередной пачки сверки"""
+        batch = []
+        for key, value, base in self.fallback.pending(RECONCILE_BATCH):
+            op, ttl = "clear", 0
+            if value is not None:
+                ttl = self._value_ttl(value)
+                if ttl > 0:
+                    op = "set"
+            args = [base or "", op, ttl, value if op == "set" else ""] + self._invalidation_args(key)
+            batch.append((key, value, args))
+        return batch
+
+    def _finish_reconcile(self, batch: list, results: list) -> int:
+        """
+        Снимает пометки со сверенных ключей. Если ключ за время отказа
+        изменили в Redis, побеждает значение Redis: локальная запись
+        отбрасывается. Возвращает число перенесенных записей.
+        """
+        count = 0
+        for (key, value, args), result in zip(batch, results):
+            confirmed = args[3] or None
+            if int(result[0]) != 1 and (result[1] or None) != confirmed:
+                confirmed = result[1] or None
+                self.reconcile_conflicts += 1
+                if self.fallback.mark_clean(key, value, confirmed) and self.cache is not None:
+                    self._cache_put(key, confirmed)
+                continue
+            # {0, value} — запись уже применена, ответ на прошлую попытку потерян
+            self.fallback.mark_clean(key, value, confirmed)
+            count += 1
+        self.reconciled += count
+        return count
+
+    def _cached_many(self, keys: List[str]):
+        """Значения из L1-кэша и индексы ключей, которые нужно прочитать из Redis"""
+        values: List[Optional[str]] = [None] * len(keys)
+        if self.cache is None:
+            return values, list(range(len(keys))), None
+        missing = []
+        for i, key in enumerate(keys):
+            found, raw = self.cache.get(key)
+            if found:
+                values[i] = raw
+            else:
+                missing.append(i)
+        return values, missing, self.cache.epoch
+
+    def _store_many(self, keys: List[str], values: list, missing: List[int], fetched: list, epoch):
+        for i, raw in zip(missing, fetched):
+            values[i] = raw
+            if self.cache is not None:
+                self._cache_put(keys[i], raw, epoch)
+
+    def _prepare_many(self, items: list) -> list:
+        """(индекс, ключ, аргументы скрипта) для переходов, меняющих состояние"""
+        prepared = []
+        for i, (tenant_id, channel, user_id, expected, change) in enumerate(items):
+            if change.op is not None:
+                key = self.get_state_key(tenant_id, channel, user_id)
+                prepared.append((i, key, self._transition_args(key, change, expected)))
+        return prepared
+
+    def _finish_many(self, size: int, prepared: list, results: list, epoch) -> List[Optional["StaleStateError"]]:
+        errors: List[Optional[StaleStateError]] = [None] * size
+        for (i, key, args), result in zip(prepared, results):
+            try:
+                self._finish_transition(key, result, args, epoch)
+            except StaleStateError as e:
+                errors[i] = e
+        return errors
+
+    def _on_invalidation(self, message):
+        if message.get("type") == "subscribe":
+            # Пока подписки не было, инвалидации терялись: кэш мог устареть
+            self.cache.clear()
+            return
+        if message.get("type") != "message":
+            return
+        instance_id, key = parse_invalidation(message["data"])
+        if instance_id != self.instance_id:
+            self.cache.invalidate(key)
+
+    @staticmethod
+    def _listener_delay(attempt: int) -> float:
+        return min(LISTENER_MAX_DELAY, retry_delay(min(attempt, 10), LISTENER_RETRY_DELAY))
+
+    def store_stats(self) -> dict:
+        """Состояние выключателя, локального резерва и L1-кэша, если он включен"""
+        stats = {
+            "breaker": self.breaker.state,
+            "breaker_failures": self.breaker.failures,
+            "breaker_opened": self.breaker.opened,
+            "degraded_calls": self.degraded_calls,
+            "fallback_size": len(self.fallback),
+            "fallback_pending": len(self.fallback.dirty),
+            "fallback_dropped": self.fallback.dirty_evicted,
+            "fallback_expired": self.fallback.dirty_expired,
+            "reconciled": self.reconciled,
+            "reconcile_conflicts": self.reconcile_conflicts,
+        }
+        if self.cache is not None:
+            stats["l1_cache"] = self.cache.stats()
+        return stats
+
+
+class FSM(_StateStoreBase):
+    """
+    Машина состояний для диалогов.
+
+    Вызовы Redis идут через пул с таймаутами, повторами и выключателем;
+    при недоступности Redis состояние читается и пишется в локальный резерв.
+    """
+    
+    def __init__(self, redis_url: str, cache: Optional[StateCache] = None,
+                 settings: Optional[RedisSettings] = None, layout: Optional[KeyLayout] = None,
+                 ttl_policy: Optional[TtlPolicy] = None):
+        settings = settings or RedisSettings.from_env()
+        self.pool = redis.ConnectionPool.from_url(redis_url, decode_responses=True, **settings.pool_kwargs())
+        self.redis_client = redis.Redis(connection_pool=self.pool)
+        self._init_common(cache, settings, layout, ttl_policy)
+        self._reconcile_lock = threading.Lock()
+        self._reconciler_guard = threading.Lock()
+    
+    def _call(self, op: str, fn, idempotent: bool = True):
+        """Вызов Redis; записи, сделанные при отказе, сверяются в фоне"""
+        if self.fallback.dirty:
+            self._schedule_reconcile()
+        return self._timed(op, fn, idempotent)
+    
+    def _timed(self, op: str, fn, idempotent: bool = True):
+        started = time.perf_counter()
+        try:
+            return call_with_retry(fn, self.settings, self.breaker, idempotent)
+        finally:
+            observe_redis(op, started)
+    
+    def _schedule_reconcile(self):
+        """Запускает сверку в фоновом потоке, если она еще не идет"""
+        if self.breaker.blocked:
+            return
+        with self._reconciler_guard:
+            if self._reconciler is None or not self._reconciler.is_alive():
+                self._reconciler = threading.Thread(target=self.reconcile, name="fsm-reconcile", daemon=True)
+                self._reconciler.start()
+    
+    def reconcile(self) -> int:
+        """
+        Переносит в Redis записи, сделанные при отказе: compare-and-set
+        каждого ключа против значения, последним подтвержденного Redis,
+        пачками по RECONCILE_BATCH в одном pipeline. Одновременно идет
+        одна сверка; при новом отказе остаток ждет следующей.
+        Возвращает число перенесенных ключей.
+        """
+        count = 0
+        with self._reconcile_lock:
+            while True:
+                batch = self._reconcile_batch()
+                if not batch:
+                    break
+
+                def execute():
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    for key, _, args in batch:
+                        self._transition_script(keys=[key], args=args, client=pipe)
+                    return pipe.execute()
+
+                try:
+                    results = self._timed("reconcile", execute, idempotent=False)
+                except (StoreUnavailable, redis.RedisError):
+                    break
+                count += self._finish_reconcile(batch, results)
+        return count
+    
+    def connect(self, connections: int = 1) -> int:
+        """
+        Открывает connections соединений пула и проверяет каждое PING,
+        чтобы первые запросы не платили за установку соединения.
+        Возвращает число открытых соединений; ошибки Redis пробрасываются.
+        """
+        pool = self.redis_client.connection_pool
+        opened = []
+        try:
+            for _ in range(max(1, connections)):
+                opened.append(pool.get_connection("PING"))
+            for connection in opened:
+                connection.send_command("PING")
+                connection.read_response()
+        finally:
+            for connection in opened:
+                pool.release(connection)
+        return len(opened)
+    
+    def start_invalidation_listener(self):
+        """
+        Подписывается на канал инвалидации L1-кэша (фоновый поток). После
+        обрыва соединения переподписывается с экспоненциальной задержкой;
+        при каждой подписке L1-кэш очищается.
+        """
+        if self.cache is None or self._listener is not None:
+            return
+        self._listener_stop = threading.Event()
+        self._listener = threading.Thread(target=self._listen, args=(self._listener_stop,),
+                                          name="fsm-invalidation", daemon=True)
+        self._listener.start()
+    
+    def _listen(self, stop: threading.Event):
+        attempt = 0
+        while not stop.is_set():
+            pubsub = self.redis_client.pubsub()
+            try:
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                while not stop.is_set():
+                    message = pubsub.get_message(timeout=LISTENER_POLL)
+                    if message is not None:
+                        if message["type"] == "subscribe":
+                            attempt = 0
+                        self._on_invalidation(message)
+            except (redis.RedisError, OSError):
+                pass  # соединение оборвалось: переподписка после паузы
+            finally:
+                pubsub.close()
+            stop.wait(self._listener_delay(attempt))
+            attempt += 1
+    
+    def stop_invalidation_listener(self):
+        if self._listener is not None:
+            self._listener_stop.set()
+            self._listener.join(timeout=1.0)
+            self._listener = None
     
     def get_state(self, tenant_id: str, channel: str, user_id: str) -> Optional[Dict[str, Any]]:
         """Получает текущее состояние пользователя"""
+        return decode_state(self.get_state_raw(tenant_id, channel, user_id))
+    
+    def get_state_raw(self, tenant_id: str, channel: str, user_id: str) -> Optional[str]:
+        """Получает состояние в том виде, в котором оно хранится в Redis"""
         key = self.get_state_key(tenant_id, channel, user_id)
-        data = self.redis_client.get(key)
-        if data:
-            return json.loads(data)
-        return None
+        if self.cache is None:
+            return self._read(key)
+        found, raw = self.cache.get(key)
+        if found:
+            return raw
+        epoch = self.cache.epoch
+        raw = self._read(key)
+        self._cache_put(key, raw, epoch)
+        return raw
+    
+    def _read(self, key: str) -> Optional[str]:
+        if self._local(key):
+            return self.fallback.get(key)
+        try:
+            raw = self._call("get", lambda: self.redis_client.get(key))
+        except StoreUnavailable:
+            self.degraded_calls += 1
+            return self.fallback.get(key)
+        self.fallback.remember(key, raw)
+        return raw
+    
+    def transition(self, tenant_id: str, channel: str, user_id: str,
+                   expected: Optional[str], change: "StateChange"):
+        """
+        Атомарно применяет change, если в Redis все еще лежит expected.
+        При конфликте выбрасывает StaleStateError с текущим значением.
+        """
+        if change.op is None:
+            return
+        key = self.get_state_key(tenant_id, channel, user_id)
+        epoch = self.cache.epoch if self.cache is not None else None
+        args = self._transition_args(key, change, expected)
+        if self._local(key):
+            result = self._degraded_transition(key, args)
+            self._finish_transition(key, result, args, epoch)
+            return
+        try:
+            result = self._call("transition", lambda: self._transition_script(keys=[key], args=args, client=self.redis_client),
+                                idempotent=False)
+        except StoreUnavailable:
+            result = self._degraded_transition(key, args)
+        else:
+            self._remember_result(key, result, args)
+        self._finish_transition(key, result, args, epoch)
+    
+    def get_states_raw(self, users: List[tuple]) -> List[Optional[str]]:
+        """Состояния нескольких пользователей (tenant_id, channel, user_id) одним MGET"""
+        keys = [self.get_state_key(*user) for user in users]
+        values, missing, epoch = self._cached_many(keys)
+        if missing:
+            missing_keys = [keys[i] for i in missing]
+            try:
+                fetched = self._call("mget", lambda: self.redis_client.mget(missing_keys))
+            except StoreUnavailable:
+                self.degraded_calls += 1
+                fetched = [self.fallback.get(key) for key in missing_keys]
+            else:
+                fetched = self._confirm_many(missing_keys, fetched)
+            self._store_many(keys, values, missing, fetched, epoch)
+        return values
+    
+    def transition_many(self, items: List[tuple]) -> List[Optional[StaleStateError]]:
+        """
+        Применяет переходы (tenant_id, channel, user_id, expected, change)
+        одним pipeline. Возвращает StaleStateError для конфликтных элементов.
+        """
+        prepared = self._prepare_many(items)
+        if not prepared:
+            return [None] * len(items)
+        epoch = self.cache.epoch if self.cache is not None else None
+
+        local, remote = self._split_local(prepared)
+
+        def execute():
+            pipe = self.redis_client.pipeline(transaction=False)
+            for _, key, args in remote:
+                self._transition_script(keys=[key], args=args, client=pipe)
+            return pipe.execute()
+
+        results = []
+        if remote:
+            try:
+                results = self._call("transition_many", execute, idempotent=False)
+            except StoreUnavailable:
+                results = [self._degraded_transition(key, args) for _, key, args in remote]
+            else:
+                for (_, key, args), result in zip(remote, results):
+                    self._remember_result(key, result, args)
+        results = self._merge_results(prepared, local, results)
+        return self._finish_many(len(items), prepared, results, epoch)
     
     def set_state(self, tenant_id: str, channel: str, user_id: str, 
                   scenario: str, state: str, data: Dict[str, Any] = None):
         """Устанавливает состояние пользователя"""
         key = self.get_state_key(tenant_id, channel, user_id)
-        state_data = {
-            "scenario": scenario,
-            "state": state,
-            "data": data or {}
-        }
-        self.redis_client.setex(
-            key,
-            self.ttl_seconds,
-            json.dumps(state_data, ensure_ascii=False)
-        )
+        ttl = self.ttl_policy.ttl_for(state)
+        if ttl <= 0:
+            self._write(key, None, lambda: self.redis_client.delete(key))
+            return
+        value = encode_state(scenario, state, data)
+        self._write(key, value, lambda: self.redis_client.setex(key, ttl, value), ttl)
     
     def clear_state(self, tenant_id: str, channel: str, user_id: str):
         """Очищает состояние пользователя"""
         key = self.get_state_key(tenant_id, channel, user_id)
-        self.redis_client.delete(key)
+        self._write(key, None, lambda: self.redis_client.delete(key))
+    
+    def _write(self, key: str, value: Optional[str], command, ttl: Optional[int] = None):
+        if self._local(key):
+            self.fallback.write(key, value)
+        else:
+            try:
+                self._call("set" if value is not None else "delete", command)
+            except StoreUnavailable:
+                self.degraded_calls += 1
+                self.fallback.write(key, value)
+            else:
+                self.fallback.remember(key, value)
+                self._publish(key)
+        if self.cache is not None:
+            self._cache_put(key, value, ttl=ttl)
+    
+    def _publish(self, key: str):
+        if self.cache is None:
+            return
+        try:
+            self._timed("publish", lambda: self.redis_client.publish(
+                INVALIDATION_CHANNEL, invalidation_message(self.instance_id, key)))
+        except StoreUnavailable:
+            pass  # другие экземпляры узнают об изменении по TTL своего кэша
+
+
+class AsyncFSM(_StateStoreBase):
+    """
+    Машина состояний для диалогов на redis.asyncio.
+
+    Не блокирует event loop: запросы разных пользователей в одном воркере
+    выполняются параллельно, соединения берутся из общего пула. Каждый
+    вызов ограничен дедлайном; при недоступности Redis работает локальный
+    резерв, как у FSM.
+    """
+    
+    def __init__(self, redis_url: str, max_connections: Optional[int] = None,
+                 cache: Optional[StateCache] = None, settings: Optional[RedisSettings] = None,
+                 layout: Optional[KeyLayout] = None, ttl_policy: Optional[TtlPolicy] = None):
+        settings = settings or RedisSettings.from_env()
+        if max_connections is not None:
+            settings = replace(settings, max_connections=max_connections)
+        self.pool = aioredis.ConnectionPool.from_url(
+            redis_url, decode_responses=True, **settings.pool_kwargs()
+        )
+        self.redis_client = aioredis.Redis(connection_pool=self.pool)
+        self._init_common(cache, settings, layout, ttl_policy)
+        self._reconcile_lock = asyncio.Lock()
+    
+    async def _call(self, op: str, fn, idempotent: bool = True):
+        """Вызов Redis; записи, сделанные при отказе, сверяются в фоне"""
+        if self.fallback.dirty:
+            self._schedule_reconcile()
+        return await self._timed(op, fn, idempotent)
+    
+    async def _timed(self, op: str, fn, idempotent: bool = True):
+        started = time.perf_counter()
+        try:
+            return await acall_with_retry(fn, self.settings, self.breaker, idempotent)
+        finally:
+            observe_redis(op, started)
+    
+    def _schedule_reconcile(self):
+        """Запускает сверку фоновой задачей, если она еще не идет"""
+        if self.breaker.blocked or (self._reconciler is not None and not self._reconciler.done()):
+            return
+        self._reconciler = asyncio.create_task(self.reconcile())
+    
+    async def reconcile(self) -> int:
+        """Переносит в Redis записи, сделанные при отказе (см. FSM.reconcile)"""
+        count = 0
+        async with self._reconcile_lock:
+            while True:
+                batch = self._reconcile_batch()
+                if not batch:
+                    break
+
+                async def execute():
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    for key, _, args in batch:
+                        await self._transition_script(keys=[key], args=args, client=pipe)
+                    return await pipe.execute()
+
+                try:
+                    results = await self._timed("reconcile", execute, idempotent=False)
+                except (StoreUnavailable, redis.RedisError):
+                    break
+                count += self._finish_reconcile(batch, results)
+        return count
+    
+    async def connect(self, connections: int = 1) -> int:
+        """Открывает и проверяет PING connections соединений пула (см. FSM.connect)"""
+        pool = self.redis_client.connection_pool
+        opened = []
+        try:
+            for _ in range(max(1, connections)):
+                opened.append(await pool.get_connection("PING"))
+            for connection in opened:
+                await connection.send_command("PING")
+                await connection.read_response()
+        finally:
+            for connection in opened:
+                await pool.release(connection)
+        return len(opened)
+    
+    async def start_invalidation_listener(self):
+        """Подписывается на канал инвалидации L1-кэша (задача в event loop, см. FSM)"""
+        if self.cache is None or (self._listener is not None and not self._listener.done()):
+            return
+        self._listener = asyncio.create_task(self._listen())
+    
+    async def _listen(self):
+        attempt = 0
+        while True:
+            pubsub = self.redis_client.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "subscribe":
+                        attempt = 0
+                    self._on_invalidation(message)
+            except (redis.RedisError, OSError):
+                pass  # соединение оборвалось: переподписка после паузы
+            finally:
+                await pubsub.aclose()
+            await asyncio.sleep(self._listener_delay(attempt))
+            attempt += 1
+    
+    async def stop_invalidation_listener(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+    
+    async def _ensure_listener(self):
+        if self.cache is not None and (self._listener is None or self._listener.done()):
+            await self.start_invalidation_listener()
+    
+    async def get_state(self, tenant_id: str, channel: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Получает текущее состояние пользователя"""
+        return decode_state(await self.get_state_raw(tenant_id, channel, user_id))
+    
+    async def get_state_raw(self, tenant_id: str, channel: str, user_id: str) -> Optional[str]:
+        """Получает состояние в том виде, в котором оно хранится в Redis"""
+        key = self.get_state_key(tenant_id, channel, user_id)
+        if self.cache is None:
+            return await self._read(key)
+        await self._ensure_listener()
+        found, raw = self.cache.get(key)
+        if found:
+            return raw
+        epoch = self.cache.epoch
+        raw = await self._read(key)
+        self._cache_put(key, raw, epoch)
+        return raw
+    
+    async def _read(self, key: str) -> Optional[str]:
+        if self._local(key):
+            return self.fallback.get(key)
+        try:
+            raw = await self._call("get", lambda: self.redis_client.get(key))
+        except StoreUnavailable:
+            self.degraded_calls += 1
+            return self.fallback.get(key)
+        self.fallback.remember(key, raw)
+        return raw
+    
+    async def transition(self, tenant_id: str, channel: str, user_id: str,
+                         expected: Optional[str], change: "StateChange"):
+        """
+        Атомарно применяет change, если в Redis все еще лежит expected.
+        При конфликте выбрасывает StaleStateError с текущим значением.
+        """
+        if change.op is None:
+            return
+        key = self.get_state_key(tenant_id, channel, user_id)
+        epoch = self.cache.epoch if self.cache is not None else None
+        args = self._transition_args(key, change, expected)
+        if self._local(key):
+            result = self._degraded_transition(key, args)
+            self._finish_transition(key, result, args, epoch)
+            return
+        try:
+            result = await self._call(
+                "transition", lambda: self._transition_script(keys=[key], args=args, client=self.redis_client),
+                idempotent=False)
+        except StoreUnavailable:
+            result = self._degraded_transition(key, args)
+        else:
+            self._remember_result(key, result, args)
+        self._finish_transition(key, result, args, epoch)
+    
+    async def get_states_raw(self, users: List[tuple]) -> List[Optional[str]]:
+        """Состояния нескольких пользователей (tenant_id, channel, user_id) одним MGET"""
+        keys = [self.get_state_key(*user) for user in users]
+        await self._ensure_listener()
+        values, missing, epoch = self._cached_many(keys)
+        if missing:
+            missing_keys = [keys[i] for i in missing]
+            try:
+                fetched = await self._call("mget", lambda: self.redis_client.mget(missing_keys))
+            except StoreUnavailable:
+                self.degraded_calls += 1
+                fetched = [self.fallback.get(key) for key in missing_keys]
+            else:
+                fetched = self._confirm_many(missing_keys, fetched)
+            self._store_many(keys, values, missing, fetched, epoch)
+        return values
+    
+    async def transition_many(self, items: List[tuple]) -> List[Optional[StaleStateError]]:
+        """
+        Применяет переходы (tenant_id, channel, user_id, expected, change)
+        одним pipeline. Возвращает StaleStateError для конфликтных элементов.
+        """
+        prepared = self._prepare_many(items)
+        if not prepared:
+            return [None] * len(items)
+        epoch = self.cache.epoch if self.cache is not None else None
+
+        local, remote = self._split_local(prepared)
+
+        async def execute():
+            pipe = self.redis_client.pipeline(transaction=False)
+            for _, key, args in remote:
+                await self._transition_script(keys=[key], args=args, client=pipe)
+            return await pipe.execute()
+
+        results = []
+        if remote:
+            try:
+                results = await self._call("transition_many", execute, idempotent=False)
+            except StoreUnavailable:
+                results = [self._degraded_transition(key, args) for _, key, args in remote]
+            else:
+                for (_, key, args), result in zip(remote, results):
+                    self._remember_result(key, result, args)
+        results = self._merge_results(prepared, local, results)
+        return self._finish_many(len(items), prepared, results, epoch)
+    
+    async def set_state(self, tenant_id: str, channel: str, user_id: str,
+                        scenario: str, state: str, data: Dict[str, Any] = None):
+        """Устанавливает состояние пользователя"""
+        key = self.get_state_key(tenant_id, channel, user_id)
+        ttl = self.ttl_policy.ttl_for(state)
+        if ttl <= 0:
+            await self._write(key, None, lambda: self.redis_client.delete(key))
+            return
+        value = encode_state(scenario, state, data)
+        await self._write(key, value, lambda: self.redis_client.setex(key, ttl, value), ttl)
+    
+    async def clear_state(self, tenant_id: str, channel: str, user_id: str):
+        """Очищает состояние пользователя"""
+        key = self.get_state_key(tenant_id, channel, user_id)
+        await self._write(key, None, lambda: self.redis_client.delete(key))
+    
+    async def _write(self, key: str, value: Optional[str], command, ttl: Optional[int] = None):
+        if self._local(key):
+            self.fallback.write(key, value)
+        else:
+            try:
+                await self._call("set" if value is not None else "delete", command)
+            except StoreUnavailable:
+                self.degraded_calls += 1
+                self.fallback.write(key, value)
+            else:
+                self.fallback.remember(key, value)
+                await self._publish(key)
+        if self.cache is not None:
+            self._cache_put(key, value, ttl=ttl)
+    
+    async def _publish(self, key: str):
+        if self.cache is None:
+            return
+        try:
+            await self._timed("publish", lambda: self.redis_client.publish(
+                INVALIDATION_CHANNEL, invalidation_message(self.instance_id, key)))
+        except StoreUnavailable:
+            pass  # другие экземпляры узнают об изменении по TTL своего кэша
+    
+    async def close(self):
+        """Закрывает клиент и пул соединений"""
+        await self.stop_invalidation_listener()
+        if self._reconciler is not None and not self._reconciler.done():
+            self._reconciler.cancel()
+            await asyncio.gather(self._reconciler, return_exceptions=True)
+        await self.redis_client.aclose()
+        await self.pool.disconnect()
+
+
+class StateChange:
+    """
+    Изменение состояния, вычисленное за один ход диалога.
+
+    Логика хода не обращается к Redis напрямую: она только записывает сюда
+    итоговое действие, а FSM применяет его атомарно через transition().
+    """
+    
+    __slots__ = ("op", "scenario", "state", "data")
+    
+    def __init__(self):
+        self.op: Optional[str] = None  # None — состояние не меняется
+        self.scenario: Optional[str] = None
+        self.state: Optional[str] = None
+        self.data: Dict[str, Any] = {}
+    
+    def set_state(self, scenario: str, state: str, data: Dict[str, Any] = None):
+        self.op = "set"
+        self.scenario = scenario
+        self.state = state
+        self.data = data or {}
+    
+    def clear_state(self):
+        self.op = "clear"
 
 
 def extract_age(text: str) -> Optional[int]:
@@ -61,15 +869,7 @@ def extract_age(text: str) -> Optional[int]:
 def extract_direction(text: str, directions: list) -> Optional[str]:
     """Определяет направление по ключевым словам"""
     text_lower = text.lower()
-    
-    direction_keywords = {
-        "latina_solo_18": ["латина", "латино", "solo"],
-        "high_heels_18": ["хай хилс", "high heels", "каблуки", "хилс"],
-        "choreo_12_17": ["choreo", "хорео", "хореография"],
-        "dance_mix_7_11": ["dance mix", "микс", "танцы"],
-        "azbuka_3_5": ["азбука", "малыши", "детки"],
-        "hatha_yoga": ["йога", "yoga", "хатха"]
-    }
+    direction_keywords = DIRECTION_KEYWORDS
     
     for direction in directions:
         dir_id = direction["id"]
@@ -121,13 +921,7 @@ def extract_rent_format(text: str) -> Optional[str]:
     """Определяет формат аренды"""
     text_lower = text.lower()
     
-    format_keywords = {
-        "training": ["тренировка", "занятие", "training", "урок"],
-        "rehearsal": ["репетиция", "rehearsal", "репет"],
-        "photo_session": ["фотосессия", "фото", "photo", "съемка"]
-    }
-    
-    for format_id, keywords in format_keywords.items():
+    for format_id, keywords in FORMAT_KEYWORDS.items():
         for keyword in keywords:
             if keyword in text_lower:
                 return format_id
@@ -136,25 +930,5 @@ def extract_rent_format(text: str) -> Optional[str]:
 
 
 def check_rent_limits(format: str, people_count: int) -> tuple[bool, Optional[str]]:
-    """Проверяет лимиты формата аренды"""
-    limits = {
-        "training": 15,  # занятие
-        "rehearsal": 30,  # коврики/пол
-        "photo_session": 10,  # лаундж
-        "party": 45  # вечеринка
-    }
-    
-    # Маппинг форматов
-    if format == "training":
-        limit = limits["training"]
-    elif format == "rehearsal":
-        limit = limits["rehearsal"]
-    elif format == "photo_session":
-        limit = limits["photo_session"]
-    else:
-        limit = limits.get(format, 30)
-    
-    if people_count > limit:
-        return False, f"Для формата '{format}' максимальное количество участников: {limit}. У вас указано {people_count}."
-    
-    return True, None
+    """Проверяет лимиты формата аренды (правила по умолчанию)"""
+    return default_pricing().check_limits(format, people_count)
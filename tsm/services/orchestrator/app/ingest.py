@@ -0,0 +1,218 @@
+"""
+Очередь приема сообщений: порядок внутри пользователя, параллельность
+между пользователями.
+
+Сообщения распределяются по шардам по ключу сессии
+(tenant_id, channel, user_id); каждый шард обслуживает один асинхронный
+воркер, поэтому ходы одного пользователя выполняются строго по порядку,
+а ходы разных пользователей — параллельно в разных шардах. Очереди шардов
+ограничены: при переполнении submit ждет (backpressure). Дополнительно
+можно ограничить число необработанных сообщений одного тенанта, чтобы
+горячий тенант не занимал все очереди.
+"""
+import asyncio
+import os
+import zlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Union
+
+from starlette.responses import StreamingResponse
+
+from app.fsm import state_key
+
+Handler = Callable[[Any], Awaitable[Any]]
+
+
+class IngestQueue:
+    """Фиксированный пул асинхронных воркеров с шардированием по сессии"""
+
+    def __init__(self, handler: Handler, workers: int = 8, queue_size: int = 100,
+                 tenant_max_pending: int = 0):
+        if workers < 1 or queue_size < 1:
+            raise ValueError("workers и queue_size должны быть положительными")
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self.tenant_max_pending = tenant_max_pending
+        self._loop = None
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._tenant_slots: Dict[str, asyncio.Semaphore] = {}
+        self._tenant_pending: Dict[str, int] = {}
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.backpressure_waits = 0
+        self._max_depth = [0] * self.workers
+
+    def shard_for(self, tenant_id: str, channel: str, user_id: str) -> int:
+        """Номер шарда сессии; стабилен между процессами"""
+        return zlib.crc32(state_key(tenant_id, channel, user_id).encode("utf-8")) % self.workers
+
+    async def start(self):
+        """Запускает воркеры в текущем event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._tenant_slots = {}
+        self._tenant_pending = {}
+        self._reset_counters()
+        self._tasks = [asyncio.create_task(self._worker(shard)) for shard in range(self.workers)]
+
+    async def stop(self, drain: bool = True):
+        """Останавливает воркеры; с drain=True сначала дожидается очередей"""
+        if self._loop is None:
+            return
+        if drain:
+            await asyncio.gather(*(queue.join() for queue in self._queues))
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    async def submit(self, request) -> asyncio.Future:
+        """
+        Ставит сообщение в очередь шарда и возвращает future с результатом
+        обработчика. Ждет, если очередь шарда или лимит тенанта заполнены.
+        """
+        if self._loop is not asyncio.get_running_loop():
+            await self.start()
+        tenant_id = request.tenant_id
+        if self.tenant_max_pending > 0:
+            slots = self._tenant_slots.get(tenant_id)
+            if slots is None:
+                slots = self._tenant_slots[tenant_id] = asyncio.Semaphore(self.tenant_max_pending)
+            if slots.locked():
+                self.backpressure_waits += 1
+            await slots.acquire()
+
+        shard = self.shard_for(tenant_id, request.channel, request.user_id)
+        queue = self._queues[shard]
+        if queue.full():
+            self.backpressure_waits += 1
+        future = self._loop.create_future()
+        self._tenant_pending[tenant_id] = self._tenant_pending.get(tenant_id, 0) + 1
+        try:
+            await queue.put((request, future))
+        except BaseException:
+            self._release(tenant_id)
+            raise
+        self.submitted += 1
+        self._max_depth[shard] = max(self._max_depth[shard], queue.qsize())
+        return future
+
+    async def _worker(self, shard: int):
+        queue = self._queues[shard]
+        while True:
+            request, future = await queue.get()
+            try:
+                result = await self.handler(request)
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.processed += 1
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self._release(request.tenant_id)
+                queue.task_done()
+
+    def _release(self, tenant_id: str):
+        self._tenant_pending[tenant_id] -= 1
+        if not self._tenant_pending[tenant_id]:
+            del self._tenant_pending[tenant_id]
+        slots = self._tenant_slots.get(tenant_id)
+        if slots is not None:
+            slots.release()
+
+    def depths(self) -> List[int]:
+        """Текущая глубина очереди каждого шарда"""
+        return [queue.qsize() for queue in self._queues]
+
+    def stats(self) -> dict:
+        depths = self.depths()
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "depths": depths,
+            "depth_total": sum(depths),
+            "max_depths": list(self._max_depth),
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "backpressure_waits": self.backpressure_waits,
+            "tenant_pending": dict(self._tenant_pending),
+        }
+
+
+def ingest_queue_from_env(handler: Handler) -> IngestQueue:
+    """Очередь приема с параметрами из INGEST_WORKERS, INGEST_QUEUE_SIZE, INGEST_TENANT_MAX_PENDING"""
+    return IngestQueue(
+        handler,
+        workers=int(os.getenv("INGEST_WORKERS", "8")),
+        queue_size=int(os.getenv("INGEST_QUEUE_SIZE", "100")),
+        tenant_max_pending=int(os.getenv("INGEST_TENANT_MAX_PENDING", "0")),
+    )
+
+
+class LineTooLong(ValueError):
+    """Строка NDJSON длиннее допустимого; отдается вместо самой строки"""
+
+    def __init__(self, max_line: int):
+        super().__init__(f"строка длиннее {max_line} байт")
+
+
+async def iter_ndjson(chunks, max_line: int = 0) -> AsyncIterator[Union[bytes, LineTooLong]]:
+    """
+    Строки NDJSON из асинхронного потока байтов (пустые строки пропускаются).
+    Строки не декодируются: ошибка кодировки — ошибка своей строки, а не потока.
+    Строка длиннее max_line байт (0 — без ограничения) не буферизуется:
+    вместо нее выдается LineTooLong, остаток строки отбрасывается.
+    """
+    buffer = bytearray()
+    skipping = False  # отбрасывается хвост слишком длинной строки
+    async for chunk in chunks:
+        scan = len(buffer)  # перевод строки ищется только в новом куске
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", scan)) >= 0:
+            if skipping:
+                skipping = False
+            elif max_line and end - start > max_line:
+                yield LineTooLong(max_line)
+            elif buffer[start:end].strip():
+                yield bytes(buffer[start:end])
+            start = scan = end + 1
+        del buffer[:start]
+        if max_line and len(buffer) > max_line:
+            if not skipping:
+                skipping = True
+                yield LineTooLong(max_line)
+            buffer.clear()
+    if buffer.strip() and not skipping:
+        yield bytes(buffer)
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse, который не слушает http.disconnect: receive() в это
+    время читает тело запроса, и ответ отдается, пока тело еще приходит.
+    Обрыв соединения проявляется ошибкой чтения тела или отправки.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,233 @@
+"""
+Ключи и время жизни состояний диалогов в Redis.
+
+Схема ключей (STATE_KEY_LAYOUT):
+
+    full    state:{tenant}:{channel}:{user}   — исходная схема
+    short   s:{tenant}:{channel}:{user}
+    hashed  s:{tenant}:{16 символов blake2b(channel, user)}
+
+Тенант всегда остается в ключе открытым: по нему считается отчет о памяти
+и чистятся данные студии. При смене схемы старые ключи не читаются и
+истекают по своему TTL.
+
+TTL зависит от состояния (TtlPolicy): входные состояния, где диалог
+чаще всего бросают после одной кнопки, живут недолго, середина воронки —
+дольше, а состояния с TTL 0 удаляются сразу при переходе в них.
+
+Отчет о памяти:
+    python -m app.keyspace --redis-url redis://localhost:6379/0 --sample 10000
+"""
+import argparse
+import base64
+import hashlib
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import redis
+
+from app.session import decode_session
+
+KEY_LAYOUTS = ("full", "short", "hashed")
+
+# Состояния, в которые диалог попадает первой кнопкой
+ENTRY_STATES = ("kids_need_age", "rent_need_time", "booking_need_direction")
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_ENTRY_TTL = 2 * 60 * 60
+# Явные значения по состояниям; 0 — удалить ключ при переходе
+DEFAULT_STATE_TTLS: Dict[str, int] = {"idle": 0}
+
+# Оценка накладных расходов Redis на ключ (dictEntry, robj, заголовки sds,
+# запись в expires), если сервер не поддерживает MEMORY USAGE
+ESTIMATED_KEY_OVERHEAD = 72
+
+
+class KeyLayout:
+    """Схема ключей состояний"""
+
+    __slots__ = ("name", "prefix")
+
+    def __init__(self, name: str = "full"):
+        if name not in KEY_LAYOUTS:
+            raise ValueError(f"неизвестная схема ключей '{name}', ожидается одна из {', '.join(KEY_LAYOUTS)}")
+        self.name = name
+        self.prefix = "state:" if name == "full" else "s:"
+
+    def key(self, tenant_id: str, channel: str, user_id: str) -> str:
+        if self.name == "hashed":
+            digest = hashlib.blake2b(f"{channel}\0{user_id}".encode("utf-8"), digest_size=12).digest()
+            return f"{self.prefix}{tenant_id}:{base64.urlsafe_b64encode(digest).decode('ascii')}"
+        return f"{self.prefix}{tenant_id}:{channel}:{user_id}"
+
+    def pattern(self, tenant_id: Optional[str] = None) -> str:
+        """Шаблон SCAN для всех ключей схемы или одного тенанта"""
+        return f"{self.prefix}{tenant_id}:*" if tenant_id else f"{self.prefix}*"
+
+    def tenant_of(self, key: str) -> str:
+        return key[len(self.prefix):].split(":", 1)[0]
+
+
+def key_layout_from_env() -> KeyLayout:
+    return KeyLayout(os.getenv("STATE_KEY_LAYOUT", "full"))
+
+
+class TtlPolicy:
+    """Время жизни ключа состояния в секундах по имени состояния"""
+
+    __slots__ = ("default", "states")
+
+    def __init__(self, default: int = DEFAULT_TTL, states: Optional[Mapping[str, int]] = None):
+        self.default = default
+        self.states = dict(states or {})
+
+    @classmethod
+    def tiered(cls, default: int = DEFAULT_TTL, entry: int = DEFAULT_ENTRY_TTL,
+               overrides: Optional[Mapping[str, int]] = None) -> "TtlPolicy":
+        """Короткий TTL входных состояний, default для остальных, затем overrides"""
+        states = {state: entry for state in ENTRY_STATES}
+        states.update(DEFAULT_STATE_TTLS)
+        states.update(overrides or {})
+        return cls(default, states)
+
+    @classmethod
+    def flat(cls, ttl: int = DEFAULT_TTL) -> "TtlPolicy":
+        """Одинаковый TTL для всех состояний (исходное поведение)"""
+        return cls(ttl)
+
+    def ttl_for(self, state: Optional[str]) -> int:
+        return self.states.get(state, self.default)
+
+
+def parse_ttl_overrides(value: str) -> Dict[str, int]:
+    """"rent_need_people=43200,idle=0" -> {"rent_need_people": 43200, "idle": 0}"""
+    overrides = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        state, sep, seconds = item.partition("=")
+        if not sep:
+            raise ValueError(f"ожидается состояние=секунды, получено '{item}'")
+        overrides[state.strip()] = int(seconds)
+    return overrides
+
+
+def ttl_policy_from_env() -> TtlPolicy:
+    """TTL из STATE_TTL_DEFAULT, STATE_TTL_ENTRY и STATE_TTL_OVERRIDES"""
+    return TtlPolicy.tiered(
+        default=int(os.getenv("STATE_TTL_DEFAULT", str(DEFAULT_TTL))),
+        entry=int(os.getenv("STATE_TTL_ENTRY", str(DEFAULT_ENTRY_TTL))),
+        overrides=parse_ttl_overrides(os.getenv("STATE_TTL_OVERRIDES", "")),
+    )
+
+
+@dataclass
+class MemoryGroup:
+    keys: int = 0
+    bytes: int = 0
+
+    @property
+    def per_key(self) -> float:
+        return self.bytes / self.keys if self.keys else 0.0
+
+
+@dataclass
+class MemoryReport:
+    """Память выборки ключей по тенантам и состояниям"""
+
+    sampled: int = 0
+    estimated: bool = False
+    groups: Dict[Tuple[str, str], MemoryGroup] = field(default_factory=dict)
+
+    def add(self, tenant: str, state: str, size: int):
+        group = self.groups.get((tenant, state))
+        if group is None:
+            group = self.groups[(tenant, state)] = MemoryGroup()
+        group.keys += 1
+        group.bytes += size
+        self.sampled += 1
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(group.bytes for group in self.groups.values())
+
+    @property
+    def per_session(self) -> float:
+        return self.total_bytes / self.sampled if self.sampled else 0.0
+
+    def as_rows(self) -> List[dict]:
+        return [
+            {"tenant": tenant, "state": state, "keys": group.keys,
+             "bytes": group.bytes, "bytes_per_session": round(group.per_key, 1)}
+            for (tenant, state), group in sorted(self.groups.items())
+        ]
+
+
+def _state_of(raw: Optional[str]) -> str:
+    try:
+        session = decode_session(raw)
+    except (ValueError, KeyError, IndexError):
+        return "unknown"
+    return session.state if session is not None else "expired"
+
+
+def memory_report(client: redis.Redis, layout: KeyLayout, sample: int = 10000,
+                  tenant_id: Optional[str] = None, batch: int = 500) -> MemoryReport:
+    """
+    Обходит до sample ключей через SCAN и считает MEMORY USAGE по тенантам
+    и состояниям. Без MEMORY USAGE (например, fakeredis) размер оценивается
+    по длине ключа и значения.
+    """
+    report = MemoryReport()
+    keys: List[str] = []
+    for key in client.scan_iter(match=layout.pattern(tenant_id), count=batch):
+        keys.append(key)
+        if len(keys) >= batch or report.sampled + len(keys) >= sample:
+            _measure(client, layout, keys, report)
+            keys = []
+        if report.sampled >= sample:
+            break
+    if keys:
+        _measure(client, layout, keys, report)
+    return report
+
+
+def _measure(client: redis.Redis, layout: KeyLayout, keys: List[str], report: MemoryReport):
+    values = client.mget(keys)
+    if report.estimated:
+        sizes = [None] * len(keys)
+    else:
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.memory_usage(key)
+        try:
+            sizes = pipe.execute()
+        except redis.ResponseError:
+            report.estimated = True
+            sizes = [None] * len(keys)
+    for key, raw, size in zip(keys, values, sizes):
+        if size is None:
+            size = len(key.encode("utf-8")) + len((raw or "").encode("utf-8")) + ESTIMATED_KEY_OVERHEAD
+        report.add(layout.tenant_of(key), _state_of(raw), size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память ключей состояний по тенантам и состояниям")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    parser.add_argument("--layout", default=os.getenv("STATE_KEY_LAYOUT", "full"), choices=KEY_LAYOUTS)
+    parser.add_argument("--tenant", default=None)
+    parser.add_argument("--sample", type=int, default=10000)
+    args = parser.parse_args()
+
+    client = redis.from_url(args.redis_url, decode_responses=True)
+    report = memory_report(client, KeyLayout(args.layout), args.sample, args.tenant)
+    print(f"{'tenant':<24}{'state':<26}{'keys':>8}{'bytes':>12}{'B/session':>11}")
+    for row in report.as_rows():
+        print(f"{row['tenant']:<24}{row['state']:<26}{row['keys']:>8}"
+              f"{row['bytes']:>12}{row['bytes_per_session']:>11.1f}")
+    note = " (оценка, MEMORY USAGE недоступен)" if report.estimated else ""
+    print(f"\nвыборка: {report.sampled} ключей, {report.per_session:.1f} B/сессию, "
+          f"~{report.per_session * 100_000 / 2 ** 20:.1f} MiB на 100k активных пользователей{note}")
+
+
+if __name__ == "__main__":
+    main()
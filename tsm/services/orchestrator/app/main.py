@@ -1,18 +1,47 @@
+import asyncio
 import json
 import os
+import secrets
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Annotated, Any, List, Literal, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, FastAPI, Header, HTTPException, Request, WebSocket
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from pydantic import BaseModel, Field, ValidationError
 
-from app.fsm import (
-    FSM, extract_age, extract_direction, extract_rent_time_bucket,
-    extract_people_count, extract_rent_format, check_rent_limits
+from app import serialization
+from app.batch import ChatBatch
+from app.catalog import CatalogSnapshot, CatalogStore, catalog_poll_interval
+from app.dialogs import engine as dialog_engine
+from app.fsm import FSM, AsyncFSM, StateChange, StaleStateError, l1_cache_from_env
+from app.ingest import DuplexStreamingResponse, IngestQueue, LineTooLong, ingest_queue_from_env, iter_ndjson
+from app.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, MetricsMiddleware, observe_request, record_turn
 )
+from app.profiling import PROFILE_MAX_SECONDS, Timings, profiler, wants_timings
+from app.serialization import FastJSONResponse
+from app.session import SessionState, decode_session
+from app.tenants import TenantCatalogs, tenant_catalogs_from_env
+from app.warmup import WARMUP_ON_STARTUP, Readiness, retry_failed, warm_up
 
-app = FastAPI(title="Танцуй со мной - Orchestrator", version="v0.1.1")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Прогрев до приема запросов; неудачные шаги повторяются в фоне"""
+    steps = warmup_steps() if WARMUP_ON_STARTUP else []
+    retry = None
+    if not await warm_up(get_readiness(), steps):
+        retry = asyncio.create_task(retry_failed(get_readiness(), steps))
+    yield
+    if retry is not None:
+        retry.cancel()
+
+
+app = FastAPI(title="Танцуй со мной - Orchestrator", version="v0.1.1", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,25 +50,137 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 PRODUCT_VERSION = os.getenv("PRODUCT_VERSION", "v0.1.1")
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-DIKIDI_STUB_PATH = Path("/app/data/dikidi_stub.json")
+TRANSITION_ATTEMPTS = int(os.getenv("TRANSITION_ATTEMPTS", "3"))
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "100"))
+RENTAL_QUOTE_MAX_ITEMS = int(os.getenv("RENTAL_QUOTE_MAX_ITEMS", "50000"))
+INGEST_MAX_INFLIGHT = int(os.getenv("INGEST_MAX_INFLIGHT", "1000"))
+INGEST_MAX_LINE_BYTES = int(os.getenv("INGEST_MAX_LINE_BYTES", "65536"))
+STALE_STATE_DETAIL = "Состояние диалога изменилось, повторите запрос"
+# Соединений пула Redis, открываемых при старте; тенанты, чьи каталоги грузятся заранее
+REDIS_WARM_CONNECTIONS = int(os.getenv("REDIS_WARM_CONNECTIONS", "4"))
+WARMUP_TENANTS = tuple(filter(None, (t.strip() for t in os.getenv("WARMUP_TENANTS", "").split(","))))
+# Режим ответа /chat по умолчанию и каналы, которым debug не нужен (адаптеры мессенджеров)
+RESPONSE_MODE = os.getenv("RESPONSE_MODE", "full")
+LEAN_CHANNELS = frozenset(filter(None, (c.strip() for c in os.getenv("LEAN_CHANNELS", "").split(","))))
+# Токен админ-эндпоинтов (X-Admin-Token); пусто — эндпоинты выключены
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+DIKIDI_STUB_PATH = Path(os.getenv("DIKIDI_STUB_PATH", "/app/data/dikidi_stub.json"))
 
 # Инициализация FSM (будет переопределена в process_state_machine для тестов)
 _fsm_instance = None
+_async_fsm_instance = None
 
 def get_fsm():
     """Получает экземпляр FSM (singleton)"""
     global _fsm_instance
     if _fsm_instance is None:
-        _fsm_instance = FSM(REDIS_URL)
+        _fsm_instance = FSM(REDIS_URL, cache=l1_cache_from_env())
+        _fsm_instance.start_invalidation_listener()
     return _fsm_instance
 
 def set_fsm(fsm_instance):
-    """Устанавливает экземпляр FSM (для тестов)"""
-    global _fsm_instance
+    """
+    Устанавливает экземпляр FSM (для тестов).
+    После этого /chat работает через синхронный FSM, пока не вызван set_async_fsm.
+    """
+    global _fsm_instance, _async_fsm_instance
     _fsm_instance = fsm_instance
+    _async_fsm_instance = None
+
+def get_async_fsm():
+    """Получает экземпляр асинхронного FSM (singleton)"""
+    global _async_fsm_instance
+    if _async_fsm_instance is None:
+        _async_fsm_instance = AsyncFSM(REDIS_URL, cache=l1_cache_from_env())
+    return _async_fsm_instance
+
+def set_async_fsm(fsm_instance):
+    """Устанавливает экземпляр асинхронного FSM (для тестов)"""
+    global _async_fsm_instance
+    _async_fsm_instance = fsm_instance
+
+def uses_sync_fsm() -> bool:
+    """True, если для /chat явно установлен синхронный FSM"""
+    return _async_fsm_instance is None and _fsm_instance is not None
+
+
+# Каталог DIKIDI: читается с диска один раз, далее только наблюдателем
+_catalog_store = None
+
+def get_catalog_store() -> CatalogStore:
+    """Получает хранилище каталога (singleton)"""
+    global _catalog_store
+    if _catalog_store is None:
+        _catalog_store = CatalogStore(DIKIDI_STUB_PATH, poll_interval=catalog_poll_interval())
+        _catalog_store.start()
+    return _catalog_store
+
+def set_catalog_store(store: Optional[CatalogStore]):
+    """Устанавливает хранилище каталога (для тестов)"""
+    global _catalog_store
+    if _catalog_store is not None and _catalog_store is not store:
+        _catalog_store.stop()
+    _catalog_store = store
+
+def get_catalog() -> CatalogSnapshot:
+    """Текущий снимок каталога"""
+    return get_catalog_store().snapshot
+
+# Каталоги студий: свой файл в TENANT_CATALOG_DIR или общий каталог
+_tenant_catalogs = None
+
+def get_tenant_catalogs() -> TenantCatalogs:
+    """Получает хранилище каталогов тенантов (singleton)"""
+    global _tenant_catalogs
+    if _tenant_catalogs is None:
+        _tenant_catalogs = tenant_catalogs_from_env(get_catalog, catalog_poll_interval())
+        _tenant_catalogs.start()
+    return _tenant_catalogs
+
+def set_tenant_catalogs(catalogs: Optional[TenantCatalogs]):
+    """Устанавливает хранилище каталогов тенантов (для тестов)"""
+    global _tenant_catalogs
+    if _tenant_catalogs is not None and _tenant_catalogs is not catalogs:
+        _tenant_catalogs.stop()
+    _tenant_catalogs = catalogs
+
+async def get_tenant_catalog(tenant_id: Optional[str]) -> CatalogSnapshot:
+    """Снимок каталога тенанта; холодный тенант загружается без блокировки event loop"""
+    return await get_tenant_catalogs().get(tenant_id)
+
+def as_catalog(dikidi_data) -> CatalogSnapshot:
+    """Приводит данные каталога к снимку (словарь допускается для тестов)"""
+    if isinstance(dikidi_data, CatalogSnapshot):
+        return dikidi_data
+    current = get_catalog()
+    if dikidi_data is None or dikidi_data is current.data:
+        return current
+    return CatalogSnapshot.build(dikidi_data)
+
+
+def encode_catalog(catalog: CatalogSnapshot, _key=None) -> bytes:
+    """Тело GET /dikidi для снимка каталога"""
+    return serialization.dumps(catalog.data)
+
+
+# Очередь приема NDJSON: шарды по сессии, воркеры запускаются при первом сообщении
+_ingest_queue = None
+
+def get_ingest_queue() -> IngestQueue:
+    """Получает очередь приема сообщений (singleton)"""
+    global _ingest_queue
+    if _ingest_queue is None:
+        _ingest_queue = ingest_queue_from_env(run_turn)
+    return _ingest_queue
+
+def set_ingest_queue(queue: Optional[IngestQueue]):
+    """Устанавливает очередь приема (для тестов)"""
+    global _ingest_queue
+    _ingest_queue = queue
 
 
 class ChatRequest(BaseModel):
@@ -50,6 +191,19 @@ class ChatRequest(BaseModel):
     scenario: str
     action_type: str
     action_name: Optional[str] = None
+    # full — ответ с debug, lean — только reply/intent/version; None — по каналу
+    response_mode: Optional[Literal["full", "lean"]] = None
+
+
+class ChatFrame(BaseModel):
+    """Кадр /chat/ws: только то, что меняется от хода к ходу"""
+    text: str
+    action_type: str
+    action_name: Optional[str] = None
+    # Без сценария в кадре — сценарий подключения
+    scenario: Optional[str] = None
+    # Возвращается в ответе как есть, чтобы клиент сопоставлял ответы с кадрами
+    id: Optional[Any] = None
 
 
 class ChatResponse(BaseModel):
@@ -59,71 +213,141 @@ class ChatResponse(BaseModel):
     debug: dict
 
 
+class ChatBatchItem(BaseModel):
+    status: int
+    response: Optional[ChatResponse] = None
+    error: Optional[str] = None
+
+
+PeopleCount = Annotated[int, Field(ge=1)]
+Hours = Annotated[int, Field(ge=1)]
+
+
+class RentalQuoteItem(BaseModel):
+    time_bucket: str  # daytime | evening | время начала "ЧЧ:ММ"
+    people_count: PeopleCount
+    format: str
+    hours: Optional[Hours] = None
+
+
+class RentalQuoteGrid(BaseModel):
+    """Все комбинации значений (например, календарь недели)"""
+    time_buckets: List[str]
+    people_counts: List[PeopleCount]
+    formats: List[str]
+    hours: List[Optional[Hours]] = [None]
+
+
+class RentalQuoteRequest(BaseModel):
+    tenant_id: Optional[str] = "studio_nexa"
+    items: List[RentalQuoteItem] = []
+    grid: Optional[RentalQuoteGrid] = None
+
+
+class RentalQuote(BaseModel):
+    time_bucket: str
+    people_count: int
+    format: str
+    hours: Optional[int]
+    price_per_hour: Optional[int]
+    total: Optional[int]
+    rule: Optional[str]
+    valid: bool
+    error: Optional[str] = None
+
+
+class RentalQuoteResponse(BaseModel):
+    catalog_version: int
+    quotes: List[RentalQuote]
+
+
+_readiness = Readiness()
+
+def get_readiness() -> Readiness:
+    """Состояние прогрева (singleton)"""
+    return _readiness
+
+
+async def warm_catalogs():
+    """Чтение и индексация общего каталога и каталогов WARMUP_TENANTS"""
+    get_catalog()
+    for tenant_id in WARMUP_TENANTS:
+        await get_tenant_catalog(tenant_id)
+
+
+def warm_engine():
+    """Фрагменты ответов, тело /dikidi и проход извлечения сущностей"""
+    catalogs = [get_catalog()] + [get_tenant_catalogs().cached(t) for t in WARMUP_TENANTS]
+    for catalog in filter(None, catalogs):
+        dialog_engine.warm(catalog)
+        catalog.rendered("dikidi_json", encode_catalog)
+        catalog.extractor.extract("запись на латину в среду после 16, 12 человек, ребенку 6 лет")
+
+
+async def warm_redis():
+    """Соединения пула FSM, которым пользуется /chat, и подписка L1-кэша"""
+    if uses_sync_fsm():
+        fsm = get_fsm()
+        await run_in_threadpool(fsm.connect, min(REDIS_WARM_CONNECTIONS, fsm.settings.max_connections))
+        return
+    fsm = get_async_fsm()
+    await fsm.connect(min(REDIS_WARM_CONNECTIONS, fsm.settings.max_connections))
+    await fsm.start_invalidation_listener()
+
+
+def warmup_steps() -> list:
+    return [("catalog", warm_catalogs), ("engine", warm_engine), ("redis", warm_redis)]
+
+
 def load_dikidi_stub():
-    """Загружает данные из DIKIDI stub"""
-    try:
-        with open(DIKIDI_STUB_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {"directions": [], "schedule": [], "rental": {}}
-
-
-def calculate_rental_price(
-    time_bucket: str,
-    people_count: int,
-    format_type: str,
-    rental_data: dict,
-    hours: Optional[int] = None
-) -> tuple[int, str, str]:
+    """Возвращает данные DIKIDI stub из текущего снимка каталога"""
+    return get_catalog().data
+
+
+def process_state_machine(
+    scenario: str,
+    text: str,
+    action_type: str,
+    action_name: Optional[str],
+    tenant_id: str,
+    channel: str,
+    user_id: str,
+    dikidi_data=None,
+    timings: Optional[Timings] = None,
+    lean: bool = False
+) -> tuple[str, str, dict]:
     """
-    Рассчитывает стоимость аренды по правилам из требований.
-    Возвращает (цена, правило, сообщение)
+    Обрабатывает запрос через синхронный FSM.
+    dikidi_data — снимок каталога (по умолчанию текущий) или словарь stub.
+    timings — разбивка по фазам (redis_read, decide, redis_write), если включена.
+    lean — не собирать debug (легкий режим ответа).
+    Возвращает (reply, intent, debug_info)
     """
-    rules = rental_data.get("rules", {})
-    
-    # Проверяем оптовые цены (>=8 часов)
-    is_bulk = hours is not None and hours >= 8
-    
-    if is_bulk:
-        # Оптовые цены: 700 для <=10 чел, 1100 для >10 чел
-        if people_count <= 10:
-            price = 700
-            rule = "bulk_up_to_10"
-        else:
-            price = 1100
-            rule = "bulk_more_than_10"
-        message = f"Стоимость аренды: {price} руб/час (оптовая цена при аренде от 8 часов)."
-    else:
-        # Обычные цены по требованиям:
-        # до 16:00 до 10 чел = 900
-        # после 16:00 до 10 чел = 1300
-        # до 16:00 >10 чел = 1100
-        # после 16:00 >10 чел = 1500
-        if time_bucket == "daytime":
-            if people_count <= 10:
-                price = 900
-                rule = "daytime_up_to_10"
-            else:
-                price = 1100
-                rule = "daytime_more_than_10"
-        else:  # evening
-            if people_count <= 10:
-                price = 1300
-                rule = "evening_up_to_10"
-            else:
-                price = 1500
-                rule = "evening_more_than_10"
-        message = f"Стоимость аренды: {price} руб/час."
-    
-    # Добавляем информацию о предоплате и бронировании
-    prepayment = rules.get("prepayment_percent", 50)
-    min_booking = rules.get("min_booking_hours", 12)
-    message += f"\n\nПредоплата: {prepayment}%\nБронь минимум за {min_booking} часов."
-    
-    return price, rule, message
+    fsm = get_fsm()
+    catalog = as_catalog(dikidi_data)
+    raw = fsm.get_state_raw(tenant_id, channel, user_id)
+    if timings is not None:
+        timings.mark("redis_read")
+    for attempt in range(TRANSITION_ATTEMPTS):
+        change = StateChange()
+        result = decide_turn(scenario, text, action_type, action_name,
+                             decode_session(raw), catalog, change, timings, lean)
+        if timings is not None:
+            timings.mark("decide")
+        try:
+            fsm.transition(tenant_id, channel, user_id, raw, change)
+            return result
+        except StaleStateError as e:
+            # Конкурентный ход того же пользователя: пересчитываем от нового состояния
+            if attempt + 1 == TRANSITION_ATTEMPTS:
+                raise
+            raw = e.current
+        finally:
+            if timings is not None:
+                timings.mark("redis_write")
 
 
-def process_state_machine(
+async def process_state_machine_async(
     scenario: str,
     text: str,
     action_type: str,
@@ -131,296 +355,87 @@ def process_state_machine(
     tenant_id: str,
     channel: str,
     user_id: str,
-    dikidi_data: dict
+    dikidi_data=None,
+    timings: Optional[Timings] = None,
+    lean: bool = False
 ) -> tuple[str, str, dict]:
     """
-    Обрабатывает запрос через FSM.
+    Обрабатывает запрос через асинхронный FSM, не блокируя event loop.
     Возвращает (reply, intent, debug_info)
     """
+    fsm = get_async_fsm()
+    catalog = as_catalog(dikidi_data)
+    raw = await fsm.get_state_raw(tenant_id, channel, user_id)
+    if timings is not None:
+        timings.mark("redis_read")
+    for attempt in range(TRANSITION_ATTEMPTS):
+        change = StateChange()
+        result = decide_turn(scenario, text, action_type, action_name,
+                             decode_session(raw), catalog, change, timings, lean)
+        if timings is not None:
+            timings.mark("decide")
+        try:
+            await fsm.transition(tenant_id, channel, user_id, raw, change)
+            return result
+        except StaleStateError as e:
+            if attempt + 1 == TRANSITION_ATTEMPTS:
+                raise
+            raw = e.current
+        finally:
+            if timings is not None:
+                timings.mark("redis_write")
+
+
+def process_batch(batch: ChatBatch, dikidi_data=None):
+    """
+    Обрабатывает пакет ходов через синхронный FSM: один MGET на чтение,
+    один pipeline на запись. Результаты записываются в batch.results.
+    """
     fsm = get_fsm()
-    state_data = fsm.get_state(tenant_id, channel, user_id)
-    state_before = state_data.get("state") if state_data else "idle"
-    scenario_current = state_data.get("scenario") if state_data else scenario
-    data = state_data.get("data", {}) if state_data else {}
-    
-    debug_info = {
-        "state_before": state_before,
-        "scenario": scenario_current,
-        "action_type": action_type,
-        "action_name": action_name,
-        "data_collected": data.copy()
-    }
-    
-    # Обработка кнопок (инициируют сценарии)
-    if action_type == "button":
-        if action_name == "Уточнить возраст ребёнка":
-            fsm.set_state(tenant_id, channel, user_id, "Детские группы", "kids_need_age", {})
-            return (
-                "Для записи в детскую группу нам нужно знать возраст ребенка. Сколько лет вашему ребенку?",
-                "ask_age",
-                {**debug_info, "state_after": "kids_need_age", "rule_used": "kids: начать с возраста"}
-            )
-        elif action_name == "Рассчитать стоимость аренды":
-            fsm.set_state(tenant_id, channel, user_id, "Аренда зала", "rent_need_time", {})
-            return (
-                "Для расчета стоимости аренды зала мне нужно знать время. Аренда планируется до 16:00 или после?",
-                "calculate_rental",
-                {**debug_info, "state_after": "rent_need_time", "rule_used": "rent: начать с времени"}
-            )
-        elif action_name == "Записаться на пробное занятие":
-            fsm.set_state(tenant_id, channel, user_id, "Запись на занятие", "booking_need_direction", {})
-            directions = [d["name"] for d in dikidi_data.get("directions", [])]
-            directions_text = "\n".join([f"• {d}" for d in directions])
-            return (
-                f"Отлично! Мы предлагаем пробное занятие для новых учеников. Какое направление вас интересует?\n\n{directions_text}",
-                "book_trial",
-                {**debug_info, "state_after": "booking_need_direction", "rule_used": "booking: начать с направления"}
-            )
-        elif action_name == "Передать администратору":
-            fsm.clear_state(tenant_id, channel, user_id)
-            return (
-                "Ваш запрос передан администратору. В ближайшее время с вами свяжутся для уточнения деталей.",
-                "escalation",
-                {**debug_info, "state_after": "idle", "rule_used": "escalation"}
-            )
-        elif action_name == "Посмотреть расписание":
-            schedule_items = []
-            for item in dikidi_data.get("schedule", [])[:6]:
-                dir_name = next((d["name"] for d in dikidi_data.get("directions", []) if d["id"] == item["direction_id"]), item["direction_id"])
-                schedule_items.append(f"• {item['day']}, {item['time']} — {dir_name}")
-            schedule_text = "\n".join(schedule_items) if schedule_items else "Расписание временно недоступно"
-            return (
-                f"Расписание занятий:\n\n{schedule_text}\n\nХотите записаться на пробное занятие?",
-                "view_schedule",
-                {**debug_info, "state_after": "idle", "rule_used": "schedule: показ расписания"}
-            )
-    
-    # Обработка текстовых ответов (продолжение диалога)
-    if action_type == "text":
-        # Детские группы: обработка возраста
-        if state_before == "kids_need_age":
-            age = extract_age(text)
-            if age:
-                data["age"] = age
-                # Находим подходящие группы из stub
-                suitable_groups = [
-                    d for d in dikidi_data.get("directions", [])
-                    if d.get("age_min") is not None and d.get("age_max") is not None 
-                    and d["age_min"] <= age <= d["age_max"]
-                ]
-                
-                # Fallback маппинг по возрасту, если не найдено в stub
-                if not suitable_groups:
-                    if 7 <= age <= 11:
-                        # Создаем fallback группу для Dance Mix 7-11
-                        suitable_groups = [{
-                            "id": "dance_mix_7_11",
-                            "name": "Dance Mix 7-11",
-                            "age_min": 7,
-                            "age_max": 11,
-                            "price_per_month": 2800,
-                            "trial_price": 350,
-                            "group_limit": 12
-                        }]
-                    elif 3 <= age <= 5:
-                        suitable_groups = [{
-                            "id": "azbuka_3_5",
-                            "name": "Азбука танца 3-5",
-                            "age_min": 3,
-                            "age_max": 5,
-                            "price_per_month": 2500,
-                            "trial_price": 300,
-                            "group_limit": 10
-                        }]
-                    elif 12 <= age <= 17:
-                        suitable_groups = [{
-                            "id": "choreo_12_17",
-                            "name": "Choreo 12-17",
-                            "age_min": 12,
-                            "age_max": 17,
-                            "price_per_month": 3000,
-                            "trial_price": 400,
-                            "group_limit": 14
-                        }]
-                
-                if suitable_groups:
-                    group = suitable_groups[0]
-                    fsm.clear_state(tenant_id, channel, user_id)
-                    # Формируем короткий продуктовый ответ
-                    reply = f"Для возраста {age} лет подходит группа «{group['name']}».\n\n"
-                    reply += f"Лимит: {group.get('group_limit', 12)} человек.\n"
-                    reply += "Форма на занятии: удобная спортивная одежда. Можно записаться разово или по абонементу.\n\n"
-                    reply += "Записать на пробное или подобрать расписание?"
-                    return (
-                        reply,
-                        "children_groups_info",
-                        {**debug_info, "state_after": "idle", "rule_used": "kids: возраст -> группа", "data_collected": data}
-                    )
-                else:
-                    fsm.clear_state(tenant_id, channel, user_id)
-                    return (
-                        f"Для возраста {age} лет у нас пока нет подходящей группы. Обратитесь к администратору для уточнения.",
-                        "children_groups_info",
-                        {**debug_info, "state_after": "idle", "rule_used": "kids: нет подходящей группы"}
-                    )
-            else:
-                return (
-                    "Пожалуйста, укажите возраст ребенка числом (например, 8 лет).",
-                    "ask_age",
-                    {**debug_info, "state_after": "kids_need_age", "rule_used": "kids: неверный формат возраста"}
-                )
-        
-        # Аренда: обработка времени
-        elif state_before == "rent_need_time":
-            time_bucket = extract_rent_time_bucket(text)
-            if time_bucket:
-                data["rent_time_bucket"] = time_bucket
-                fsm.set_state(tenant_id, channel, user_id, "Аренда зала", "rent_need_people", data)
-                return (
-                    "Сколько человек планируется?",
-                    "calculate_rental",
-                    {**debug_info, "state_after": "rent_need_people", "rule_used": "rent: время -> количество людей", "data_collected": data}
-                )
-            else:
-                return (
-                    "Пожалуйста, укажите время: до 16:00 или после 16:00?",
-                    "calculate_rental",
-                    {**debug_info, "state_after": "rent_need_time", "rule_used": "rent: неверный формат времени"}
-                )
-        
-        # Аренда: обработка количества людей
-        elif state_before == "rent_need_people":
-            people_count = extract_people_count(text)
-            if people_count:
-                data["people_count"] = people_count
-                fsm.set_state(tenant_id, channel, user_id, "Аренда зала", "rent_need_format", data)
-                return (
-                    "Какой формат мероприятия? (тренировка, репетиция, фотосессия)",
-                    "calculate_rental",
-                    {**debug_info, "state_after": "rent_need_format", "rule_used": "rent: количество -> формат", "data_collected": data}
-                )
-            else:
-                return (
-                    "Пожалуйста, укажите количество человек числом (например, 12).",
-                    "calculate_rental",
-                    {**debug_info, "state_after": "rent_need_people", "rule_used": "rent: неверный формат количества"}
-                )
-        
-        # Аренда: обработка формата и расчет
-        elif state_before == "rent_need_format":
-            format_type = extract_rent_format(text)
-            if format_type:
-                data["format"] = format_type
-                people_count = data.get("people_count", 0)
-                
-                # Проверка лимитов
-                is_valid, error_msg = check_rent_limits(format_type, people_count)
-                if not is_valid:
-                    fsm.clear_state(tenant_id, channel, user_id)
-                    return (
-                        f"{error_msg}\n\nПожалуйста, измените формат или количество участников, либо обратитесь к администратору.",
-                        "calculate_rental",
-                        {**debug_info, "state_after": "idle", "rule_used": "rent: превышение лимита", "data_collected": data}
-                    )
-                
-                # Расчет цены
-                time_bucket = data.get("rent_time_bucket", "evening")
-                rental_data = dikidi_data.get("rental", {})
-                price, rule, message = calculate_rental_price(
-                    time_bucket, people_count, format_type, rental_data
-                )
-                
-                fsm.clear_state(tenant_id, channel, user_id)
-                return (
-                    message,
-                    "calculate_rental",
-                    {**debug_info, "state_after": "idle", "rule_used": rule, "data_collected": data}
-                )
-            else:
-                return (
-                    "Пожалуйста, укажите формат: тренировка, репетиция или фотосессия.",
-                    "calculate_rental",
-                    {**debug_info, "state_after": "rent_need_format", "rule_used": "rent: неверный формат"}
-                )
-        
-        # Запись: обработка направления
-        elif state_before == "booking_need_direction":
-            direction_id = extract_direction(text, dikidi_data.get("directions", []))
-            if direction_id:
-                data["direction"] = direction_id
-                direction = next((d for d in dikidi_data.get("directions", []) if d["id"] == direction_id), None)
-                if direction:
-                    # Показываем слоты для этого направления
-                    slots = [s for s in dikidi_data.get("schedule", []) if s["direction_id"] == direction_id]
-                    if slots:
-                        slots_text = "\n".join([f"• {s['day']}, {s['time']} — {direction['name']}" for s in slots[:3]])
-                        fsm.clear_state(tenant_id, channel, user_id)
-                        return (
-                            f"Отлично! Вы выбрали «{direction['name']}».\n\n"
-                            f"Доступные слоты:\n{slots_text}\n\n"
-                            f"Стоимость пробного занятия: {direction.get('trial_price', 0)} руб.",
-                            "book_trial",
-                            {**debug_info, "state_after": "idle", "rule_used": "booking: направление -> слоты", "data_collected": data}
-                        )
-                    else:
-                        fsm.clear_state(tenant_id, channel, user_id)
-                        return (
-                            f"Выбрано направление «{direction['name']}», но слоты временно недоступны. Обратитесь к администратору.",
-                            "book_trial",
-                            {**debug_info, "state_after": "idle", "rule_used": "booking: нет слотов"}
-                        )
-                else:
-                    return (
-                        "Не удалось найти это направление. Пожалуйста, выберите из списка.",
-                        "book_trial",
-                        {**debug_info, "state_after": "booking_need_direction", "rule_used": "booking: неверное направление"}
-                    )
-            else:
-                return (
-                    "Пожалуйста, выберите направление из предложенного списка.",
-                    "book_trial",
-                    {**debug_info, "state_after": "booking_need_direction", "rule_used": "booking: неверный формат"}
-                )
-    
-    # Если состояние idle или неизвестное - начинаем заново
-    if state_before == "idle" or not state_data:
-        if scenario == "Детские группы":
-            fsm.set_state(tenant_id, channel, user_id, scenario, "kids_need_age", {})
-            return (
-                "Для записи в детскую группу нам нужно знать возраст ребенка. Сколько лет вашему ребенку?",
-                "ask_age",
-                {**debug_info, "state_after": "kids_need_age", "rule_used": "kids: начало диалога"}
-            )
-        elif scenario == "Аренда зала":
-            fsm.set_state(tenant_id, channel, user_id, scenario, "rent_need_time", {})
-            return (
-                "Для расчета стоимости аренды зала мне нужно знать время. Аренда планируется до 16:00 или после?",
-                "calculate_rental",
-                {**debug_info, "state_after": "rent_need_time", "rule_used": "rent: начало диалога"}
-            )
-        elif scenario == "Запись на занятие":
-            fsm.set_state(tenant_id, channel, user_id, scenario, "booking_need_direction", {})
-            directions = [d["name"] for d in dikidi_data.get("directions", [])]
-            directions_text = "\n".join([f"• {d}" for d in directions])
-            return (
-                f"Отлично! Мы предлагаем пробное занятие для новых учеников. Какое направление вас интересует?\n\n{directions_text}",
-                "book_trial",
-                {**debug_info, "state_after": "booking_need_direction", "rule_used": "booking: начало диалога"}
-            )
-        else:
-            return (
-                "Спасибо за ваш вопрос! Как мы можем вам помочь?",
-                "general_inquiry",
-                {**debug_info, "state_after": "idle", "rule_used": "general"}
-            )
-    
-    # Неизвестное состояние
-    fsm.clear_state(tenant_id, channel, user_id)
-    return (
-        "Произошла ошибка. Начнем заново. Как мы можем вам помочь?",
-        "error",
-        {**debug_info, "state_after": "idle", "rule_used": "error: неизвестное состояние"}
-    )
+    catalog = as_catalog(dikidi_data)
+    pending = batch.users
+    raws = fsm.get_states_raw([turns.ids for turns in pending])
+    for _ in range(TRANSITION_ATTEMPTS):
+        errors = fsm.transition_many(batch.run(pending, raws, catalog, decide_turn))
+        pending, raws = batch.conflicts(pending, errors)
+        if not pending:
+            return
+    for turns in pending:
+        turns.fail(batch.results, 409, STALE_STATE_DETAIL)
+
+
+async def process_batch_async(batch: ChatBatch, dikidi_data=None):
+    """Обрабатывает пакет ходов через асинхронный FSM"""
+    fsm = get_async_fsm()
+    catalog = as_catalog(dikidi_data)
+    pending = batch.users
+    raws = await fsm.get_states_raw([turns.ids for turns in pending])
+    for _ in range(TRANSITION_ATTEMPTS):
+        errors = await fsm.transition_many(batch.run(pending, raws, catalog, decide_turn))
+        pending, raws = batch.conflicts(pending, errors)
+        if not pending:
+            return
+    for turns in pending:
+        turns.fail(batch.results, 409, STALE_STATE_DETAIL)
+
+
+def decide_turn(
+    scenario: str,
+    text: str,
+    action_type: str,
+    action_name: Optional[str],
+    session: Optional[SessionState],
+    catalog: CatalogSnapshot,
+    change: StateChange,
+    timings: Optional[Timings] = None,
+    lean: bool = False
+) -> tuple[str, str, dict]:
+    """
+    Вычисляет ответ на ход диалога без обращения к Redis.
+    Новое состояние записывается в change.
+    Возвращает (reply, intent, debug_info)
+    """
+    return dialog_engine.run(scenario, text, action_type, action_name, session, catalog, change, timings, lean)
 
 
 @app.get("/health")
@@ -432,18 +447,29 @@ async def health():
     }
 
 
+@app.get("/ready")
+async def ready():
+    """Готовность к трафику: 200 после прогрева, до этого 503 с шагами"""
+    readiness = get_readiness()
+    return JSONResponse(readiness.as_dict(), status_code=200 if readiness.ready else 503)
+
+
 @app.get("/dikidi")
-async def get_dikidi():
-    """Возвращает весь DIKIDI stub"""
-    return load_dikidi_stub()
+async def get_dikidi(tenant_id: Optional[str] = None):
+    """Возвращает весь DIKIDI stub (или каталог тенанта)"""
+    catalog = get_catalog() if tenant_id is None else await get_tenant_catalog(tenant_id)
+    # Снимок неизменяем: тело кодируется один раз на версию каталога
+    return Response(catalog.rendered("dikidi_json", encode_catalog), media_type="application/json")
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    """Обрабатывает запросы чата через FSM"""
-    dikidi_data = load_dikidi_stub()
-    
-    reply, intent, debug_info = process_state_machine(
+async def run_turn(request: ChatRequest, catalog: Optional[CatalogSnapshot] = None,
+                   timings: Optional[Timings] = None, lean: bool = False) -> tuple[str, str, dict]:
+    """Выполняет один ход через установленный FSM, не блокируя event loop"""
+    if catalog is None:
+        catalog = await get_tenant_catalog(request.tenant_id)
+    if timings is not None:
+        timings.mark("catalog")
+    args = (
         request.scenario,
         request.text,
         request.action_type,
@@ -451,22 +477,294 @@ async def chat(request: ChatRequest):
         request.tenant_id,
         request.channel,
         request.user_id,
-        dikidi_data
+        catalog,
+        timings,
+        lean
     )
-    
-    # Добавляем state_after в debug
-    if "state_after" not in debug_info:
-        state_data = fsm.get_state(request.tenant_id, request.channel, request.user_id)
-        debug_info["state_after"] = state_data.get("state") if state_data else "idle"
-    
-    return ChatResponse(
-        reply=reply,
-        intent=intent,
-        version=PRODUCT_VERSION,
-        debug=debug_info
+    if uses_sync_fsm():
+        # Синхронный клиент Redis не должен блокировать event loop
+        return await run_in_threadpool(process_state_machine, *args)
+    return await process_state_machine_async(*args)
+
+
+def is_lean(request: ChatRequest) -> bool:
+    """Легкий режим ответа: явно в запросе, иначе по каналу и RESPONSE_MODE"""
+    if request.response_mode is not None:
+        return request.response_mode == "lean"
+    return request.channel in LEAN_CHANNELS or RESPONSE_MODE == "lean"
+
+
+def lean_response(reply: str, intent: str) -> Response:
+    """Ответ легкого режима: только reply/intent/version без модели и debug"""
+    return FastJSONResponse({"reply": reply, "intent": intent, "version": PRODUCT_VERSION})
+
+
+def batch_item(status: int, result: Optional[tuple] = None, error: Optional[str] = None) -> ChatBatchItem:
+    """Элемент ответа пакетных эндпоинтов"""
+    response = None
+    if result is not None:
+        reply, intent, debug_info = result
+        record_turn(intent, debug_info)
+        response = ChatResponse(reply=reply, intent=intent, version=PRODUCT_VERSION, debug=debug_info)
+    return ChatBatchItem(status=status, response=response, error=error)
+
+
+@app.post("/rental/quote", response_model=RentalQuoteResponse)
+async def rental_quote(request: RentalQuoteRequest):
+    """
+    Рассчитывает стоимость аренды для набора комбинаций за один вызов:
+    элементы items, затем все комбинации grid.
+    """
+    combos = [(item.time_bucket, item.people_count, item.format, item.hours) for item in request.items]
+    if request.grid is not None:
+        grid = request.grid
+        size = len(grid.time_buckets) * len(grid.people_counts) * len(grid.formats) * len(grid.hours)
+        if len(combos) + size > RENTAL_QUOTE_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Не более {RENTAL_QUOTE_MAX_ITEMS} комбинаций")
+        combos += [(time_bucket, people, format_type, hours)
+                   for time_bucket in grid.time_buckets
+                   for people in grid.people_counts
+                   for format_type in grid.formats
+                   for hours in grid.hours]
+    if len(combos) > RENTAL_QUOTE_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Не более {RENTAL_QUOTE_MAX_ITEMS} комбинаций")
+
+    catalog = await get_tenant_catalog(request.tenant_id)
+    quotes = catalog.pricing.quote_many(combos)
+    return RentalQuoteResponse(
+        catalog_version=catalog.version,
+        quotes=[
+            RentalQuote(time_bucket=combo[0], people_count=combo[1], format=combo[2], hours=combo[3],
+                        price_per_hour=quote.price_per_hour, total=quote.total, rule=quote.rule,
+                        valid=quote.valid, error=quote.error)
+            for combo, quote in zip(combos, quotes)
+        ]
     )
 
 
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest, http_request: Request):
+    """
+    Обрабатывает запросы чата через FSM.
+    С X-Debug-Timings: 1 или ?timings=1 в debug.timings_us — время по фазам.
+    В легком режиме (response_mode="lean" или канал из LEAN_CHANNELS)
+    debug не собирается, ответ — только reply/intent/version.
+    """
+    timings = None
+    if wants_timings(http_request.headers, http_request.query_params):
+        # Фаза validation: от входа в приложение (чтение тела, JSON, Pydantic) до эндпоинта
+        timings = Timings(getattr(http_request.state, "started_ns", None))
+        timings.mark("validation")
+    lean = timings is None and is_lean(request)
+    try:
+        reply, intent, debug_info = await run_turn(request, timings=timings, lean=lean)
+    except StaleStateError:
+        raise HTTPException(status_code=409, detail=STALE_STATE_DETAIL)
+    
+    http_request.state.metrics_labels = (request.scenario, debug_info["state_before"])
+    record_turn(intent, debug_info)
+    if lean:
+        return lean_response(reply, intent)
+    # Тело ChatResponse собирается словарем: без валидации модели и jsonable_encoder
+    content = {"reply": reply, "intent": intent, "version": PRODUCT_VERSION, "debug": debug_info}
+    if timings is None:
+        return FastJSONResponse(content)
+    serialization.dumps(content)
+    timings.mark("serialize")
+    debug_info["timings_us"] = timings.as_dict()
+    return FastJSONResponse(content)
+
+
+@app.post("/chat/batch", response_model=List[ChatBatchItem])
+async def chat_batch(items: List[Any] = Body(...)):
+    """
+    Обрабатывает пакет ходов разных пользователей.
+    Ответы возвращаются в порядке запросов, ошибки — по каждому элементу;
+    ходы одного пользователя применяются по порядку.
+    """
+    if len(items) > CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Не более {CHAT_BATCH_MAX_ITEMS} элементов в пакете")
+
+    batch = ChatBatch(len(items))
+    for index, item in enumerate(items):
+        try:
+            batch.add(index, ChatRequest.model_validate(item))
+        except ValidationError as e:
+            batch.reject(index, 422, str(e))
+
+    catalog = get_catalog()
+    for tenant_id in batch.tenants:
+        batch.catalogs[tenant_id] = await get_tenant_catalog(tenant_id)
+    if uses_sync_fsm():
+        await run_in_threadpool(process_batch, batch, catalog)
+    else:
+        await process_batch_async(batch, catalog)
+
+    return [batch_item(item.status, item.result, item.error) for item in batch.results]
+
+
+@app.post("/chat/ingest")
+async def chat_ingest(request: Request):
+    """
+    Принимает поток сообщений в формате NDJSON (один ChatRequest на строку).
+    Сообщения одного пользователя обрабатываются по порядку, разных — параллельно.
+    Ответ — NDJSON с элементами как у /chat/batch, в порядке строк запроса;
+    строки отдаются по мере готовности, пока тело еще читается.
+    Строка длиннее INGEST_MAX_LINE_BYTES получает элемент со статусом 413.
+    """
+    queue = get_ingest_queue()
+    # Принятые, но еще не отданные строки: при заполнении чтение тела ждет
+    pending: asyncio.Queue = asyncio.Queue(maxsize=INGEST_MAX_INFLIGHT)
+
+    async def produce():
+        try:
+            async for line in iter_ndjson(request.stream(), INGEST_MAX_LINE_BYTES):
+                if isinstance(line, LineTooLong):
+                    await pending.put(batch_item(413, error=str(line)))
+                    continue
+                try:
+                    turn = ChatRequest.model_validate(json.loads(line))
+                except ValueError as e:  # в т.ч. UnicodeDecodeError
+                    await pending.put(batch_item(422, error=str(e)))
+                    continue
+                # submit ждет, пока в очереди шарда есть место
+                await pending.put(await queue.submit(turn))
+        except Exception as e:
+            await pending.put(e)
+        else:
+            await pending.put(None)
+
+    async def results():
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await pending.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                if isinstance(item, asyncio.Future):
+                    item = await ingest_result(item)
+                yield item.model_dump_json() + "\n"
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    return DuplexStreamingResponse(results(), media_type="application/x-ndjson")
+
+
+async def ingest_result(future: asyncio.Future) -> ChatBatchItem:
+    try:
+        return batch_item(200, await future)
+    except StaleStateError:
+        return batch_item(409, error=STALE_STATE_DETAIL)
+    except Exception as e:
+        return batch_item(500, error=str(e) or type(e).__name__)
+
+
+@app.websocket("/chat/ws")
+async def chat_ws(websocket: WebSocket, tenant_id: str = "studio_nexa", channel: str = "simulator",
+                  user_id: str = "test_user", scenario: Optional[str] = None,
+                  response_mode: Optional[Literal["full", "lean"]] = None):
+    """
+    Постоянная сессия чата. Тенант, канал, пользователь и сценарий по
+    умолчанию задаются параметрами подключения и проверяются один раз;
+    кадр — JSON ChatFrame (text, action_type, action_name, необязательные
+    scenario и id). Кадры обрабатываются по порядку, ответ — как у /chat
+    плюс id кадра; ошибка кадра — {"id", "status", "error"}, соединение
+    при этом не закрывается.
+    """
+    session = ChatRequest(tenant_id=tenant_id, channel=channel, user_id=user_id, text="",
+                          scenario=scenario or "", action_type="text", response_mode=response_mode)
+    lean = is_lean(session)
+    await websocket.accept()
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        content = await ws_turn(session, message.get("text") or message.get("bytes") or "", lean)
+        await websocket.send_text(serialization.dumps_str(content))
+
+
+async def ws_turn(session: ChatRequest, raw, lean: bool) -> dict:
+    """Ход по кадру /chat/ws в сессии session"""
+    started = time.perf_counter_ns()
+    try:
+        frame = ChatFrame.model_validate_json(raw)
+    except ValidationError as e:
+        return {"id": None, "status": 422, "error": str(e)}
+    scenario = frame.scenario or session.scenario
+    if not scenario:
+        return {"id": frame.id, "status": 422, "error": "Не задан сценарий: в кадре или при подключении"}
+    # Поля кадра уже проверены, личность сессии — при подключении
+    request = session.model_copy(update={"text": frame.text, "scenario": scenario,
+                                         "action_type": frame.action_type, "action_name": frame.action_name})
+    try:
+        reply, intent, debug_info = await run_turn(request, lean=lean)
+    except StaleStateError:
+        return {"id": frame.id, "status": 409, "error": STALE_STATE_DETAIL}
+    except Exception as e:
+        return {"id": frame.id, "status": 500, "error": str(e) or type(e).__name__}
+    observe_request("/chat/ws", scenario, debug_info["state_before"], started)
+    record_turn(intent, debug_info)
+    content = {"reply": reply, "intent": intent, "version": PRODUCT_VERSION}
+    if not lean:
+        content["debug"] = debug_info
+    if frame.id is not None:
+        content["id"] = frame.id
+    return content
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+def check_admin(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Админ-эндпоинты выключены: задайте ADMIN_TOKEN")
+    if token is None or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Неверный X-Admin-Token")
+
+
+@app.post("/admin/profile")
+async def admin_profile(seconds: float = 5.0, interval_ms: float = 5.0, limit: int = 50,
+                        x_admin_token: Optional[str] = Header(None)):
+    """
+    Сэмплирующий профилировщик живого трафика: seconds секунд снимает стеки
+    всех потоков раз в interval_ms и возвращает самые частые стеки и функции.
+    """
+    check_admin(x_admin_token)
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or not 0.5 <= interval_ms <= 1000:
+        raise HTTPException(status_code=422, detail=f"seconds в (0, {PROFILE_MAX_SECONDS:g}], interval_ms в [0.5, 1000]")
+    if profiler.busy:
+        raise HTTPException(status_code=409, detail="Профилирование уже идет")
+    try:
+        return await asyncio.to_thread(profiler.run, seconds, interval_ms / 1000, limit)
+    except RuntimeError:
+        raise HTTPException(status_code=409, detail="Профилирование уже идет")
+
+
+@app.get("/ingest/stats")
+async def ingest_stats():
+    """Глубина очередей шардов и счетчики очереди приема"""
+    return get_ingest_queue().stats()
+
+
+@app.get("/store/stats")
+async def store_stats():
+    """Выключатель Redis, вызовы в режиме отказа и несверенные записи"""
+    fsm = get_fsm() if uses_sync_fsm() else get_async_fsm()
+    return fsm.store_stats()
+
+
+@app.get("/tenants/stats")
+async def tenants_stats():
+    """Попадания, загрузки и вытеснения LRU каталогов тенантов"""
+    return get_tenant_catalogs().stats()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,298 @@
+"""
+Метрики оркестратора в текстовом формате Prometheus (GET /metrics).
+
+Сбор рассчитан на горячий путь: дочерние серии меток создаются заранее
+для известных значений (сценарии, состояния, операции FSM), неизвестные
+значения сводятся к "other", а запись — это поиск готовой серии в словаре
+и инкремент поля без блокировок. Под GIL инкремент может потеряться только
+при переключении потока посреди операции; для метрик это допустимо.
+Блокировка берется лишь при первом появлении значения свободной метки
+(правила, интенты), число таких серий ограничено.
+"""
+import itertools
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.session import SCENARIOS, STATES
+
+OTHER = "other"
+
+# Границы корзин, секунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+REDIS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+LOAD_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# Операции FSM, для которых меряется round trip Redis
+REDIS_OPS = ("get", "mget", "transition", "transition_many", "set", "delete", "reconcile", "publish")
+
+LabelValues = Optional[Sequence[str]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последняя — +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    """
+    Метрика с фиксированным набором меток.
+
+    allowed — для каждой метки кортеж известных значений (серии создаются
+    сразу, остальные значения сводятся к "other") или None для свободной
+    метки: ее серии создаются при первом появлении, не больше max_series.
+    """
+
+    kind = ""
+    family_suffix = ""
+    child_class = CounterChild
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 allowed: Optional[Sequence[LabelValues]] = None, max_series: int = 1000):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.allowed = tuple(
+            None if values is None else frozenset(values) | {OTHER}
+            for values in (allowed or (None,) * len(self.labelnames))
+        )
+        self.max_series = max_series
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        fixed = [sorted(values) if values is not None else None for values in self.allowed]
+        if all(values is not None for values in fixed):
+            for combo in itertools.product(*fixed):
+                self._children[combo] = self._new_child()
+
+    def _new_child(self):
+        return self.child_class()
+
+    def labels(self, *values: str):
+        """Серия для значений меток; без создания объектов на известных значениях"""
+        child = self._children.get(values)
+        if child is not None:
+            return child
+        return self._slow_labels(values)
+
+    def _slow_labels(self, values: Tuple[str, ...]):
+        key = tuple(
+            value if allowed is None or value in allowed else OTHER
+            for value, allowed in zip(values, self.allowed)
+        )
+        child = self._children.get(key)
+        if child is not None:
+            return child
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                if len(self._children) >= self.max_series:
+                    key = tuple(OTHER for _ in key)
+                    child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        # Имя семейства в HELP/TYPE совпадает с именем серий (у счетчика — с _total)
+        family = self.name + self.family_suffix
+        lines = [f"# HELP {family} {self.documentation}", f"# TYPE {family} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{family}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+    family_suffix = "_total"
+    child_class = CounterChild
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield "", _format_labels(self.labelnames, values), child.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    child_class = GaugeChild
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield "", _format_labels(self.labelnames, values), child.value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 allowed: Optional[Sequence[LabelValues]] = None,
+                 buckets: Sequence[float] = LATENCY_BUCKETS, max_series: int = 1000):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, allowed, max_series)
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def samples(self):
+        bounds = self.buckets + (float("inf"),)
+        for values, child in sorted(self._children.items()):
+            counts = list(child.counts)  # снимок: серия могла измениться во время обхода
+            if not any(counts):
+                continue
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield "_bucket", _format_labels(self.labelnames, values, le), cumulative
+            yield "_count", _format_labels(self.labelnames, values), cumulative
+            yield "_sum", _format_labels(self.labelnames, values), child.sum
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_STATE_LABELS = STATES + ("",)
+_SCENARIO_LABELS = SCENARIOS + ("",)
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "orchestrator_request_duration_seconds",
+    "Длительность HTTP-запросов по эндпоинту, сценарию и состоянию до хода",
+    ("endpoint", "scenario", "state_before"),
+    allowed=(None, _SCENARIO_LABELS, _STATE_LABELS),
+    max_series=5000,
+))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "orchestrator_requests_in_flight", "Запросы, обрабатываемые сейчас"))
+REDIS_LATENCY = REGISTRY.register(Histogram(
+    "orchestrator_redis_duration_seconds",
+    "Round trip Redis по операции FSM (с повторами)",
+    ("operation",), allowed=(REDIS_OPS,), buckets=REDIS_BUCKETS,
+))
+RULES = REGISTRY.register(Counter(
+    "orchestrator_rule_used", "Ходы диалога по сработавшему правилу", ("rule",), max_series=500))
+INTENTS = REGISTRY.register(Counter(
+    "orchestrator_intent", "Ходы диалога по интенту", ("intent",), max_series=200))
+CATALOG_LOAD = REGISTRY.register(Histogram(
+    "orchestrator_catalog_load_seconds", "Разбор и сборка снимка каталога", buckets=LOAD_BUCKETS))
+
+_in_flight = REQUESTS_IN_FLIGHT.labels()
+_catalog_load = CATALOG_LOAD.labels()
+_redis_children = {op: REDIS_LATENCY.labels(op) for op in REDIS_OPS}
+
+
+def observe_redis(op: str, started: float):
+    """Время операции Redis от started (time.perf_counter())"""
+    _redis_children[op].observe(time.perf_counter() - started)
+
+
+def observe_request(endpoint: str, scenario: str, state_before: str, started_ns: int):
+    """Длительность запроса (или кадра WebSocket) от started_ns (time.perf_counter_ns())"""
+    REQUEST_LATENCY.labels(endpoint, scenario, state_before).observe((time.perf_counter_ns() - started_ns) / 1e9)
+
+
+def observe_catalog_load(seconds: float):
+    _catalog_load.observe(seconds)
+
+
+def record_turn(intent: str, debug: dict):
+    """Счетчики правила и интента хода"""
+    INTENTS.labels(intent).inc()
+    RULES.labels(debug.get("rule_used") or "").inc()
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: запросы в работе и длительность по эндпоинту.
+    Сценарий и состояние эндпоинт кладет в request.state.metrics_labels.
+    """
+
+    def __init__(self, app, paths: Optional[Iterable[str]] = None):
+        self.app = app
+        self.paths = frozenset(paths) if paths is not None else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        if self.paths is None:
+            self.paths = frozenset(route.path for route in getattr(scope.get("app"), "routes", ()))
+        endpoint = path if path in self.paths else OTHER
+        state = scope.setdefault("state", {})
+        _in_flight.value += 1
+        # Начало запроса нужно и разбивке по фазам (request.state.started_ns)
+        state["started_ns"] = started = time.perf_counter_ns()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _in_flight.value -= 1
+            observe_request(endpoint, *state.get("metrics_labels", ("", "")), started)
@@ -0,0 +1,280 @@
+"""
+Расчет стоимости аренды зала.
+
+Правила аренды из каталога (rental.rules и rental.prices) компилируются
+при загрузке снимка в плоскую таблицу цен: расчет одной цены — это
+вычисление индекса (опт, время, группа по людям, формат) и чтение
+элемента кортежа.
+
+Формат rental.prices:
+
+    {
+      "before_16_00": {"up_to_10_people": {"training": 900, ...},
+                       "more_than_10_people": 1100},
+      "after_16_00": {...},
+      "bulk": {"up_to_10_people": 700, "more_than_10_people": 1100}
+    }
+
+Ключи времени и групп строятся из rules.time_cutoff и rules.people_cutoff.
+Значение ячейки — цена для всех форматов или словарь цен по форматам
+(ключ "default" — цена для остальных форматов).
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Правила по умолчанию (требования v0.1.1), если в каталоге их нет
+DEFAULT_RULES: Dict[str, Any] = {
+    "prepayment_percent": 50,
+    "min_booking_hours": 12,
+    "time_cutoff": "16:00",
+    "people_cutoff": 10,
+    "bulk_min_hours": 8,
+    "format_limits": {
+        "training": 15,  # занятие
+        "rehearsal": 30,  # коврики/пол
+        "photo_session": 10,  # лаундж
+        "party": 45  # вечеринка
+    },
+    "default_format_limit": 30,
+}
+
+DEFAULT_PRICES: Dict[str, Dict[str, Any]] = {
+    "before_16_00": {"up_to_10_people": 900, "more_than_10_people": 1100},
+    "after_16_00": {"up_to_10_people": 1300, "more_than_10_people": 1500},
+    "bulk": {"up_to_10_people": 700, "more_than_10_people": 1100},
+}
+
+TIME_BUCKETS = ("daytime", "evening")
+_OTHER_FORMAT = "default"
+
+
+class PricingError(ValueError):
+    """Ошибка в правилах аренды каталога"""
+
+
+@dataclass(frozen=True, slots=True)
+class Quote:
+    """Расчет стоимости аренды для одной комбинации параметров"""
+
+    price_per_hour: Optional[int]
+    total: Optional[int]
+    rule: Optional[str]
+    bulk: bool
+    valid: bool
+    error: Optional[str] = None
+
+
+def _cutoff_minutes(value: str) -> int:
+    """"ЧЧ:ММ" -> минуты от начала суток"""
+    try:
+        hours, _, minutes = value.partition(":")
+        hours, minutes = int(hours), int(minutes or 0)
+    except (AttributeError, ValueError):
+        raise PricingError(f"некорректное время '{value}'") from None
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise PricingError(f"некорректное время '{value}'")
+    return hours * 60 + minutes
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _check_rules(rules: Dict[str, Any]):
+    """Типы и границы rental.rules; ошибки — PricingError, а не падение при загрузке"""
+    for name, minimum in (("people_cutoff", 0), ("bulk_min_hours", 1), ("default_format_limit", 1)):
+        if not _is_int(rules[name]) or rules[name] < minimum:
+            raise PricingError(f"{name} должен быть целым числом не меньше {minimum}")
+    for name in ("prepayment_percent", "min_booking_hours"):
+        value = rules[name]
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+            raise PricingError(f"{name} должен быть неотрицательным числом")
+    try:
+        _cutoff_minutes(rules["time_cutoff"])
+    except PricingError as e:
+        raise PricingError(f"time_cutoff: {e}") from None
+    limits = rules["format_limits"]
+    if not isinstance(limits, dict):
+        raise PricingError("format_limits должен быть объектом")
+    for name, limit in limits.items():
+        if not _is_int(limit) or limit < 1:
+            raise PricingError(f"format_limits.{name} должен быть целым числом не меньше 1")
+
+
+class RentalPricing:
+    """Скомпилированная таблица цен аренды одного снимка каталога"""
+
+    __slots__ = ("formats", "format_index", "table", "rules", "limits", "default_limit",
+                 "people_cutoff", "cutoff_minutes", "bulk_min_hours",
+                 "prepayment_percent", "min_booking_hours", "_buckets")
+
+    def __init__(self, formats: Tuple[str, ...], table: Tuple[Optional[int], ...],
+                 rules: Tuple[str, ...], rental_rules: Dict[str, Any]):
+        self.formats = formats
+        # Последний индекс — форматы, которых нет в списке
+        self.format_index = {name: i for i, name in enumerate(formats)}
+        self.table = table
+        self.rules = rules
+        self.limits: Dict[str, int] = dict(rental_rules["format_limits"])
+        self.default_limit: int = rental_rules["default_format_limit"]
+        self.people_cutoff: int = rental_rules["people_cutoff"]
+        self.cutoff_minutes = _cutoff_minutes(rental_rules["time_cutoff"])
+        self.bulk_min_hours: int = rental_rules["bulk_min_hours"]
+        self.prepayment_percent = rental_rules["prepayment_percent"]
+        self.min_booking_hours = rental_rules["min_booking_hours"]
+        self._buckets = {name: i for i, name in enumerate(TIME_BUCKETS)}
+
+    @classmethod
+    def compile(cls, rental: Optional[dict]) -> "RentalPricing":
+        """Компилирует rental каталога; без rental.prices — цены по умолчанию"""
+        rental = rental or {}
+        if not isinstance(rental, dict):
+            raise PricingError("rental должен быть объектом")
+        rules = rental.get("rules", {})
+        if not isinstance(rules, dict):
+            raise PricingError("rental.rules должен быть объектом")
+        rental_rules = {**DEFAULT_RULES, **rules}
+        _check_rules(rental_rules)
+        prices = rental.get("prices") or DEFAULT_PRICES
+        if not isinstance(prices, dict):
+            raise PricingError("rental.prices должен быть объектом")
+        formats = rental.get("formats", [])
+        if not isinstance(formats, list) or not all(isinstance(name, str) for name in formats):
+            raise PricingError("rental.formats должен быть списком строк")
+
+        cutoff = rental_rules["people_cutoff"]
+        time_suffix = rental_rules["time_cutoff"].replace(":", "_")
+        time_keys = (f"before_{time_suffix}", f"after_{time_suffix}")
+        group_keys = (f"up_to_{cutoff}_people", f"more_than_{cutoff}_people")
+
+        formats = list(formats)
+        for section in prices.values():
+            for cell in (section.values() if isinstance(section, dict) else ()):
+                if isinstance(cell, dict):
+                    formats += [name for name in cell if name != _OTHER_FORMAT]
+        formats += list(rental_rules["format_limits"])
+        formats = tuple(dict.fromkeys(formats))
+
+        # Порядок индекса: (опт, время, группа, формат); опт не зависит от времени
+        table: List[Optional[int]] = []
+        rules: List[str] = []
+        for bulk in (False, True):
+            for bucket, time_key in enumerate(time_keys):
+                section_key = "bulk" if bulk else time_key
+                section = prices.get(section_key, {})
+                if not isinstance(section, dict):
+                    raise PricingError(f"rental.prices.{section_key} должен быть объектом")
+                for group, group_key in enumerate(group_keys):
+                    cell = section.get(group_key)
+                    prefix = "bulk" if bulk else TIME_BUCKETS[bucket]
+                    rules.append(f"{prefix}_{'up_to' if group == 0 else 'more_than'}_{cutoff}")
+                    for name in formats + (_OTHER_FORMAT,):
+                        table.append(cls._cell_price(cell, name, f"{section_key}.{group_key}"))
+        return cls(formats, tuple(table), tuple(rules), rental_rules)
+
+    @staticmethod
+    def _cell_price(cell: Any, format_name: str, path: str) -> Optional[int]:
+        if isinstance(cell, dict):
+            cell = cell.get(format_name, cell.get(_OTHER_FORMAT))
+        if cell is None:
+            return None
+        if not isinstance(cell, (int, float)) or isinstance(cell, bool) or cell < 0:
+            raise PricingError(f"rental.prices.{path}: цена должна быть неотрицательным числом")
+        return int(cell)
+
+    def bucket_index(self, time_bucket: str) -> Optional[int]:
+        """daytime/evening или время начала "ЧЧ:ММ"; иное — None"""
+        index = self._buckets.get(time_bucket)
+        if index is not None:
+            return index
+        try:
+            return 0 if _cutoff_minutes(time_bucket) < self.cutoff_minutes else 1
+        except PricingError:
+            return None
+
+    def limit_for(self, format_type: str) -> int:
+        return self.limits.get(format_type, self.default_limit)
+
+    def check_limits(self, format_type: str, people_count: int) -> Tuple[bool, Optional[str]]:
+        """Проверяет лимит участников формата"""
+        limit = self.limit_for(format_type)
+        if people_count > limit:
+            return False, f"Для формата '{format_type}' максимальное количество участников: {limit}. У вас указано {people_count}."
+        return True, None
+
+    def quote(self, time_bucket: str, people_count: int, format_type: str,
+              hours: Optional[int] = None) -> Quote:
+        """Стоимость одной комбинации: O(1) чтение из таблицы"""
+        return self.quote_many(((time_bucket, people_count, format_type, hours),))[0]
+
+    def quote_many(self, requests: Iterable[tuple]) -> List[Quote]:
+        """
+        Стоимость для набора (time_bucket, people_count, format, hours).
+        Все правила разрешены при компиляции, в цикле только индексы.
+        """
+        table, rules = self.table, self.rules
+        format_index, other = self.format_index, len(self.formats)
+        width = other + 1
+        bucket_index, limit_for = self.bucket_index, self.limit_for
+        cutoff, bulk_min_hours = self.people_cutoff, self.bulk_min_hours
+
+        quotes = []
+        for time_bucket, people_count, format_type, hours in requests:
+            bulk = hours is not None and hours >= bulk_min_hours
+            bucket = bucket_index(time_bucket)
+            if bucket is None:
+                error = f"Неизвестное время '{time_bucket}': ожидается daytime, evening или ЧЧ:ММ"
+                quotes.append(Quote(None, None, None, bulk, False, error))
+                continue
+            row = ((bulk * 2 + bucket) * 2 + (people_count > cutoff))
+            price = table[row * width + format_index.get(format_type, other)]
+            if price is None:
+                quotes.append(Quote(None, None, None, bulk, False, f"нет цены для формата '{format_type}'"))
+                continue
+            total = price * hours if hours else None
+            limit = limit_for(format_type)
+            if people_count > limit:
+                error = f"Для формата '{format_type}' максимальное количество участников: {limit}. У вас указано {people_count}."
+                quotes.append(Quote(price, total, rules[row], bulk, False, error))
+            else:
+                quotes.append(Quote(price, total, rules[row], bulk, True))
+        return quotes
+
+    def message(self, quote: Quote, hours: Optional[int] = None) -> str:
+        """Текст ответа с ценой, как в диалоге аренды"""
+        if quote.bulk:
+            message = (f"Стоимость аренды: {quote.price_per_hour} руб/час "
+                       f"(оптовая цена при аренде от {self.bulk_min_hours} часов).")
+        else:
+            message = f"Стоимость аренды: {quote.price_per_hour} руб/час."
+        if hours and quote.total is not None:
+            message += f"\nИтого за {hours} ч: {quote.total} руб."
+        message += f"\n\nПредоплата: {self.prepayment_percent}%\nБронь минимум за {self.min_booking_hours} часов."
+        return message
+
+
+_default_pricing: Optional[RentalPricing] = None
+
+
+def default_pricing() -> RentalPricing:
+    """Таблица по правилам по умолчанию (для вызовов без каталога)"""
+    global _default_pricing
+    if _default_pricing is None:
+        _default_pricing = RentalPricing.compile(None)
+    return _default_pricing
+
+
+def calculate_rental_price(
+    time_bucket: str,
+    people_count: int,
+    format_type: str,
+    rental_data: dict,
+    hours: Optional[int] = None
+) -> tuple[int, str, str]:
+    """
+    Рассчитывает стоимость аренды по правилам rental_data.
+    Возвращает (цена, правило, сообщение)
+    """
+    pricing = RentalPricing.compile(rental_data)
+    quote = pricing.quote(time_bucket, people_count, format_type, hours)
+    return quote.price_per_hour, quote.rule, pricing.message(quote, hours)
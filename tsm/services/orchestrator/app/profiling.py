@@ -0,0 +1,132 @@
+"""
+Диагностика медленных запросов.
+
+Разбивка по фазам включается на один запрос заголовком `X-Debug-Timings: 1`
+или параметром `?timings=1`: тогда по пути запроса передается объект
+Timings, и в debug ответа появляется `timings_us`. Без флага передается
+None, и код фаз сводится к одной проверке на None.
+
+Сэмплирующий профилировщик (POST /admin/profile) в течение N секунд
+снимает стеки всех потоков процесса через sys._current_frames() и
+возвращает агрегированные стеки живого трафика.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+TIMINGS_HEADER = "x-debug-timings"
+TIMINGS_QUERY = "timings"
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+
+class Timings:
+    """Длительности фаз одного запроса, perf_counter_ns"""
+
+    __slots__ = ("phases", "_start", "_last")
+
+    def __init__(self, started_ns: Optional[int] = None):
+        self.phases: Dict[str, int] = {}
+        self._start = self._last = started_ns if started_ns is not None else time.perf_counter_ns()
+
+    def mark(self, phase: str):
+        """Закрывает фазу: время от предыдущей отметки"""
+        now = time.perf_counter_ns()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self._last
+        self._last = now
+
+    def add(self, phase: str, started_ns: int):
+        """Вложенная фаза от started_ns; отметку mark() не сдвигает"""
+        self.phases[phase] = self.phases.get(phase, 0) + time.perf_counter_ns() - started_ns
+
+    def as_dict(self) -> Dict[str, float]:
+        """Фазы в микросекундах; total — от начала до последней отметки"""
+        result = {phase: round(ns / 1000, 1) for phase, ns in self.phases.items()}
+        result["total"] = round((self._last - self._start) / 1000, 1)
+        return result
+
+
+def wants_timings(headers, query_params) -> bool:
+    flag = headers.get(TIMINGS_HEADER) or query_params.get(TIMINGS_QUERY)
+    return flag is not None and flag.lower() in ("1", "true", "yes")
+
+
+class SamplingProfiler:
+    """
+    Профилировщик живого трафика: фоновый поток раз в interval секунд
+    снимает стеки остальных потоков. Одновременно идет один сеанс.
+    """
+
+    def __init__(self):
+        self._running = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._running.locked()
+
+    def run(self, seconds: float, interval: float = 0.005, limit: int = 50,
+            include_idle: bool = False) -> dict:
+        """Блокирует вызывающий поток на seconds; вызывать из потока, не из event loop"""
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("профилирование уже идет")
+        try:
+            return self._sample(seconds, interval, limit, include_idle)
+        finally:
+            self._running.release()
+
+    def _sample(self, seconds: float, interval: float, limit: int, include_idle: bool) -> dict:
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks: Counter = Counter()
+        functions: Counter = Counter()
+        samples = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = _stack(frame)
+                if not include_idle and _is_idle(stack):
+                    continue
+                stacks[(names.get(ident, str(ident)),) + stack] += 1
+                functions[stack[-1]] += 1
+            samples += 1
+            time.sleep(interval)
+
+        total = sum(stacks.values())
+        return {
+            "seconds": seconds,
+            "interval_ms": interval * 1000,
+            "samples": samples,
+            "stack_samples": total,
+            "top_functions": [
+                {"function": name, "samples": count, "share": round(count / total, 4)}
+                for name, count in functions.most_common(limit)
+            ],
+            # Формат collapsed stacks: "поток;внешний;...;внутренний N" (flamegraph.pl, speedscope)
+            "collapsed": [f"{';'.join(stack)} {count}" for stack, count in stacks.most_common(limit)],
+        }
+
+
+def _stack(frame) -> tuple:
+    frames: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    frames.reverse()
+    return tuple(frames)
+
+
+# Верхушки стеков простаивающих потоков: ожидание событий и блокировок
+_IDLE_FUNCTIONS = frozenset(("select", "poll", "wait", "_worker", "sleep", "accept"))
+
+
+def _is_idle(stack: tuple) -> bool:
+    name = stack[-1].split(":")[1] if stack else ""
+    return name in _IDLE_FUNCTIONS
+
+
+profiler = SamplingProfiler()
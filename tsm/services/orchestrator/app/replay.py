@@ -0,0 +1,254 @@
+"""
+Офлайн-прогон записанных диалогов против текущей сборки.
+
+Вход — JSONL, строка на ход:
+
+    {"request": {...поля ChatRequest...},
+     "expected": {"intent": ..., "rule_used": ..., "state_after": ...},
+     "session": "<запись состояния до хода из Redis, необязательно>"}
+
+Поля ChatRequest можно класть и на верхний уровень строки. Ходы
+группируются по ключу сессии с сохранением порядка, сессии нарезаются на
+пакеты по --chunk-turns ходов и выполняются пулом процессов. Основной
+процесс только читает ключ сессии, исполнителям уходят исходные строки:
+валидация ChatRequest идет параллельно вместе с ходами. У каждого
+процесса свое состояние сессий в памяти, Redis не нужен; "session" первого
+хода сессии задает ее начальное состояние (диалоги, начатые до записи).
+
+Результат — число расхождений по полям, ошибки, ходов в секунду и,
+с --report, все расхождения в JSONL.
+
+    python -m app.replay traffic.jsonl --workers 8 --report diffs.jsonl
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app import serialization
+from app.catalog import CatalogSnapshot, CatalogStore
+from app.fsm import StateChange, encode_state, state_key
+from app.main import ChatRequest, decide_turn
+from app.session import decode_session
+from app.tenants import TenantCatalogs, tenant_catalogs_from_env
+
+COMPARED_FIELDS = ("intent", "rule_used", "state_after")
+
+# (номер строки, исходная строка JSONL)
+Turn = Tuple[int, str]
+_KEY_DEFAULTS = {name: ChatRequest.model_fields[name].default for name in ("tenant_id", "channel", "user_id")}
+
+
+@dataclass
+class ChunkResult:
+    turns: int = 0
+    diffs: List[dict] = field(default_factory=list)
+    errors: List[dict] = field(default_factory=list)
+    # Ходы тенантов без своего каталога в --catalog-dir: идут на общем каталоге
+    unknown_tenants: Counter = field(default_factory=Counter)
+
+
+@dataclass
+class ReplayReport:
+    sessions: int = 0
+    turns: int = 0
+    invalid_lines: int = 0
+    errors: int = 0
+    diff_turns: int = 0
+    diffs_by_field: Counter = field(default_factory=Counter)
+    unknown_tenants: Counter = field(default_factory=Counter)
+    elapsed: float = 0.0
+    examples: List[dict] = field(default_factory=list)
+
+    @property
+    def turns_per_sec(self) -> float:
+        return self.turns / self.elapsed if self.elapsed else 0.0
+
+
+def parse_line(line: str) -> Tuple[dict, dict, Optional[str]]:
+    """(поля запроса, ожидаемые поля, начальная запись состояния)"""
+    record = serialization.loads(line)
+    request = record.get("request")
+    if request is None:
+        request = {k: v for k, v in record.items() if k not in ("expected", "session")}
+    return request, record.get("expected") or {}, record.get("session")
+
+
+def session_of(request: dict) -> str:
+    return state_key(*(request.get(name) or default for name, default in _KEY_DEFAULTS.items()))
+
+
+def load_sessions(path: Path) -> Tuple[Dict[str, List[Turn]], List[dict]]:
+    """Строки по ключу сессии в порядке файла и строки, которые не разобрались"""
+    sessions: Dict[str, List[Turn]] = {}
+    invalid = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                key = session_of(parse_line(line)[0])
+            except (ValueError, TypeError, AttributeError) as e:
+                invalid.append({"line": line_no, "error": str(e) or type(e).__name__})
+                continue
+            sessions.setdefault(key, []).append((line_no, line))
+    return sessions, invalid
+
+
+def chunks(sessions: Dict[str, List[Turn]], chunk_turns: int) -> Iterator[List[Tuple[str, List[Turn]]]]:
+    """Пакеты целых сессий примерно по chunk_turns ходов"""
+    chunk, size = [], 0
+    for key, turns in sessions.items():
+        chunk.append((key, turns))
+        size += len(turns)
+        if size >= chunk_turns:
+            yield chunk
+            chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+
+# Состояние процесса-исполнителя: каталоги и состояния сессий в памяти
+_default_catalog: Optional[CatalogSnapshot] = None
+_tenant_catalogs: Optional[TenantCatalogs] = None
+_store: Dict[str, str] = {}
+
+
+def init_worker(catalog_path: str, catalog_dir: Optional[str] = None):
+    global _default_catalog, _tenant_catalogs
+    _default_catalog = CatalogStore(catalog_path, poll_interval=0).snapshot
+    # Тот же LRU и та же проверка tenant_id, что у сервиса; без наблюдателя
+    _tenant_catalogs = (tenant_catalogs_from_env(lambda: _default_catalog, 0, catalog_dir)
+                        if catalog_dir else None)
+    _store.clear()
+
+
+def _catalog_for(tenant_id: Optional[str]) -> Optional[CatalogSnapshot]:
+    """Каталог тенанта; None — у тенанта нет своего каталога в --catalog-dir"""
+    if _tenant_catalogs is None:
+        return _default_catalog
+    return _tenant_catalogs.load(tenant_id or "")
+
+
+def replay_chunk(chunk: List[Tuple[str, List[Turn]]]) -> ChunkResult:
+    """Выполняет сессии пакета по порядку ходов и сравнивает с ожидаемым"""
+    result = ChunkResult()
+    for key, turns in chunk:
+        for index, (line_no, line) in enumerate(turns):
+            result.turns += 1
+            fields, expected, seed = parse_line(line)
+            if index == 0 and seed:
+                _store[key] = seed
+            try:
+                request = ChatRequest.model_validate(fields)
+            except ValidationError as e:
+                result.errors.append({"line": line_no, "session": key, "error": str(e)})
+                continue
+            catalog = _catalog_for(request.tenant_id)
+            if catalog is None:
+                result.unknown_tenants[request.tenant_id] += 1
+                catalog = _default_catalog
+            change = StateChange()
+            try:
+                _, intent, debug = decide_turn(
+                    request.scenario, request.text, request.action_type, request.action_name,
+                    decode_session(_store.get(key)), catalog, change)
+            except Exception as e:
+                result.errors.append({"line": line_no, "session": key, "error": str(e) or type(e).__name__})
+                continue
+            if change.op == "set":
+                _store[key] = encode_state(change.scenario, change.state, change.data)
+            elif change.op == "clear":
+                _store.pop(key, None)
+
+            actual = {"intent": intent, "rule_used": debug.get("rule_used"), "state_after": debug.get("state_after")}
+            for name in COMPARED_FIELDS:
+                if name in expected and expected[name] != actual[name]:
+                    result.diffs.append({"line": line_no, "session": key, "field": name,
+                                         "expected": expected[name], "actual": actual[name]})
+        _store.pop(key, None)
+    return result
+
+
+def replay(path: Path, workers: int = 1, chunk_turns: int = 5000, catalog_path: Optional[str] = None,
+           catalog_dir: Optional[str] = None, report_path: Optional[Path] = None,
+           examples: int = 10) -> ReplayReport:
+    """Прогоняет файл; workers=1 — в текущем процессе без пула"""
+    catalog_path = catalog_path or os.getenv("DIKIDI_STUB_PATH", "/app/data/dikidi_stub.json")
+    started = time.perf_counter()
+    sessions, invalid = load_sessions(path)
+    report = ReplayReport(sessions=len(sessions), invalid_lines=len(invalid))
+    report_file = open(report_path, "w", encoding="utf-8") if report_path else None
+    diff_lines = set()
+
+    def collect(chunk_result: ChunkResult):
+        report.turns += chunk_result.turns
+        report.errors += len(chunk_result.errors)
+        report.unknown_tenants.update(chunk_result.unknown_tenants)
+        for diff in chunk_result.diffs:
+            report.diffs_by_field[diff["field"]] += 1
+            diff_lines.add(diff["line"])
+            if len(report.examples) < examples:
+                report.examples.append(diff)
+        if report_file is not None:
+            for row in chunk_result.errors + chunk_result.diffs:
+                report_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    try:
+        if report_file is not None:
+            for row in invalid:
+                report_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        if workers <= 1:
+            init_worker(catalog_path, catalog_dir)
+            for chunk in chunks(sessions, chunk_turns):
+                collect(replay_chunk(chunk))
+        else:
+            with ProcessPoolExecutor(workers, initializer=init_worker,
+                                     initargs=(catalog_path, catalog_dir)) as pool:
+                for chunk_result in pool.map(replay_chunk, chunks(sessions, chunk_turns)):
+                    collect(chunk_result)
+    finally:
+        if report_file is not None:
+            report_file.close()
+    report.diff_turns = len(diff_lines)
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-прогон записанных диалогов")
+    parser.add_argument("path", type=Path, help="JSONL с записанными ходами")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-turns", type=int, default=5000)
+    parser.add_argument("--catalog", default=None, help="каталог (по умолчанию DIKIDI_STUB_PATH)")
+    parser.add_argument("--catalog-dir", default=os.getenv("TENANT_CATALOG_DIR") or None,
+                        help="каталоги студий <tenant_id>.json")
+    parser.add_argument("--report", type=Path, help="куда записать расхождения и ошибки (JSONL)")
+    args = parser.parse_args()
+
+    report = replay(args.path, args.workers, args.chunk_turns, args.catalog, args.catalog_dir, args.report)
+    print(f"сессий: {report.sessions}, ходов: {report.turns}, за {report.elapsed:.1f} с — "
+          f"{report.turns_per_sec:.0f} ходов/с ({args.workers} процессов)")
+    print(f"ходов с расхождениями: {report.diff_turns}, ошибок: {report.errors}, "
+          f"неразобранных строк: {report.invalid_lines}")
+    if report.unknown_tenants:
+        print(f"ходов студий без каталога в --catalog-dir (прогнаны на общем): "
+              f"{sum(report.unknown_tenants.values())}")
+        for tenant_id, turns in report.unknown_tenants.most_common(10):
+            print(f"  {tenant_id!r}: {turns}")
+    for name in COMPARED_FIELDS:
+        print(f"  {name}: {report.diffs_by_field[name]}")
+    for diff in report.examples:
+        print(f"  строка {diff['line']} {diff['field']}: ожидалось {diff['expected']!r}, стало {diff['actual']!r}")
+    raise SystemExit(1 if report.diff_turns or report.errors or report.invalid_lines else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Устойчивый доступ к Redis: настройки пула, дедлайны, повторы с jitter,
+автоматический выключатель (circuit breaker) и локальный резерв.
+
+Пока выключатель разомкнут, FSM не ходит в Redis и работает с
+ограниченным локальным TTL-хранилищем; записи, сделанные в этом режиме,
+помечаются и сверяются с Redis после восстановления.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import redis
+
+T = TypeVar("T")
+
+# Ошибки доступности Redis; логические ошибки (ResponseError) не повторяются
+FAILURES = (redis.ConnectionError, redis.TimeoutError, asyncio.TimeoutError, OSError)
+
+
+class StoreUnavailable(Exception):
+    """Redis недоступен: выключатель разомкнут или повторы исчерпаны"""
+
+
+@dataclass(frozen=True)
+class RedisSettings:
+    """Параметры пула и устойчивости доступа к Redis"""
+
+    max_connections: int = 50
+    socket_timeout: float = 0.5
+    connect_timeout: float = 0.5
+    health_check_interval: int = 30
+    retry_attempts: int = 2  # повторы после первой попытки
+    retry_base_delay: float = 0.02
+    call_deadline: float = 1.0  # общий дедлайн вызова вместе с повторами
+    breaker_threshold: int = 5  # подряд неудачных вызовов до размыкания
+    breaker_reset: float = 5.0  # секунд до пробного вызова
+    fallback_size: int = 10000
+
+    @classmethod
+    def from_env(cls) -> "RedisSettings":
+        return cls(
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+            socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5")),
+            connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5")),
+            retry_attempts=int(os.getenv("REDIS_RETRY_ATTEMPTS", "2")),
+            retry_base_delay=float(os.getenv("REDIS_RETRY_BASE_DELAY", "0.02")),
+            call_deadline=float(os.getenv("REDIS_CALL_DEADLINE", "1.0")),
+            breaker_threshold=int(os.getenv("REDIS_BREAKER_THRESHOLD", "5")),
+            breaker_reset=float(os.getenv("REDIS_BREAKER_RESET", "5.0")),
+            fallback_size=int(os.getenv("REDIS_FALLBACK_SIZE", "10000")),
+        )
+
+    def pool_kwargs(self) -> dict:
+        """Аргументы ConnectionPool.from_url (sync и asyncio)"""
+        return {
+            "max_connections": self.max_connections,
+            "socket_timeout": self.socket_timeout,
+            "socket_connect_timeout": self.connect_timeout,
+            "health_check_interval": self.health_check_interval,
+            "retry_on_timeout": False,  # повторы выполняет call_with_retry
+        }
+
+
+class CircuitBreaker:
+    """
+    Выключатель: closed -> open после threshold неудач подряд,
+    open -> half_open через reset секунд (один пробный вызов),
+    half_open -> closed при успехе или снова open при неудаче.
+
+    Выключатель следит только за доступностью: ответ Redis с ошибкой
+    (ResponseError, в т.ч. OOM) — успех, Redis жив. Если пробный вызов
+    прерван иначе (отмена задачи, ошибка в коде), исход неизвестен:
+    состояние не меняется, а следующий вызов снова может стать пробным.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold: int = 5, reset: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.reset = reset
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        return self.acquire() is not None
+
+    def acquire(self) -> Optional[bool]:
+        """
+        None — вызов запрещен; True — это пробный вызов, после него
+        обязательно release_trial(); False — обычный вызов.
+        """
+        if self.state == self.CLOSED:
+            return False
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self._opened_at >= self.reset:
+                self.state = self.HALF_OPEN
+                self._trial = False
+            if self.state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return None
+
+    def release_trial(self):
+        """Освобождает место пробного вызова, чем бы он ни закончился"""
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+        if self.state == self.CLOSED and not self.failures:
+            return
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    @property
+    def blocked(self) -> bool:
+        """Разомкнут, и время пробного вызова еще не пришло"""
+        return self.state == self.OPEN and self.clock() - self._opened_at < self.reset
+
+
+def retry_delay(attempt: int, base: float) -> float:
+    """Экспоненциальная задержка с полным jitter"""
+    return random.uniform(0, base * (2 ** attempt))
+
+
+def call_with_retry(fn: Callable[[], T], settings: RedisSettings, breaker: CircuitBreaker,
+                    idempotent: bool = True) -> T:
+    """
+    Синхронный вызов Redis с повторами, дедлайном и выключателем.
+    Неидемпотентные вызовы (compare-and-set) не повторяются: после таймаута
+    неизвестно, применился ли первый.
+    """
+    trial = breaker.acquire()
+    if trial is None:
+        raise StoreUnavailable("circuit breaker разомкнут")
+    deadline = time.monotonic() + settings.call_deadline
+    retries = settings.retry_attempts if idempotent else 0
+    try:
+        for attempt in range(retries + 1):
+            try:
+                result = fn()
+            except FAILURES as e:
+                breaker.record_failure()
+                delay = retry_delay(attempt, settings.retry_base_delay)
+                if (breaker.is_open or attempt == retries
+                        or time.monotonic() + delay >= deadline):
+                    raise StoreUnavailable(str(e)) from e
+                time.sleep(delay)
+            except redis.RedisError:
+                breaker.record_success()  # Redis ответил: ошибка логическая
+                raise
+            else:
+                breaker.record_success()
+                return result
+    finally:
+        if trial:
+            breaker.release_trial()
+
+
+async def acall_with_retry(fn: Callable[[], Awaitable[T]], settings: RedisSettings,
+                           breaker: CircuitBreaker, idempotent: bool = True) -> T:
+    """Асинхронный вызов Redis: каждая попытка ограничена оставшимся дедлайном"""
+    trial = breaker.acquire()
+    if trial is None:
+        raise StoreUnavailable("circuit breaker разомкнут")
+    deadline = time.monotonic() + settings.call_deadline
+    retries = settings.retry_attempts if idempotent else 0
+    try:
+        for attempt in range(retries + 1):
+            try:
+                result = await asyncio.wait_for(fn(), max(deadline - time.monotonic(), 0.001))
+            except FAILURES as e:
+                breaker.record_failure()
+                delay = retry_delay(attempt, settings.retry_base_delay)
+                if (breaker.is_open or attempt == retries
+                        or time.monotonic() + delay >= deadline):
+                    raise StoreUnavailable(str(e) or type(e).__name__) from e
+                await asyncio.sleep(delay)
+            except redis.RedisError:
+                breaker.record_success()  # Redis ответил: ошибка логическая
+                raise
+            else:
+                breaker.record_success()
+                return result
+    finally:
+        if trial:
+            breaker.release_trial()
+
+
+class FallbackStore:
+    """
+    Ограниченное локальное TTL-хранилище состояний.
+
+    В нормальном режиме хранит последние значения, прочитанные или
+    записанные в Redis (чистые записи), чтобы при отказе диалоги
+    продолжались с места. Записи режима отказа помечаются грязными
+    и вытесняются только после всех чистых (dirty_evicted), пока не сверены
+    с Redis; для сверки compare-and-set грязная запись помнит базу —
+    значение, последним подтвержденное Redis. Истекшие грязные записи
+    не сверяются (dirty_expired).
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 24 * 60 * 60,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        # Чистые записи — LRU с вытеснением с начала; грязные — отдельно, в порядке записи
+        self._entries: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        # ключ -> (значение, срок, база)
+        self.dirty: Dict[str, Tuple[Optional[str], float, Optional[str]]] = {}
+        self.dirty_evicted = 0  # несверенные записи, потерянные при переполнении
+        self.dirty_expired = 0  # несверенные записи, истекшие до сверки
+        self._lock = threading.Lock()
+
+    def remember(self, key: str, value: Optional[str]):
+        """Значение, подтвержденное Redis"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if key in self.dirty:
+                return  # несверенная локальная запись важнее
+            self._store(key, value)
+
+    def write(self, key: str, value: Optional[str]):
+        """Запись в режиме отказа: будет сверена с Redis"""
+        with self._lock:
+            self._write_dirty(key, value)
+
+    def _store(self, key: str, value: Optional[str]):
+        self._entries[key] = (value, self.clock() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def _write_dirty(self, key: str, value: Optional[str]):
+        entry = self.dirty.pop(key, None)  # перезапись переносит ключ в конец
+        if entry is not None:
+            base = entry[2]
+        else:
+            clean = self._entries.pop(key, None)
+            base = clean[0] if clean is not None and clean[1] >= self.clock() else None
+        self.dirty[key] = (value, self.clock() + self.ttl_seconds, base)
+        self._evict()
+
+    def _evict(self):
+        """
+        Размер включает грязные записи: сначала вытесняются самые давние
+        чистые, а когда их нет — самые давно записанные грязные
+        """
+        while len(self._entries) + len(self.dirty) > max(self.max_size, 0):
+            if self._entries:
+                self._entries.popitem(last=False)
+            else:
+                del self.dirty[next(iter(self.dirty))]
+                self.dirty_evicted += 1
+
+    def _current(self, key: str) -> Optional[str]:
+        """Значение с учетом TTL; истекшие записи удаляются"""
+        for entries in (self.dirty, self._entries):
+            entry = entries.get(key)
+            if entry is not None:
+                if entry[1] < self.clock():
+                    del entries[key]
+                    return None
+                return entry[0]
+        return None
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._current(key)
+
+    def is_dirty(self, key: str) -> bool:
+        """Несверенная запись: до сверки ключ читается и пишется только локально"""
+        return key in self.dirty
+
+    def transition(self, key: str, expected: Optional[str], op: str, value: Optional[str]) -> list:
+        """Compare-and-set как TRANSITION_SCRIPT: [1] или [0, текущее]"""
+        with self._lock:
+            current = self._current(key)
+            if current != (expected or None):
+                return [0, current or ""]
+            self._write_dirty(key, value if op == "set" else None)
+            return [1]
+
+    def pending(self, limit: Optional[int] = None) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        """Несверенные неистекшие записи (ключ, значение, база), не больше limit; истекшие удаляются"""
+        with self._lock:
+            now = self.clock()
+            expired = []
+            result = []
+            for key, entry in self.dirty.items():
+                if entry[1] < now:
+                    expired.append(key)
+                elif limit is None or len(result) < limit:
+                    result.append((key, entry[0], entry[2]))
+                else:
+                    break
+            for key in expired:
+                del self.dirty[key]
+            self.dirty_expired += len(expired)
+            return result
+
+    def mark_clean(self, key: str, value: Optional[str], confirmed: Optional[str]) -> bool:
+        """
+        Итог сверки value: в Redis теперь confirmed. Если запись не менялась
+        во время сверки, пометка снимается (True); иначе confirmed становится
+        ее базой (False).
+        """
+        with self._lock:
+            entry = self.dirty.get(key)
+            if entry is None:
+                return False
+            if entry[0] != value:
+                self.dirty[key] = (entry[0], entry[1], confirmed)
+                return False
+            del self.dirty[key]
+            if self.max_size > 0:
+                self._store(key, confirmed)
+            return True
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self.dirty)
@@ -0,0 +1,78 @@
+"""
+JSON горячего пути: ответы /chat и /dikidi, состояние диалога в Redis.
+
+Бэкенд задается JSON_BACKEND: auto — orjson, если установлен, иначе
+stdlib json; orjson и stdlib — явно. Оба бэкенда пишут компактный UTF-8
+без экранирования кириллицы, поэтому записи состояния и тела ответов
+совместимы между ними, и переключение не требует миграции.
+"""
+import json
+import logging
+import os
+from typing import Any, Callable, Union
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("auto", "orjson", "stdlib")
+
+_stdlib_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return _stdlib_encode(obj).encode("utf-8")
+
+
+def _orjson_default(obj: Any):
+    # orjson не сериализует множества; jsonable_encoder превращал их в списки
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"тип {type(obj).__name__} не сериализуется в JSON")
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_orjson_default)
+
+
+def _orjson_dumps_str(obj: Any) -> str:
+    return orjson.dumps(obj, default=_orjson_default).decode("utf-8")
+
+
+# Текущий бэкенд; меняется только set_backend(), поэтому вызывать
+# serialization.dumps(...), а не импортировать функции по имени
+backend = "stdlib"
+dumps: Callable[[Any], bytes] = _stdlib_dumps
+dumps_str: Callable[[Any], str] = _stdlib_encode
+loads: Callable[[Union[str, bytes]], Any] = json.loads
+
+
+def set_backend(name: str) -> str:
+    """Выбирает бэкенд; возвращает имя фактически включенного"""
+    global backend, dumps, dumps_str, loads
+    if name not in BACKENDS:
+        raise ValueError(f"JSON_BACKEND: ожидается одно из {', '.join(BACKENDS)}, получено '{name}'")
+    if name == "orjson" and orjson is None:
+        logger.warning("JSON_BACKEND=orjson, но orjson не установлен: используется stdlib json")
+    if name != "stdlib" and orjson is not None:
+        backend, dumps, dumps_str, loads = "orjson", _orjson_dumps, _orjson_dumps_str, orjson.loads
+    else:
+        backend, dumps, dumps_str, loads = "stdlib", _stdlib_dumps, _stdlib_encode, json.loads
+    return backend
+
+
+class FastJSONResponse(Response):
+    """JSON-ответ через текущий бэкенд, без jsonable_encoder"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+set_backend(os.getenv("JSON_BACKEND", "auto"))
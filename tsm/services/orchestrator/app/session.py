@@ -0,0 +1,132 @@
+"""
+Компактное представление состояния диалога для хранения в Redis
+"""
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from app import serialization
+
+# Версия схемы записи. Записи версии 1 — JSON-объекты
+# {"scenario", "state", "data"}; они читаются и перезаписываются
+# в текущем формате при следующем переходе.
+SCHEMA_VERSION = 2
+
+# Таблицы кодов. Коды только дописываются в конец: изменение порядка
+# сломает чтение уже сохраненных сессий.
+SCENARIOS = ("Детские группы", "Аренда зала", "Запись на занятие", "Вопрос о тренере")
+STATES = (
+    "idle",
+    "kids_need_age",
+    "rent_need_time",
+    "rent_need_people",
+    "rent_need_format",
+    "booking_need_direction",
+)
+DATA_KEYS = {
+    "age": "a",
+    "rent_time_bucket": "t",
+    "people_count": "p",
+    "format": "f",
+    "direction": "d",
+}
+
+_SCENARIO_CODES = {name: i + 1 for i, name in enumerate(SCENARIOS)}
+_STATE_CODES = {name: i + 1 for i, name in enumerate(STATES)}
+_DATA_NAMES = {short: name for name, short in DATA_KEYS.items()}
+
+# Зарезервированные короткие ключи: имена вне таблиц и прочие поля data
+_RAW_SCENARIO = "_s"
+_RAW_STATE = "_q"
+_EXTRA = "_x"
+
+
+@dataclass(slots=True)
+class SessionState:
+    """Состояние диалога одного пользователя"""
+
+    scenario: str
+    state: str
+    data: Dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"scenario": self.scenario, "state": self.state, "data": self.data}
+
+
+def encode_session(scenario: str, state: str, data: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Кодирует состояние в строку вида "2;<state>;<scenario>;<data>".
+    Сценарий и состояние — номера из таблиц, ключи data — однобуквенные.
+    """
+    packed: Dict[str, Any] = {}
+    extra = None
+    for key, value in (data or {}).items():
+        short = DATA_KEYS.get(key)
+        if short is None:
+            if extra is None:
+                extra = {}
+            extra[key] = value
+        else:
+            packed[short] = value
+    if extra is not None:
+        packed[_EXTRA] = extra
+
+    state_code = _STATE_CODES.get(state, 0)
+    if not state_code:
+        packed[_RAW_STATE] = state
+    scenario_code = _SCENARIO_CODES.get(scenario, 0)
+    if not scenario_code:
+        packed[_RAW_SCENARIO] = scenario
+
+    body = serialization.dumps_str(packed) if packed else ""
+    return f"{SCHEMA_VERSION};{state_code};{scenario_code};{body}"
+
+
+def decode_session(raw: Optional[str]) -> Optional[SessionState]:
+    """Разбирает запись из Redis любой поддерживаемой версии схемы"""
+    if not raw:
+        return None
+    if raw[0] == "{":
+        legacy = serialization.loads(raw)
+        return SessionState(legacy.get("scenario"), legacy.get("state"), legacy.get("data") or {})
+
+    version, state_code, scenario_code, body = raw.split(";", 3)
+    if int(version) != SCHEMA_VERSION:
+        raise ValueError(f"неизвестная версия схемы состояния: {version}")
+
+    packed = serialization.loads(body) if body else {}
+    state_code = int(state_code)
+    scenario_code = int(scenario_code)
+    state = STATES[state_code - 1] if state_code else packed.pop(_RAW_STATE)
+    scenario = SCENARIOS[scenario_code - 1] if scenario_code else packed.pop(_RAW_SCENARIO)
+
+    data = {}
+    extra = packed.pop(_EXTRA, None)
+    for short, value in packed.items():
+        data[_DATA_NAMES[short]] = value
+    if extra:
+        data.update(extra)
+    return SessionState(scenario, state, data)
+
+
+def session_state(raw: str) -> Optional[str]:
+    """
+    Состояние записи без разбора тела: код состояния стоит в префиксе
+    "{версия};{код состояния};..."; JSON версии 1 и состояния вне таблицы
+    разбираются целиком
+    """
+    if raw and raw[0] != "{":
+        version, state_code, _ = raw.split(";", 2)
+        if int(version) == SCHEMA_VERSION and state_code != "0":
+            return STATES[int(state_code) - 1]
+    session = decode_session(raw)
+    return session.state if session is not None else None
+
+
+def encode_session_json(scenario: str, state: str, data: Optional[Dict[str, Any]] = None) -> str:
+    """Формат версии 1 (JSON); используется только для сравнения и миграции"""
+    return json.dumps({
+        "scenario": scenario,
+        "state": state,
+        "data": data or {}
+    }, ensure_ascii=False)
@@ -0,0 +1,104 @@
+"""
+L1-кэш состояний диалогов в памяти процесса
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+# Канал Redis, в который FSM публикует ключи измененных состояний
+INVALIDATION_CHANNEL = "state-invalidate"
+
+
+class StateCache:
+    """
+    Ограниченный по размеру LRU-кэш сырых значений состояний.
+
+    Когерентность между репликами обеспечивается каналом инвалидации:
+    каждая запись в Redis публикует ключ, остальные процессы удаляют его
+    из своего кэша. Окно между записью и получением сообщения закрывается
+    compare-and-set в FSM.transition: устаревшее значение из кэша приводит
+    к конфликту и пересчету хода от актуального состояния.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 24 * 60 * 60,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def epoch(self) -> int:
+        """Счетчик инвалидаций; берется перед чтением из Redis для put()"""
+        return self._epoch
+
+    def get(self, key: str) -> Tuple[bool, Optional[str]]:
+        """Возвращает (найдено, значение). None — ключа нет в Redis"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key: str, value: Optional[str], epoch: Optional[int] = None,
+            ttl: Optional[float] = None):
+        """
+        Кладет значение в кэш. Если передан epoch и с тех пор была
+        инвалидация, значение могло устареть и не кэшируется. ttl —
+        время жизни записи, если оно короче ttl_seconds кэша.
+        """
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return
+            ttl = self.ttl_seconds if ttl is None else min(ttl, self.ttl_seconds)
+            self._entries[key] = (value, self.clock() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+def invalidation_message(instance_id: str, key: str) -> str:
+    return f"{instance_id} {key}"
+
+
+def parse_invalidation(message) -> Tuple[str, str]:
+    if isinstance(message, bytes):
+        message = message.decode("utf-8")
+    instance_id, _, key = message.partition(" ")
+    return instance_id, key
@@ -0,0 +1,231 @@
+"""
+Каталоги студий (тенантов).
+
+Каждый тенант может иметь свой каталог `<TENANT_CATALOG_DIR>/<tenant_id>.json`
+с направлениями, правилами аренды и таблицами ключевых слов. Каталог
+загружается при первом обращении, в памяти держится ограниченный LRU
+горячих тенантов (по количеству и суммарному размеру JSON). Тенанты без
+своего файла используют общий каталог.
+
+Загрузка холодного тенанта выполняется в потоке и не блокирует event loop:
+запросы горячих тенантов обслуживаются из памяти, а параллельные запросы
+одного холодного тенанта ждут одну общую загрузку.
+"""
+import asyncio
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+
+from app.catalog import CatalogSnapshot, CatalogStore
+
+logger = logging.getLogger(__name__)
+
+TENANT_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class _TenantEntry:
+    __slots__ = ("store", "size", "mtime_ns")
+
+    def __init__(self, store: Optional[CatalogStore], size: int, mtime_ns: int):
+        self.store = store  # None — у тенанта нет своего каталога
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+
+class TenantCatalogs:
+    """LRU каталогов тенантов с загрузкой по требованию"""
+
+    def __init__(self, directory: Optional[Union[str, Path]],
+                 default: Callable[[], CatalogSnapshot],
+                 max_tenants: int = 100, max_bytes: int = 256 * 1024 * 1024,
+                 poll_interval: float = 2.0):
+        self.directory = Path(directory) if directory else None
+        self.default = default
+        self.max_tenants = max_tenants
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self._entries: "OrderedDict[str, _TenantEntry]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_errors = 0
+        self.evictions = 0
+        self.shared = 0
+
+    def path_for(self, tenant_id: str) -> Optional[Path]:
+        if self.directory is None or not TENANT_ID_RE.match(tenant_id or ""):
+            return None
+        return self.directory / f"{tenant_id}.json"
+
+    def cached(self, tenant_id: str) -> Optional[CatalogSnapshot]:
+        """Каталог тенанта из памяти без загрузки; None, если тенант холодный"""
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(tenant_id)
+            self.hits += 1
+        return entry.store.snapshot if entry.store is not None else self.default()
+
+    async def get(self, tenant_id: str) -> CatalogSnapshot:
+        """Каталог тенанта; холодный тенант загружается в потоке"""
+        if self.path_for(tenant_id) is None:
+            self.shared += 1
+            return self.default()
+        snapshot = self.cached(tenant_id)
+        if snapshot is not None:
+            return snapshot
+
+        future = self._loading.get(tenant_id)
+        if future is None:
+            self.misses += 1
+            future = asyncio.ensure_future(asyncio.to_thread(self._load, tenant_id))
+            self._loading[tenant_id] = future
+            future.add_done_callback(lambda _: self._loading.pop(tenant_id, None))
+        entry = await asyncio.shield(future)
+        return entry.store.snapshot if entry.store is not None else self.default()
+
+    def load(self, tenant_id: str) -> Optional[CatalogSnapshot]:
+        """
+        Синхронный get для процессов без event loop (офлайн-прогон):
+        каталог тенанта или None, если тенант работает на общем каталоге
+        """
+        if self.path_for(tenant_id) is None:
+            self.shared += 1
+            return None
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if entry is not None:
+                self._entries.move_to_end(tenant_id)
+                self.hits += 1
+        if entry is None:
+            self.misses += 1
+            entry = self._load(tenant_id)
+        return entry.store.snapshot if entry.store is not None else None
+
+    def _load(self, tenant_id: str) -> _TenantEntry:
+        path = self.path_for(tenant_id)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            entry = _TenantEntry(None, 0, 0)
+        else:
+            store = CatalogStore(path, poll_interval=0)
+            if store.snapshot.mtime_ns == 0:
+                # Файл не разобрался: тенант работает на общем каталоге до исправления
+                self.load_errors += 1
+                entry = _TenantEntry(None, 0, stat.st_mtime_ns)
+            else:
+                self.loads += 1
+                entry = _TenantEntry(store, stat.st_size, store.snapshot.mtime_ns)
+        self._put(tenant_id, entry)
+        return entry
+
+    def _put(self, tenant_id: str, entry: _TenantEntry):
+        with self._lock:
+            old = self._entries.pop(tenant_id, None)
+            if old is not None:
+                self._size -= old.size
+            self._entries[tenant_id] = entry
+            self._size += entry.size
+            # Вытесняем самые давние, но не только что загруженный
+            while len(self._entries) > 1 and (
+                    len(self._entries) > self.max_tenants or self._size > self.max_bytes):
+                evicted_id, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+                self.evictions += 1
+                logger.info("Каталог тенанта %s вытеснен из памяти", evicted_id)
+
+    def evict(self, tenant_id: str):
+        with self._lock:
+            entry = self._entries.pop(tenant_id, None)
+            if entry is not None:
+                self._size -= entry.size
+
+    def refresh(self):
+        """
+        Перечитывает измененные каталоги загруженных тенантов; тенанты без
+        каталога забываются, если файл появился или изменился.
+        """
+        with self._lock:
+            items = list(self._entries.items())
+        for tenant_id, entry in items:
+            if entry.store is not None:
+                if entry.store.refresh():
+                    size = entry.store.path.stat().st_size if entry.store.path.exists() else entry.size
+                    with self._lock:
+                        if self._entries.get(tenant_id) is entry:
+                            self._size += size - entry.size
+                            entry.size = size
+                continue
+            try:
+                mtime_ns = self.path_for(tenant_id).stat().st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if mtime_ns != entry.mtime_ns:
+                with self._lock:
+                    if self._entries.get(tenant_id) is entry:
+                        del self._entries[tenant_id]
+
+    def start(self):
+        """Запускает одно фоновое наблюдение за каталогами всех тенантов"""
+        if self._watcher is not None or self.poll_interval <= 0 or self.directory is None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="tenant-catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.poll_interval + 1)
+            self._watcher = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception:  # наблюдатель не должен падать
+                logger.exception("Ошибка наблюдения за каталогами тенантов")
+
+    def stats(self) -> dict:
+        with self._lock:
+            tenants = len(self._entries)
+            size = self._size
+        return {
+            "tenants": tenants,
+            "size_bytes": size,
+            "max_tenants": self.max_tenants,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "evictions": self.evictions,
+            "shared": self.shared,
+            "loading": len(self._loading),
+        }
+
+
+def tenant_catalogs_from_env(default: Callable[[], CatalogSnapshot], poll_interval: float,
+                             directory: Optional[Union[str, Path]] = None) -> TenantCatalogs:
+    """
+    Каталоги тенантов из directory (по умолчанию TENANT_CATALOG_DIR) с лимитами
+    TENANT_CACHE_SIZE и TENANT_CACHE_MAX_BYTES
+    """
+    return TenantCatalogs(
+        directory or os.getenv("TENANT_CATALOG_DIR") or None,
+        default,
+        max_tenants=int(os.getenv("TENANT_CACHE_SIZE", "100")),
+        max_bytes=int(os.getenv("TENANT_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+        poll_interval=poll_interval,
+    )
@@ -0,0 +1,109 @@
+"""
+Прогрев оркестратора при старте и готовность (GET /ready).
+
+Шаги прогрева выполняются в lifespan до приема запросов: каталог читается
+и индексируется, фрагменты ответов и извлечение сущностей прогреваются,
+пул Redis открывает соединения и проверяет их PING. Если шаг не удался
+(например, Redis еще не поднялся), сервис все равно стартует — /health
+отвечает, — а неудачные шаги повторяются в фоне; /ready отдает 200 только
+после успеха всех шагов.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1").lower() not in ("0", "false", "no")
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "2"))
+
+StepFn = Callable[[], Union[None, Awaitable[None]]]
+
+
+@dataclass
+class StepResult:
+    ok: bool = False
+    attempts: int = 0
+    duration_ms: float = 0.0
+    error: Optional[str] = None
+
+
+class Readiness:
+    """Состояние прогрева: шаги, их длительность и ошибки"""
+
+    def __init__(self):
+        self.steps: Dict[str, StepResult] = {}
+        self.started_at = time.perf_counter()
+        self.ready_after_ms: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_after_ms is not None
+
+    def begin(self, names: List[str]):
+        self.steps = {name: StepResult() for name in names}
+        self.started_at = time.perf_counter()
+        self.ready_after_ms = None
+
+    def as_dict(self) -> dict:
+        return {
+            "status": "ready" if self.ready else "warming_up",
+            "ready_after_ms": self.ready_after_ms,
+            "steps": {
+                name: {"ok": step.ok, "attempts": step.attempts,
+                       "duration_ms": step.duration_ms, "error": step.error}
+                for name, step in self.steps.items()
+            },
+        }
+
+
+async def _run_step(result: StepResult, fn: StepFn) -> bool:
+    started = time.perf_counter()
+    result.attempts += 1
+    try:
+        value = fn()
+        if inspect.isawaitable(value):
+            await value
+    except Exception as e:  # шаг повторяется, сервис продолжает работать
+        result.error = f"{type(e).__name__}: {e}"
+        result.ok = False
+    else:
+        result.error = None
+        result.ok = True
+    result.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    return result.ok
+
+
+async def warm_up(readiness: Readiness, steps: List[Tuple[str, StepFn]]) -> bool:
+    """
+    Выполняет шаги по порядку один раз. Возвращает True, если все успешны;
+    тогда readiness становится готовой.
+    """
+    readiness.begin([name for name, _ in steps])
+    for name, fn in steps:
+        if not await _run_step(readiness.steps[name], fn):
+            logger.warning("прогрев: шаг %s не выполнен: %s", name, readiness.steps[name].error)
+    return _finish(readiness)
+
+
+async def retry_failed(readiness: Readiness, steps: List[Tuple[str, StepFn]],
+                       interval: float = WARMUP_RETRY_SECONDS):
+    """Повторяет неудачные шаги, пока все не выполнятся (фоновая задача)"""
+    while not readiness.ready:
+        await asyncio.sleep(interval)
+        for name, fn in steps:
+            if not readiness.steps[name].ok:
+                await _run_step(readiness.steps[name], fn)
+        _finish(readiness)
+    logger.info("прогрев завершен после повторов за %.0f мс", readiness.ready_after_ms)
+
+
+def _finish(readiness: Readiness) -> bool:
+    if all(step.ok for step in readiness.steps.values()):
+        readiness.ready_after_ms = round((time.perf_counter() - readiness.started_at) * 1000, 2)
+        return True
+    return False
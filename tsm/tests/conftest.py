@@ -0,0 +1,54 @@
+"""
+Общие помощники и фикстуры тестов оркестратора: ход диалога аренды и
+FSM поверх in-memory Redis (fakeredis).
+
+Помощники импортируются как `from conftest import ...` (каталог tests в
+sys.path, как для chat_session); app импортируется внутри фикстур, чтобы
+загрузка conftest не меняла порядок импорта модулей сервисов.
+"""
+from pathlib import Path
+
+import pytest
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+RENT = "Аренда зала"
+RENT_BUTTON = "Рассчитать стоимость аренды"
+
+
+def rent_turn(user_id: str, text: str, action_type: str = "text", action_name: str = None, **extra) -> dict:
+    """Тело запроса /chat с ходом диалога аренды"""
+    return {"user_id": user_id, "text": text, "scenario": RENT,
+            "action_type": action_type, "action_name": action_name, **extra}
+
+
+def rent_turn_args(user_id: str, text: str, action_type: str = "text", action_name: str = None) -> tuple:
+    """Тот же ход как аргументы process_state_machine"""
+    return RENT, text, action_type, action_name, "studio_nexa", "simulator", user_id
+
+
+@pytest.fixture
+def fsm():
+    """Синхронный FSM на fakeredis, через который работает /chat"""
+    import fakeredis
+    from app.fsm import FSM
+    from app.main import set_fsm
+    fsm = FSM("redis://localhost:6379/0")
+    fsm.redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+    set_fsm(fsm)
+    yield fsm
+    set_fsm(None)
+
+
+@pytest.fixture
+def async_fsm():
+    """Асинхронный FSM на fakeredis, через который работает /chat"""
+    import fakeredis
+    from app.fsm import AsyncFSM
+    from app.main import set_async_fsm
+    fsm = AsyncFSM("redis://localhost:6379/0")
+    fsm.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    set_async_fsm(fsm)
+    yield fsm
+    set_async_fsm(None)
@@ -0,0 +1,73 @@
+"""
+Тесты асинхронного FSM (redis.asyncio)
+"""
+import asyncio
+from pathlib import Path
+
+import pytest
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from chat_session import ChatSession  # type: ignore
+from app.main import process_state_machine_async
+
+
+@pytest.mark.asyncio
+async def test_async_rent_flow(async_fsm):
+    """Полный поток аренды через асинхронный FSM"""
+    args = ("studio_nexa", "simulator", "async_rent")
+    scenario = "Аренда зала"
+
+    _, intent, debug = await process_state_machine_async(
+        scenario, "", "button", "Рассчитать стоимость аренды", *args
+    )
+    assert intent == "calculate_rental"
+    assert debug["state_after"] == "rent_need_time"
+
+    await process_state_machine_async(scenario, "после 16", "text", None, *args)
+    await process_state_machine_async(scenario, "12", "text", None, *args)
+    reply, _, debug = await process_state_machine_async(scenario, "занятие", "text", None, *args)
+
+    assert "1500" in reply
+    assert debug["state_after"] == "idle"
+    assert await async_fsm.get_state(*args) is None
+
+
+@pytest.mark.asyncio
+async def test_async_users_do_not_share_state(async_fsm):
+    """Параллельные диалоги разных пользователей не смешиваются"""
+    scenario = "Аренда зала"
+
+    async def dialog(user_id: str, people: str):
+        args = ("studio_nexa", "simulator", user_id)
+        await process_state_machine_async(scenario, "", "button", "Рассчитать стоимость аренды", *args)
+        await process_state_machine_async(scenario, "до 16", "text", None, *args)
+        await process_state_machine_async(scenario, people, "text", None, *args)
+        return await async_fsm.get_state(*args)
+
+    states = await asyncio.gather(*(dialog(f"user_{i}", str(i + 1)) for i in range(20)))
+
+    for i, state in enumerate(states):
+        assert state["state"] == "rent_need_format"
+        assert state["data"]["people_count"] == i + 1
+
+
+@pytest.mark.asyncio
+async def test_chat_endpoint_uses_async_fsm(async_fsm):
+    """/chat работает через асинхронный FSM"""
+    session = ChatSession(scenario="Детские группы", user_id="async_kids")
+    await session.send("Уточнить возраст ребёнка", action_type="button",
+                       action_name="Уточнить возраст ребёнка")
+    state = await async_fsm.get_state("studio_nexa", "simulator", "async_kids")
+    assert state["state"] == "kids_need_age"
+
+    reply, data = await session.send("8")
+    assert "Dance Mix 7-11" in reply
+    assert data["debug"]["state_before"] == "kids_need_age"
+    await session.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,111 @@
+"""
+Тесты каталога DIKIDI: снимок, версия, горячая перезагрузка
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.catalog import CatalogError, CatalogStore, parse_catalog
+
+STUB_PATH = Path(__file__).parent.parent / "data" / "dikidi_stub.json"
+
+
+@pytest.fixture
+def catalog_path(tmp_path):
+    """Копия stub во временной директории"""
+    path = tmp_path / "dikidi_stub.json"
+    shutil.copy(STUB_PATH, path)
+    return path
+
+
+def _rewrite(path: Path, data: dict):
+    """Перезаписывает файл и сдвигает mtime, чтобы изменение было заметно"""
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_snapshot_loaded_once(catalog_path):
+    store = CatalogStore(catalog_path, poll_interval=0)
+    snapshot = store.snapshot
+
+    assert len(snapshot.directions) == 6
+    assert snapshot.version >= 1
+    # Без изменений файла снимок тот же самый объект
+    assert store.refresh() is False
+    assert store.snapshot is snapshot
+
+
+def test_hot_reload_swaps_snapshot(catalog_path):
+    store = CatalogStore(catalog_path, poll_interval=0)
+    old = store.snapshot
+
+    data = json.loads(catalog_path.read_text(encoding="utf-8"))
+    data["directions"] = data["directions"][:2]
+    _rewrite(catalog_path, data)
+
+    assert store.refresh() is True
+    new = store.snapshot
+    assert new.version == old.version + 1
+    assert len(new.directions) == 2
+    # Старый снимок не изменился
+    assert len(old.directions) == 6
+
+
+def test_invalid_file_keeps_previous_snapshot(catalog_path):
+    store = CatalogStore(catalog_path, poll_interval=0)
+    old = store.snapshot
+
+    catalog_path.write_text("{ broken", encoding="utf-8")
+    stat = catalog_path.stat()
+    os.utime(catalog_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert store.refresh() is False
+    assert store.snapshot is old
+
+
+def test_missing_file_gives_empty_catalog(tmp_path):
+    store = CatalogStore(tmp_path / "missing.json", poll_interval=0)
+    assert store.snapshot.directions == []
+    assert store.snapshot.schedule == []
+    assert store.snapshot.rental == {}
+
+
+def test_indexes_built_with_snapshot(catalog_path):
+    snapshot = CatalogStore(catalog_path, poll_interval=0).snapshot
+
+    assert snapshot.direction("hatha_yoga")["name"] == "Хатха-йога"
+    assert snapshot.direction("unknown") is None
+
+    slots = snapshot.slots_for("latina_solo_18")
+    assert [s.day for s in slots] == ["Понедельник", "Среда", "Пятница"]
+    assert slots[0].line == "• Понедельник, 19:00 — Латина соло 18+"
+    assert snapshot.slots_for("unknown") == ()
+
+    assert len(snapshot.schedule_view) == len(snapshot.schedule)
+    assert snapshot.direction_names[0] == "Латина соло 18+"
+    assert [d["id"] for d in snapshot.groups_for_age(8)] == ["dance_mix_7_11"]
+    assert snapshot.groups_for_age(40) == ()
+
+
+def test_validation_rejects_schedule_without_direction():
+    with pytest.raises(CatalogError):
+        parse_catalog(json.dumps({"schedule": [{"day": "Среда", "time": "19:00"}]}))
+
+
+
+@pytest.mark.parametrize("ages", [(0, 10**9), (-1, 10), (12, 7)])
+def test_validation_rejects_bad_age_range(ages):
+    direction = {"id": "d", "name": "Группа", "age_min": ages[0], "age_max": ages[1]}
+    with pytest.raises(CatalogError, match="age_m"):
+        parse_catalog(json.dumps({"directions": [direction]}))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,124 @@
+"""
+Тесты пакетного эндпоинта /chat/batch
+"""
+from pathlib import Path
+
+import httpx
+import pytest
+from httpx import ASGITransport
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from conftest import RENT, RENT_BUTTON, rent_turn  # type: ignore
+from app.batch import ChatBatch
+from app.fsm import StateChange
+from app.main import app, process_batch
+
+
+async def _post_batch(items):
+    transport = ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        return await client.post("/chat/batch", json=items)
+
+
+@pytest.mark.asyncio
+async def test_batch_applies_same_user_turns_in_order(async_fsm):
+    """Весь поток аренды одного пользователя в одном пакете"""
+    response = await _post_batch([
+        rent_turn("batch_a", "", "button", RENT_BUTTON),
+        rent_turn("batch_b", "", "button", RENT_BUTTON),
+        rent_turn("batch_a", "после 16"),
+        rent_turn("batch_a", "12"),
+        rent_turn("batch_a", "занятие"),
+    ])
+    assert response.status_code == 200
+    items = response.json()
+
+    assert [item["status"] for item in items] == [200] * 5
+    states = [item["response"]["debug"]["state_after"] for item in items]
+    assert states == ["rent_need_time", "rent_need_time", "rent_need_people", "rent_need_format", "idle"]
+    assert "1500" in items[4]["response"]["reply"]
+
+    assert await async_fsm.get_state("studio_nexa", "simulator", "batch_a") is None
+    state_b = await async_fsm.get_state("studio_nexa", "simulator", "batch_b")
+    assert state_b["state"] == "rent_need_time"
+
+
+@pytest.mark.asyncio
+async def test_batch_reports_errors_per_item(async_fsm):
+    """Невалидный элемент не мешает остальным"""
+    response = await _post_batch([
+        {"user_id": "batch_c", "text": "привет"},
+        rent_turn("batch_c", "", "button", RENT_BUTTON),
+    ])
+    items = response.json()
+
+    assert items[0]["status"] == 422
+    assert items[0]["response"] is None and "scenario" in items[0]["error"]
+    assert items[1]["status"] == 200
+    assert items[1]["response"]["intent"] == "calculate_rental"
+
+
+@pytest.mark.asyncio
+async def test_batch_size_limit(async_fsm, monkeypatch):
+    import app.main as main
+    monkeypatch.setattr(main, "CHAT_BATCH_MAX_ITEMS", 2)
+    response = await _post_batch([rent_turn(f"u{i}", "") for i in range(3)])
+    assert response.status_code == 413
+
+
+def test_sync_batch_uses_one_read_and_one_write(fsm):
+    """Состояния читаются одним MGET, переходы пишутся одним pipeline"""
+    fsm.set_state("studio_nexa", "simulator", "batch_d", RENT, "rent_need_people", {"rent_time_bucket": "daytime"})
+    calls = {"mget": 0, "pipeline": 0}
+    client = fsm.redis_client
+    original_mget, original_pipeline = client.mget, client.pipeline
+
+    def mget(*args, **kwargs):
+        calls["mget"] += 1
+        return original_mget(*args, **kwargs)
+
+    def pipeline(*args, **kwargs):
+        calls["pipeline"] += 1
+        return original_pipeline(*args, **kwargs)
+
+    client.mget, client.pipeline = mget, pipeline
+
+    from app.main import ChatRequest
+    batch = ChatBatch(3)
+    batch.add(0, ChatRequest(**rent_turn("batch_d", "8")))
+    batch.add(1, ChatRequest(**rent_turn("batch_e", "", "button", RENT_BUTTON)))
+    batch.add(2, ChatRequest(**rent_turn("batch_d", "репетиция")))
+    process_batch(batch)
+
+    assert calls == {"mget": 1, "pipeline": 1}
+    assert [r.status for r in batch.results] == [200, 200, 200]
+    assert fsm.get_state("studio_nexa", "simulator", "batch_d") is None
+    assert fsm.get_state("studio_nexa", "simulator", "batch_e")["state"] == "rent_need_time"
+
+
+def test_sync_batch_recomputes_user_after_conflict(fsm):
+    """Конкурентная запись между чтением и записью: ходы пересчитываются"""
+    from app.main import ChatRequest
+    user = ("studio_nexa", "simulator", "batch_f")
+    original_mget = fsm.redis_client.mget
+
+    def mget(keys, *args):
+        values = original_mget(keys, *args)
+        # Другой воркер успел начать сценарий аренды
+        change = StateChange()
+        change.set_state(RENT, "rent_need_time", {})
+        fsm.transition(*user, None, change)
+        return values
+
+    fsm.redis_client.mget = mget
+
+    batch = ChatBatch(1)
+    batch.add(0, ChatRequest(**rent_turn("batch_f", "после 16")))
+    process_batch(batch)
+
+    assert batch.results[0].status == 200
+    assert batch.results[0].result[2]["state_before"] == "rent_need_time"
+    assert fsm.get_state(*user)["state"] == "rent_need_people"
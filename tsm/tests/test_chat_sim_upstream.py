@@ -0,0 +1,87 @@
+"""
+Тесты клиента оркестратора в chat-sim: повторы, дедлайн, хеджирование
+"""
+import asyncio
+import importlib.util
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+# У chat-sim свой пакет app: модуль грузится по пути, без конфликта с оркестратором
+_spec = importlib.util.spec_from_file_location(
+    "chat_sim_upstream", Path(__file__).parent.parent / "services" / "chat-sim" / "app" / "upstream.py")
+upstream = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(upstream)
+
+SETTINGS = upstream.UpstreamSettings(retry_attempts=2, retry_base_delay=0.001, deadline=2.0)
+
+
+def _client(handler, **overrides):
+    settings = upstream.UpstreamSettings(**{**SETTINGS.__dict__, **overrides})
+    return upstream.UpstreamClient("http://orchestrator", settings, transport=httpx.MockTransport(handler))
+
+
+def _scripted(*steps):
+    """Обработчик, отвечающий по очереди: исключение, код ответа или (задержка, код)"""
+    calls = []
+
+    async def handler(request):
+        step = steps[min(len(calls), len(steps) - 1)]
+        calls.append(request)
+        if isinstance(step, Exception):
+            raise step
+        if isinstance(step, tuple):
+            await asyncio.sleep(step[0])
+            step = step[1]
+        return httpx.Response(step, json={"call": len(calls)})
+    return handler, calls
+
+
+@pytest.mark.asyncio
+async def test_chat_retried_only_when_not_sent():
+    handler, calls = _scripted(httpx.ConnectError("refused"), 200)
+    client = _client(handler)
+    response = await client.post_json("/chat", {"text": "12"})
+    assert response.status_code == 200 and len(calls) == 2
+    assert client.stats.retries == 1
+
+    # Запрос мог примениться: неидемпотентный ход не повторяется
+    handler, calls = _scripted(httpx.ReadTimeout("slow"), 200)
+    client = _client(handler)
+    with pytest.raises(httpx.ReadTimeout):
+        await client.post_json("/chat", {"text": "12"})
+    assert len(calls) == 1 and client.stats.failures == 1
+
+
+@pytest.mark.asyncio
+async def test_idempotent_retries_and_deadline():
+    handler, calls = _scripted(503, httpx.ReadTimeout("slow"), 200)
+    client = _client(handler)
+    response = await client.get("/ready")
+    assert response.status_code == 200 and len(calls) == 3
+
+    handler, _ = _scripted((1.0, 200))
+    client = _client(handler)
+    started = time.perf_counter()
+    with pytest.raises(httpx.TimeoutException):
+        await client.get("/ready", deadline=0.1)
+    assert time.perf_counter() - started < 0.5
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_wins_over_slow_replica():
+    handler, calls = _scripted((1.0, 200), 200)
+    client = _client(handler, hedge_after=0.05)
+    started = time.perf_counter()
+    response = await client.get("/ready")
+    assert time.perf_counter() - started < 0.5
+    assert response.json() == {"call": 2}
+    assert (client.stats.hedges, client.stats.hedge_wins) == (1, 1)
+
+    # /chat не хеджируется: ход применился бы дважды
+    handler, calls = _scripted((0.2, 200))
+    client = _client(handler, hedge_after=0.05)
+    await client.post_json("/chat", {"text": "12"})
+    assert len(calls) == 1 and client.stats.hedges == 0
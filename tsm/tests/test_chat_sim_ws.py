@@ -0,0 +1,92 @@
+"""
+Тесты WebSocket-прокси chat-sim (/api/ws -> orchestrator /chat/ws)
+"""
+import importlib
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+import fakeredis
+import pytest
+import uvicorn
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.fsm import FSM
+from app.main import app as orchestrator_app, set_fsm
+
+CHAT_SIM = str(Path(__file__).parent.parent / "services" / "chat-sim")
+RENT_BUTTON = {"text": "", "scenario": "Аренда зала", "action_type": "button",
+               "action_name": "Рассчитать стоимость аренды"}
+
+
+def _load_chat_sim():
+    """app.main chat-sim: пакет app у него свой, модули оркестратора возвращаются на место"""
+    def app_modules():
+        return {name: module for name, module in sys.modules.items() if name == "app" or name.startswith("app.")}
+
+    saved = app_modules()
+    for name in saved:
+        del sys.modules[name]
+    sys.path.insert(0, CHAT_SIM)
+    try:
+        return importlib.import_module("app.main")
+    finally:
+        sys.path.remove(CHAT_SIM)
+        for name in app_modules():
+            del sys.modules[name]
+        sys.modules.update(saved)
+
+
+chat_sim = _load_chat_sim()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def orchestrator_url():
+    """Оркестратор на fakeredis в uvicorn в отдельном потоке"""
+    fsm = FSM("redis://localhost:6379/0")
+    fsm.redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+    set_fsm(fsm)
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(orchestrator_app, port=port, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield f"ws://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(5)
+    set_fsm(None)
+
+
+def test_proxy_passes_frames(orchestrator_url, monkeypatch):
+    monkeypatch.setattr(chat_sim, "ORCHESTRATOR_WS_URL", orchestrator_url)
+    with TestClient(chat_sim.app).websocket_connect("/api/ws") as ws:
+        ws.send_json({**RENT_BUTTON, "id": 1})
+        first = ws.receive_json()
+        ws.send_text("")
+        empty = ws.receive_json()
+        ws.send_json({"text": "после 16", "scenario": "Аренда зала", "action_type": "text", "id": 2})
+        second = ws.receive_json()
+    assert first["id"] == 1 and first["debug"]["state_after"] == "rent_need_time"
+    assert empty["status"] == 422
+    assert second["id"] == 2 and second["debug"]["state_before"] == "rent_need_time"
+
+
+def test_proxy_closes_when_orchestrator_down(monkeypatch):
+    monkeypatch.setattr(chat_sim, "ORCHESTRATOR_WS_URL", f"ws://127.0.0.1:{_free_port()}")
+    with TestClient(chat_sim.app).websocket_connect("/api/ws") as ws:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 1011
@@ -0,0 +1,60 @@
+"""
+Тесты WebSocket-сессии чата (/chat/ws)
+"""
+from pathlib import Path
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.fsm import FSM
+from app.main import app, set_fsm
+
+RENT = "Аренда зала"
+RENT_BUTTON = {"text": "", "action_type": "button", "action_name": "Рассчитать стоимость аренды"}
+
+
+@pytest.fixture
+def client():
+    fsm = FSM("redis://localhost:6379/0")
+    fsm.redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+    set_fsm(fsm)
+    yield TestClient(app)
+    set_fsm(None)
+
+
+def test_ws_turns_share_session_with_http(client):
+    """Личность сессии задается при подключении; состояние то же, что у /chat"""
+    with client.websocket_connect(f"/chat/ws?user_id=ws_user&scenario={RENT}") as ws:
+        ws.send_json({**RENT_BUTTON, "id": 1})
+        first = ws.receive_json()
+        ws.send_json({"text": "после 16", "action_type": "text", "id": "b"})
+        second = ws.receive_json()
+    assert first["id"] == 1 and first["debug"]["state_after"] == "rent_need_time"
+    assert second["id"] == "b" and second["debug"]["state_before"] == "rent_need_time"
+
+    http = client.post("/chat", json={"user_id": "ws_user", "scenario": RENT, "text": "12", "action_type": "text"})
+    assert http.json()["debug"]["state_before"] == "rent_need_people"
+
+
+def test_ws_lean_session(client):
+    with client.websocket_connect(f"/chat/ws?user_id=ws_lean&scenario={RENT}&response_mode=lean") as ws:
+        ws.send_json(RENT_BUTTON)
+        body = ws.receive_json()
+    assert set(body) == {"reply", "intent", "version"}
+
+
+def test_ws_bad_frame_keeps_connection(client):
+    with client.websocket_connect("/chat/ws?user_id=ws_errors") as ws:
+        ws.send_text("{не json")
+        invalid = ws.receive_json()
+        ws.send_json({**RENT_BUTTON, "id": 7})
+        no_scenario = ws.receive_json()
+        ws.send_json({**RENT_BUTTON, "scenario": RENT, "id": 8})
+        ok = ws.receive_json()
+    assert invalid["status"] == 422 and invalid["id"] is None
+    assert no_scenario["status"] == 422 and no_scenario["id"] == 7
+    assert ok["id"] == 8 and ok["debug"]["state_after"] == "rent_need_time"
@@ -0,0 +1,144 @@
+"""
+Тесты табличного движка диалогов
+"""
+from pathlib import Path
+
+import pytest
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.catalog import CatalogSnapshot
+from app.dialogs import engine as dialog_engine
+from app.engine import IDLE, Engine, EngineError
+from app.fsm import StateChange
+from app.session import SessionState
+
+RETRY = ("?", "intent", "rule")
+
+
+def _engine_with_defaults() -> Engine:
+    engine = Engine()
+    engine.fallback(lambda ctx: ctx.reply("fallback", "general", "general"))
+    engine.unknown_state(lambda ctx: ctx.reply("error", "error", "error"))
+    return engine
+
+
+def test_studio_table_is_compiled():
+    assert dialog_engine.compiled
+    assert set(dialog_engine.states) == {
+        "kids_need_age", "rent_need_time", "rent_need_people",
+        "rent_need_format", "booking_need_direction",
+    }
+    assert "Посмотреть расписание" in dialog_engine.buttons
+    assert set(dialog_engine.entries) == {"Детские группы", "Аренда зала", "Запись на занятие"}
+
+
+def test_unreachable_state_rejected():
+    engine = _engine_with_defaults()
+    engine.state("orphan", extractor=lambda ctx: ctx.text, next_states=[IDLE], retry=RETRY)(
+        lambda ctx, value: ctx.reply("ok", "i", "r"))
+    with pytest.raises(EngineError, match="недостижимые"):
+        engine.compile()
+
+
+def test_dead_state_rejected():
+    engine = _engine_with_defaults()
+    engine.button("start", next_states=["loop"])(lambda ctx: ctx.reply("ok", "i", "r"))
+    engine.state("loop", extractor=lambda ctx: ctx.text, next_states=["loop"], retry=RETRY)(
+        lambda ctx, value: ctx.reply("ok", "i", "r"))
+    with pytest.raises(EngineError, match="тупиковое"):
+        engine.compile()
+
+
+def test_transition_to_unregistered_state_rejected():
+    engine = _engine_with_defaults()
+    engine.button("start", next_states=["missing"])(lambda ctx: ctx.reply("ok", "i", "r"))
+    with pytest.raises(EngineError, match="незарегистрированные"):
+        engine.compile()
+
+
+def test_undeclared_runtime_transition_rejected():
+    engine = _engine_with_defaults()
+
+    @engine.button("start", next_states=[IDLE])
+    def start(ctx):
+        ctx.set_state("s", "somewhere", {})
+        return ctx.reply("ok", "i", "r")
+
+    engine.compile()
+    with pytest.raises(EngineError, match="не объявлен"):
+        engine.run("s", "", "button", "start", None, CatalogSnapshot.build({}), StateChange())
+
+
+def test_new_scenario_plugs_in():
+    """Новый сценарий добавляется регистрацией, без правки существующих"""
+    engine = _engine_with_defaults()
+
+    @engine.entry("Подарочный сертификат", next_states=["gift_need_amount"])
+    def gift_entry(ctx):
+        ctx.set_state(ctx.scenario, "gift_need_amount", {})
+        return ctx.reply("На какую сумму?", "gift", "gift: начало")
+
+    @engine.state("gift_need_amount", extractor=lambda ctx: ctx.text.isdigit() and int(ctx.text),
+                  next_states=[IDLE], retry=("Укажите сумму числом", "gift", "gift: неверная сумма"))
+    def gift_amount(ctx, amount):
+        ctx.clear_state()
+        return ctx.reply(f"Сертификат на {amount} руб.", "gift", "gift: сумма")
+
+    engine.compile()
+    catalog = CatalogSnapshot.build({})
+
+    change = StateChange()
+    _, _, debug = engine.run("Подарочный сертификат", "", "text", None, None, catalog, change)
+    assert debug["state_after"] == "gift_need_amount"
+
+    session = SessionState("Подарочный сертификат", "gift_need_amount", {})
+    change = StateChange()
+    reply, _, debug = engine.run("Подарочный сертификат", "3000", "text", None, session, catalog, change)
+    assert reply == "Сертификат на 3000 руб."
+    assert change.op == "clear"
+    assert debug["state_after"] == IDLE
+
+
+def test_fragments_rendered_once_per_catalog_version():
+    engine = _engine_with_defaults()
+    renders = []
+
+    @engine.fragment("names", keys=lambda catalog: catalog.directions_by_id)
+    def names(catalog, direction_id):
+        renders.append((catalog.version, direction_id))
+        return catalog.direction(direction_id)["name"].upper()
+
+    @engine.button("show", next_states=[])
+    def show(ctx):
+        return ctx.reply(ctx.fragment("names", "yoga"), "i", "r")
+
+    engine.compile()
+    old = CatalogSnapshot.build({"directions": [{"id": "yoga", "name": "Йога"}]}, version=1)
+    for _ in range(3):
+        reply, _, _ = engine.run("s", "", "button", "show", None, old, StateChange())
+    assert reply == "ЙОГА"
+    assert renders == [(1, "yoga")]  # отрендерен заранее при первом ходе версии
+
+    # Новая версия каталога получает свой кэш
+    new = CatalogSnapshot.build({"directions": [{"id": "yoga", "name": "Хатха"}]}, version=2)
+    reply, _, _ = engine.run("s", "", "button", "show", None, new, StateChange())
+    assert reply == "ХАТХА"
+    assert renders == [(1, "yoga"), (2, "yoga")]
+
+
+def test_studio_schedule_fragment_matches_catalog():
+    catalog = CatalogSnapshot.build({
+        "directions": [{"id": "yoga", "name": "Йога"}],
+        "schedule": [{"direction_id": "yoga", "day": "Пн", "time": "10:00"}],
+    })
+    reply, intent, _ = dialog_engine.run("Запись на занятие", "", "button", "Посмотреть расписание",
+                                         None, catalog, StateChange())
+    assert intent == "view_schedule"
+    assert "• Пн, 10:00 — Йога" in reply
+    assert len(catalog.fragments) == 3  # booking_question, schedule, booking_slots[yoga]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,71 @@
+"""
+Тесты однопроходного извлекателя сущностей
+"""
+import json
+import random
+from pathlib import Path
+
+import pytest
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.extractor import EntityExtractor
+from app.fsm import (
+    extract_age, extract_direction, extract_people_count,
+    extract_rent_format, extract_rent_time_bucket
+)
+
+STUB_PATH = Path(__file__).parent.parent / "data" / "dikidi_stub.json"
+DIRECTIONS = json.loads(STUB_PATH.read_text(encoding="utf-8"))["directions"]
+
+VOCABULARY = [
+    "латина", "Латино", "хай хилс", "хилс", "High Heels", "хорео", "хореография",
+    "Dance Mix", "микс", "танцы", "Азбука танца 3-5", "малыши", "йога", "Хатха-йога",
+    "тренировка", "занятие", "урок", "репетиция", "репет", "фотосессия", "фото",
+    "съемка", "до", "после", "до 16:00", "после 16", "18:30", "8", "12", "100",
+    "101", "0", "8лет", "привет", "здорово", "нас", "человек", "в среду", ",", "!",
+]
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return EntityExtractor(DIRECTIONS)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Латина", {"direction_id": "latina_solo_18"}),
+    ("хочу на хай хилс", {"direction_id": "high_heels_18"}),
+    ("после 16, нас 12, репетиция", {"time_bucket": "evening", "number": 16, "format": "rehearsal"}),
+    ("в 18:30", {"time_bucket": "evening", "number": 18}),
+    ("8лет", {"number": None, "time_bucket": "daytime"}),
+    ("просто вопрос", {"number": None, "time_bucket": None, "direction_id": None, "format": None}),
+])
+def test_extract_examples(extractor, text, expected):
+    entities = extractor.extract(text)
+    for field, value in expected.items():
+        assert getattr(entities, field) == value
+
+
+def test_matches_reference_extractors(extractor):
+    """Результат совпадает с отдельными extract_* на случайных сообщениях"""
+    rng = random.Random(42)
+    for _ in range(3000):
+        text = " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(1, 8)))
+        entities = extractor.extract(text)
+        assert entities.age == extract_age(text), text
+        assert entities.people_count == extract_people_count(text), text
+        assert entities.time_bucket == extract_rent_time_bucket(text), text
+        assert entities.direction_id == extract_direction(text, DIRECTIONS), text
+        assert entities.format == extract_rent_format(text), text
+
+
+def test_empty_catalog_still_extracts_formats_and_time():
+    entities = EntityExtractor([]).extract("фотосессия до обеда")
+    assert entities.format == "photo_session"
+    assert entities.time_bucket == "daytime"
+    assert entities.direction_id is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,72 @@
+"""
+Тесты атомарных переходов состояния (compare-and-set)
+"""
+from pathlib import Path
+
+import pytest
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.fsm import StaleStateError, StateChange, encode_state
+from app.main import process_state_machine
+
+USER = ("studio_nexa", "simulator", "cas_user")
+
+
+def _change(state: str, data: dict = None) -> StateChange:
+    change = StateChange()
+    change.set_state("Аренда зала", state, data)
+    return change
+
+
+def test_transition_applies_when_expected_matches(fsm):
+    fsm.transition(*USER, None, _change("rent_need_time"))
+    raw = fsm.get_state_raw(*USER)
+    assert fsm.get_state(*USER)["state"] == "rent_need_time"
+
+    clear = StateChange()
+    clear.clear_state()
+    fsm.transition(*USER, raw, clear)
+    assert fsm.get_state(*USER) is None
+
+
+def test_transition_conflict_reports_current_state(fsm):
+    fsm.set_state(*USER, "Аренда зала", "rent_need_people", {"rent_time_bucket": "evening"})
+    current = fsm.get_state_raw(*USER)
+
+    with pytest.raises(StaleStateError) as exc:
+        fsm.transition(*USER, None, _change("rent_need_time"))
+
+    assert exc.value.current == current
+    # Состояние не перезаписано
+    assert fsm.get_state(*USER)["state"] == "rent_need_people"
+
+
+def test_process_state_machine_retries_after_conflict(fsm):
+    """
+    Ход считан в устаревшем состоянии (конкурентный ход уже продвинул диалог):
+    после конфликта ход пересчитывается от актуального состояния.
+    """
+    fsm.set_state(*USER, "Аренда зала", "rent_need_people", {"rent_time_bucket": "evening"})
+    stale = encode_state("Аренда зала", "rent_need_time", {})
+    reads = []
+    original = fsm.get_state_raw
+
+    def stale_once(*args):
+        reads.append(args)
+        return stale if len(reads) == 1 else original(*args)
+
+    fsm.get_state_raw = stale_once
+
+    _, _, debug = process_state_machine("Аренда зала", "12", "text", None, *USER)
+
+    assert debug["state_before"] == "rent_need_people"
+    assert debug["state_after"] == "rent_need_format"
+    # Повторного чтения не было: текущее значение пришло вместе с конфликтом
+    assert len(reads) == 1
+    assert fsm.get_state(*USER)["data"] == {"rent_time_bucket": "evening", "people_count": 12}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
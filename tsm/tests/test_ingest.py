@@ -0,0 +1,222 @@
+"""
+Тесты очереди приема: порядок по пользователю, параллельность, backpressure
+"""
+import asyncio
+import json
+import random
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from httpx import ASGITransport
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.fsm import AsyncFSM
+from app.ingest import IngestQueue, LineTooLong, iter_ndjson
+from app.main import app, run_turn, set_async_fsm, set_ingest_queue
+
+
+def _message(user_id: str, seq: int = 0, tenant_id: str = "studio_nexa"):
+    return SimpleNamespace(tenant_id=tenant_id, channel="simulator", user_id=user_id, seq=seq)
+
+
+@pytest.mark.asyncio
+async def test_same_user_in_order_different_users_in_parallel():
+    seen = {}
+    active = 0
+    peak = 0
+    rng = random.Random(7)
+
+    async def handler(message):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(rng.random() / 1000)
+        seen.setdefault(message.user_id, []).append(message.seq)
+        active -= 1
+        return message.seq
+
+    queue = IngestQueue(handler, workers=4, queue_size=5)
+    futures = []
+    for seq in range(20):
+        for user in range(6):
+            futures.append(await queue.submit(_message(f"user_{user}", seq)))
+    results = await asyncio.gather(*futures)
+    await queue.stop()
+
+    assert results == [seq for seq in range(20) for _ in range(6)]
+    assert all(order == list(range(20)) for order in seen.values())
+    assert peak > 1
+    stats = queue.stats()
+    assert stats["processed"] == 120 and stats["depth_total"] == 0
+
+
+@pytest.mark.asyncio
+async def test_full_shard_applies_backpressure():
+    release = asyncio.Event()
+
+    async def handler(message):
+        await release.wait()
+
+    queue = IngestQueue(handler, workers=1, queue_size=2)
+    for seq in range(3):  # одно в обработке, два в очереди
+        await queue.submit(_message("hot", seq))
+    await asyncio.sleep(0)
+    waits = queue.stats()["backpressure_waits"]
+
+    blocked = asyncio.create_task(queue.submit(_message("hot", 3)))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+    assert queue.depths() == [2]
+    assert queue.stats()["backpressure_waits"] == waits + 1
+
+    release.set()
+    await blocked
+    await queue.stop()
+    assert queue.stats()["processed"] == 4
+
+
+@pytest.mark.asyncio
+async def test_tenant_pending_limit():
+    release = asyncio.Event()
+
+    async def handler(message):
+        await release.wait()
+
+    queue = IngestQueue(handler, workers=8, queue_size=10, tenant_max_pending=2)
+    await queue.submit(_message("a", tenant_id="hot"))
+    await queue.submit(_message("b", tenant_id="hot"))
+    blocked = asyncio.create_task(queue.submit(_message("c", tenant_id="hot")))
+    # Другой тенант не ждет горячего
+    await asyncio.wait_for(queue.submit(_message("d", tenant_id="calm")), timeout=1)
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+    assert queue.stats()["tenant_pending"] == {"hot": 2, "calm": 1}
+
+    release.set()
+    await blocked
+    await queue.stop()
+    assert queue.stats()["tenant_pending"] == {}
+
+
+@pytest.mark.asyncio
+async def test_handler_error_is_reported_on_future():
+    async def handler(message):
+        raise RuntimeError("boom")
+
+    queue = IngestQueue(handler, workers=2, queue_size=2)
+    future = await queue.submit(_message("u"))
+    with pytest.raises(RuntimeError):
+        await future
+    await queue.stop()
+    assert queue.stats()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_iter_ndjson_splits_chunks():
+    async def chunks():
+        for chunk in (b'{"a": 1}\n{"b"', b': 2}\n\n', b'{"c": 3}'):
+            yield chunk
+
+    assert [json.loads(line) async for line in iter_ndjson(chunks())] == [{"a": 1}, {"b": 2}, {"c": 3}]
+
+
+@pytest.mark.asyncio
+async def test_iter_ndjson_reports_long_lines():
+    async def chunks():
+        for chunk in (b'{"a": 1}\n' + b"x" * 10, b"x" * 10, b"x\n{\"b\": 2}\n" + b"y" * 30 + b"\n", b"z" * 30):
+            yield chunk
+
+    lines = [line async for line in iter_ndjson(chunks(), max_line=20)]
+    assert [json.loads(line) for line in lines if not isinstance(line, LineTooLong)] == [{"a": 1}, {"b": 2}]
+    assert [type(line) for line in lines] == [bytes, LineTooLong, bytes, LineTooLong, LineTooLong]
+
+
+@pytest.mark.asyncio
+async def test_ingest_endpoint_streams_results_in_order():
+    import fakeredis
+    fsm = AsyncFSM("redis://localhost:6379/0")
+    fsm.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    set_async_fsm(fsm)
+    queue = IngestQueue(run_turn, workers=4, queue_size=2)
+    set_ingest_queue(queue)
+
+    def turn(user_id, text, action_type="text", action_name=None):
+        return {"user_id": user_id, "text": text, "scenario": "Аренда зала",
+                "action_type": action_type, "action_name": action_name}
+
+    lines = []
+    for user in ("ingest_a", "ingest_b", "ingest_c"):
+        lines.append(turn(user, "", "button", "Рассчитать стоимость аренды"))
+    for user in ("ingest_a", "ingest_b", "ingest_c"):
+        lines.append(turn(user, "до 16"))
+        lines.append(turn(user, "5"))
+    body = "\n".join(json.dumps(line, ensure_ascii=False) for line in lines) + "\nnot json\n"
+    body = body.encode("utf-8") + b'{"text": "\xff"}\n' + b"x" * 70000 + b"\n"
+
+    try:
+        transport = ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            response = await client.post("/chat/ingest", content=body,
+                                         headers={"content-type": "application/x-ndjson"})
+            stats = (await client.get("/ingest/stats")).json()
+    finally:
+        await queue.stop()
+        set_ingest_queue(None)
+        set_async_fsm(None)
+
+    items = [json.loads(line) for line in response.text.splitlines()]
+    assert len(items) == len(lines) + 3
+    assert [item["status"] for item in items] == [200] * len(lines) + [422, 422, 413]
+    assert "utf-8" in items[-2]["error"]
+    states = [item["response"]["debug"]["state_after"] for item in items[:-3]]
+    assert states == ["rent_need_time"] * 3 + ["rent_need_people", "rent_need_format"] * 3
+    assert stats["processed"] == len(lines)
+    state = await fsm.get_state("studio_nexa", "simulator", "ingest_b")
+    assert state["data"] == {"rent_time_bucket": "daytime", "people_count": 5}
+
+
+@pytest.mark.asyncio
+async def test_ingest_answers_while_body_is_streaming():
+    """Первый результат уходит до конца тела: иначе receive ниже не вернется"""
+    import fakeredis
+    fsm = AsyncFSM("redis://localhost:6379/0")
+    fsm.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    set_async_fsm(fsm)
+    queue = IngestQueue(run_turn, workers=2, queue_size=2)
+    set_ingest_queue(queue)
+
+    line = json.dumps({"user_id": "ingest_stream", "text": "", "scenario": "Аренда зала",
+                       "action_type": "button", "action_name": "Рассчитать стоимость аренды"},
+                      ensure_ascii=False).encode("utf-8")
+    first_result = asyncio.Event()
+    chunks = [{"type": "http.request", "body": line + b"\n", "more_body": True},
+              {"type": "http.request", "body": b"not json\n", "more_body": False}]
+    sent = []
+
+    async def receive():
+        if len(chunks) == 1:
+            await first_result.wait()
+        return chunks.pop(0) if chunks else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        if message["type"] == "http.response.body" and message.get("body"):
+            first_result.set()
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+             "scheme": "http", "path": "/chat/ingest", "raw_path": b"/chat/ingest", "root_path": "",
+             "query_string": b"", "headers": [(b"content-type", b"application/x-ndjson")],
+             "client": ("127.0.0.1", 1), "server": ("testserver", 80)}
+    try:
+        await asyncio.wait_for(app(scope, receive, send), 5)
+    finally:
+        await queue.stop()
+        set_ingest_queue(None)
+        set_async_fsm(None)
+
+    body = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+    assert [json.loads(item)["status"] for item in body.splitlines()] == [200, 422]
@@ -0,0 +1,106 @@
+"""
+Тесты схемы ключей, TTL по состояниям и отчета о памяти
+"""
+from pathlib import Path
+
+import pytest
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.fsm import FSM, AsyncFSM, StateChange
+from app.keyspace import KeyLayout, TtlPolicy, memory_report, parse_ttl_overrides
+
+USER = ("studio_nexa", "telegram", "1234567890")
+RENT = "Аренда зала"
+
+
+def _fsm(layout="full", policy=None):
+    import fakeredis
+    fsm = FSM("redis://localhost:6379/0", layout=KeyLayout(layout), ttl_policy=policy or TtlPolicy.tiered())
+    fsm.redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+    return fsm
+
+
+def test_layouts():
+    assert KeyLayout("full").key(*USER) == "state:studio_nexa:telegram:1234567890"
+    assert KeyLayout("short").key(*USER) == "s:studio_nexa:telegram:1234567890"
+
+    hashed = KeyLayout("hashed")
+    key = hashed.key(*USER)
+    assert key.startswith("s:studio_nexa:") and len(key) == len("s:studio_nexa:") + 16
+    assert key == hashed.key(*USER)
+    assert key != hashed.key("studio_nexa", "whatsapp", "1234567890")
+    assert hashed.tenant_of(key) == "studio_nexa"
+    with pytest.raises(ValueError):
+        KeyLayout("tiny")
+
+
+def test_ttl_follows_state():
+    fsm = _fsm("hashed", TtlPolicy.tiered(default=86400, entry=600))
+    key = fsm.get_state_key(*USER)
+
+    change = StateChange()
+    change.set_state(RENT, "rent_need_time", {})
+    fsm.transition(*USER, None, change)
+    assert 0 < fsm.redis_client.ttl(key) <= 600
+
+    expected = fsm.get_state_raw(*USER)
+    change = StateChange()
+    change.set_state(RENT, "rent_need_people", {"rent_time_bucket": "evening"})
+    fsm.transition(*USER, expected, change)
+    assert fsm.redis_client.ttl(key) > 600
+
+    # Терминальное состояние: ключ удаляется сразу
+    change = StateChange()
+    change.set_state(RENT, "idle", {})
+    fsm.transition(*USER, fsm.get_state_raw(*USER), change)
+    assert not fsm.redis_client.exists(key)
+    assert fsm.get_state(*USER) is None
+
+    fsm.set_state(*USER, RENT, "rent_need_format", {})
+    assert fsm.redis_client.ttl(key) > 600
+    fsm.set_state(*USER, RENT, "idle", {})
+    assert not fsm.redis_client.exists(key)
+
+
+@pytest.mark.asyncio
+async def test_async_fsm_uses_layout_and_policy():
+    import fakeredis
+    fsm = AsyncFSM("redis://localhost:6379/0", layout=KeyLayout("short"),
+                   ttl_policy=TtlPolicy.tiered(entry=300, overrides={"rent_need_people": 0}))
+    fsm.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    change = StateChange()
+    change.set_state(RENT, "rent_need_time", {})
+    await fsm.transition(*USER, None, change)
+    assert 0 < await fsm.redis_client.ttl("s:studio_nexa:telegram:1234567890") <= 300
+
+    change = StateChange()
+    change.set_state(RENT, "rent_need_people", {})
+    await fsm.transition(*USER, await fsm.get_state_raw(*USER), change)
+    assert await fsm.get_state(*USER) is None
+
+
+def test_parse_overrides():
+    assert parse_ttl_overrides(" rent_need_people=43200, idle=0,") == {"rent_need_people": 43200, "idle": 0}
+    with pytest.raises(ValueError):
+        parse_ttl_overrides("rent_need_people")
+
+
+def test_memory_report_groups_by_tenant_and_state():
+    fsm = _fsm("hashed")
+    for i in range(30):
+        fsm.set_state("studio_a" if i % 3 else "studio_b", "telegram", str(i), RENT,
+                      "rent_need_time" if i % 2 else "rent_need_format", {"people_count": 12})
+    fsm.redis_client.set("other:key", "x")
+
+    report = memory_report(fsm.redis_client, fsm.layout)
+    assert report.sampled == 30 and report.estimated  # fakeredis не знает MEMORY USAGE
+    rows = {(row["tenant"], row["state"]): row for row in report.as_rows()}
+    assert rows[("studio_a", "rent_need_time")]["keys"] == 10
+    assert rows[("studio_b", "rent_need_format")]["keys"] == 5
+    assert report.per_session > 0
+
+    assert memory_report(fsm.redis_client, fsm.layout, tenant_id="studio_b").sampled == 10
+    assert memory_report(fsm.redis_client, fsm.layout, sample=7, batch=3).sampled == 7
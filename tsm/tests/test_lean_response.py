@@ -0,0 +1,66 @@
+"""
+Тесты легкого режима ответа /chat (response_mode="lean", LEAN_CHANNELS)
+"""
+from pathlib import Path
+
+import httpx
+import pytest
+from httpx import ASGITransport
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from conftest import rent_turn  # type: ignore
+import app.main as main
+from app.main import app
+from app.metrics import RULES
+
+
+def _client():
+    return httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver")
+
+
+@pytest.mark.asyncio
+async def test_lean_mode_returns_reply_only(async_fsm):
+    async with _client() as client:
+        full = await client.post("/chat", json=rent_turn("full", "", "button", "Рассчитать стоимость аренды"))
+        lean = await client.post("/chat", json=rent_turn("lean", "", "button", "Рассчитать стоимость аренды",
+                                                     response_mode="lean"))
+        # Состояние в легком режиме сохраняется так же
+        nxt = await client.post("/chat", json=rent_turn("lean", "после 16"))
+    assert lean.status_code == 200
+    body = lean.json()
+    assert set(body) == {"reply", "intent", "version"}
+    assert body["reply"] == full.json()["reply"]
+    assert body["intent"] == full.json()["intent"]
+    assert nxt.json()["debug"]["state_before"] == "rent_need_time"
+
+
+@pytest.mark.asyncio
+async def test_lean_channel_default_and_explicit_full(async_fsm, monkeypatch):
+    monkeypatch.setattr(main, "LEAN_CHANNELS", frozenset({"telegram"}))
+    async with _client() as client:
+        lean = await client.post("/chat", json=rent_turn("tg", "", "button", "Рассчитать стоимость аренды",
+                                                     channel="telegram"))
+        full = await client.post("/chat", json=rent_turn("tg", "после 16", channel="telegram",
+                                                     response_mode="full"))
+    assert "debug" not in lean.json()
+    assert full.json()["debug"]["state_before"] == "rent_need_time"
+
+
+@pytest.mark.asyncio
+async def test_lean_mode_keeps_metrics_and_yields_to_timings(async_fsm):
+    async with _client() as client:
+        rule = (await client.post("/chat", json=rent_turn("m1", "", "button", "Рассчитать стоимость аренды"))
+                ).json()["debug"]["rule_used"]
+        before = RULES.labels(rule).value
+        await client.post("/chat", json=rent_turn("m2", "", "button", "Рассчитать стоимость аренды",
+                                              response_mode="lean"))
+        assert RULES.labels(rule).value == before + 1
+
+        # Разбивка по фазам требует debug: с ней ответ полный
+        timed = await client.post("/chat", json=rent_turn("m3", "", "button", "Рассчитать стоимость аренды",
+                                                      response_mode="lean"),
+                                  headers={"X-Debug-Timings": "1"})
+    assert "timings_us" in timed.json()["debug"]
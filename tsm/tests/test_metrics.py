@@ -0,0 +1,72 @@
+"""
+Тесты метрик и эндпоинта /metrics
+"""
+from pathlib import Path
+
+import httpx
+import pytest
+from httpx import ASGITransport
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.fsm import AsyncFSM
+from app.main import app, set_async_fsm
+from app.metrics import OTHER, Counter, Histogram, REQUEST_LATENCY
+
+
+def test_histogram_and_label_normalization():
+    hist = Histogram("test_seconds", "тест", ("scenario",), allowed=(("a", "b"),), buckets=(0.1, 1.0))
+    assert hist.labels("a") is hist.labels("a")
+    assert hist.labels("нет такого") is hist.labels(OTHER)
+    hist.labels("a").observe(0.05)
+    hist.labels("a").observe(0.5)
+    hist.labels("a").observe(5)
+
+    lines = hist.render()
+    assert 'test_seconds_bucket{scenario="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{scenario="a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{scenario="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{scenario="a"} 3' in lines
+    assert not any('scenario="b"' in line for line in lines)  # пустые серии не выводятся
+
+
+def test_free_label_series_are_capped():
+    counter = Counter("test_rules", "тест", ("rule",), max_series=2)
+    counter.labels("r1").inc()
+    counter.labels("r2").inc()
+    counter.labels("r3").inc(2)
+    assert counter.labels("r4") is counter.labels(OTHER)
+    lines = counter.render()
+    assert lines[:2] == ["# HELP test_rules_total тест", "# TYPE test_rules_total counter"]
+    assert 'test_rules_total{rule="other"} 2' in lines
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_after_chat():
+    import fakeredis
+    fsm = AsyncFSM("redis://localhost:6379/0")
+    fsm.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    set_async_fsm(fsm)
+    series = REQUEST_LATENCY.labels("/chat", "Аренда зала", "idle")
+    before = sum(series.counts)
+
+    transport = ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        response = await client.post("/chat", json={
+            "user_id": "metrics_user", "text": "", "scenario": "Аренда зала",
+            "action_type": "button", "action_name": "Рассчитать стоимость аренды"})
+        assert response.status_code == 200
+        metrics = await client.get("/metrics")
+    set_async_fsm(None)
+
+    assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = metrics.text
+    assert sum(series.counts) == before + 1
+    assert 'orchestrator_request_duration_seconds_count{endpoint="/chat",scenario="Аренда зала",state_before="idle"}' in body
+    assert 'orchestrator_redis_duration_seconds_count{operation="get"}' in body
+    assert 'orchestrator_redis_duration_seconds_count{operation="transition"}' in body
+    assert 'orchestrator_rule_used_total{rule="rent: начать с времени"}' in body
+    assert "# TYPE orchestrator_rule_used_total counter" in body
+    assert 'orchestrator_intent_total{intent="calculate_rental"}' in body
+    assert "orchestrator_requests_in_flight" in body
@@ -0,0 +1,128 @@
+"""
+Тесты таблицы цен аренды и /rental/quote
+"""
+import json
+from pathlib import Path
+
+import httpx
+import pytest
+from httpx import ASGITransport
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.catalog import CatalogError, CatalogSnapshot, CatalogStore
+from app.main import app
+from app.pricing import RentalPricing, calculate_rental_price
+
+MATRIX = {
+    "rules": {"time_cutoff": "17:00", "people_cutoff": 5, "bulk_min_hours": 4,
+              "format_limits": {"training": 8}, "default_format_limit": 20},
+    "prices": {
+        "before_17_00": {"up_to_5_people": {"training": 100, "default": 150},
+                         "more_than_5_people": 200},
+        "after_17_00": {"up_to_5_people": 300, "more_than_5_people": 400},
+        "bulk": {"up_to_5_people": 50, "more_than_5_people": {"training": 60}},
+    },
+    "formats": ["training", "rehearsal"],
+}
+
+
+@pytest.mark.parametrize("time_bucket,people,hours,price,rule", [
+    ("daytime", 10, None, 900, "daytime_up_to_10"),
+    ("daytime", 11, None, 1100, "daytime_more_than_10"),
+    ("evening", 10, None, 1300, "evening_up_to_10"),
+    ("evening", 12, None, 1500, "evening_more_than_10"),
+    ("evening", 3, 8, 700, "bulk_up_to_10"),
+    ("daytime", 11, 9, 1100, "bulk_more_than_10"),
+])
+def test_default_rates(time_bucket, people, hours, price, rule):
+    price_now, rule_now, message = calculate_rental_price(time_bucket, people, "rehearsal", {}, hours)
+    assert (price_now, rule_now) == (price, rule)
+    assert f"{price} руб/час" in message
+
+
+def test_matrix_from_catalog():
+    pricing = RentalPricing.compile(MATRIX)
+    assert pricing.quote("daytime", 5, "training").price_per_hour == 100
+    assert pricing.quote("daytime", 5, "rehearsal").price_per_hour == 150  # default ячейки
+    assert pricing.quote("16:30", 6, "rehearsal").price_per_hour == 200  # время до cutoff
+    assert pricing.quote("17:00", 6, "rehearsal").rule == "evening_more_than_5"
+
+    bulk = pricing.quote("evening", 6, "training", hours=4)
+    assert (bulk.price_per_hour, bulk.total, bulk.rule, bulk.bulk) == (60, 240, "bulk_more_than_5", True)
+
+    missing = pricing.quote("daytime", 6, "rehearsal", hours=4)
+    assert not missing.valid and missing.price_per_hour is None
+
+    over = pricing.quote("evening", 9, "training")
+    assert not over.valid and "8" in over.error
+    assert pricing.check_limits("rehearsal", 20) == (True, None)
+
+
+def test_invalid_prices_rejected_at_load():
+    with pytest.raises(CatalogError, match="rental"):
+        CatalogSnapshot.build({"rental": {"prices": {"before_16_00": {"up_to_10_people": "дорого"}}}})
+
+
+@pytest.mark.parametrize("rental", [
+    {"rules": {"time_cutoff": 1600}},
+    {"rules": {"time_cutoff": "25:00"}},
+    {"rules": {"format_limits": ["training"]}},
+    {"rules": {"format_limits": {"training": "много"}}},
+    {"rules": {"bulk_min_hours": 0}},
+    {"rules": ["time_cutoff"]},
+    {"formats": "training"},
+    ["rules"],
+])
+def test_malformed_rental_rejected_at_load(rental):
+    with pytest.raises(CatalogError, match="rental"):
+        CatalogSnapshot.build({"rental": rental})
+
+
+def test_malformed_rental_keeps_empty_catalog_at_startup(tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps({"rental": {"rules": {"time_cutoff": 1600}}}), encoding="utf-8")
+    store = CatalogStore(path, poll_interval=0)
+    assert store.snapshot.pricing.cutoff_minutes == 16 * 60
+
+
+@pytest.mark.asyncio
+async def test_quote_endpoint_items_and_grid():
+    transport = ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        response = await client.post("/rental/quote", json={
+            "items": [{"time_bucket": "evening", "people_count": 12, "format": "training"}],
+            "grid": {"time_buckets": ["10:00", "19:00"], "people_counts": [4, 40],
+                     "formats": ["training", "photo_session"], "hours": [2]},
+        })
+    assert response.status_code == 200
+    quotes = response.json()["quotes"]
+    assert len(quotes) == 1 + 2 * 2 * 2
+    assert quotes[0]["price_per_hour"] == 1500 and quotes[0]["valid"]
+
+    first = quotes[1]
+    assert (first["time_bucket"], first["people_count"], first["format"]) == ("10:00", 4, "training")
+    assert (first["price_per_hour"], first["total"]) == (900, 1800)
+    assert not any(q["valid"] for q in quotes if q["people_count"] == 40)
+
+
+@pytest.mark.asyncio
+async def test_quote_endpoint_rejects_bad_input():
+    transport = ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        response = await client.post("/rental/quote", json={
+            "items": [{"time_bucket": "ночью", "people_count": 4, "format": "training"},
+                      {"time_bucket": "24:30", "people_count": 4, "format": "training"}]})
+        assert response.status_code == 200
+        for quote in response.json()["quotes"]:
+            assert not quote["valid"] and quote["price_per_hour"] is None
+            assert "daytime" in quote["error"]
+
+        for body in ({"items": [{"time_bucket": "evening", "people_count": 0, "format": "training"}]},
+                     {"items": [{"time_bucket": "evening", "people_count": 4, "format": "training", "hours": -2}]},
+                     {"grid": {"time_buckets": ["evening"], "people_counts": [-1], "formats": ["training"]}},
+                     {"grid": {"time_buckets": ["evening"], "people_counts": [4], "formats": ["training"],
+                               "hours": [0]}}):
+            response = await client.post("/rental/quote", json=body)
+            assert response.status_code == 422, body
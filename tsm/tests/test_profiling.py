@@ -0,0 +1,93 @@
+"""
+Тесты разбивки /chat по фазам и сэмплирующего профилировщика
+"""
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from httpx import ASGITransport
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from conftest import RENT_BUTTON, rent_turn  # type: ignore
+import app.main as main
+from app.main import app
+from app.profiling import SamplingProfiler, Timings
+
+PHASES = {"validation", "catalog", "redis_read", "decide", "redis_write", "serialize", "total"}
+
+
+async def _client():
+    return httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver")
+
+
+def test_timings_marks_and_nested_phases():
+    timings = Timings()
+    started = time.perf_counter_ns()
+    timings.mark("a")
+    timings.add("nested", started)
+    timings.mark("b")
+    result = timings.as_dict()
+    assert set(result) == {"a", "nested", "b", "total"}
+    assert result["total"] >= result["a"] + result["b"] - 0.2
+
+
+@pytest.mark.asyncio
+async def test_chat_timings_are_opt_in(async_fsm):
+    async with await _client() as client:
+        plain = await client.post("/chat", json=rent_turn("timed", "", "button", RENT_BUTTON))
+        timed = await client.post("/chat", json=rent_turn("timed", "после 16"),
+                                  headers={"X-Debug-Timings": "1"})
+
+    assert "timings_us" not in plain.json()["debug"]
+    body = timed.json()
+    assert body["debug"]["state_after"] == "rent_need_people"
+    timings = body["debug"]["timings_us"]
+    assert PHASES | {"extract"} == set(timings)
+    assert timings["extract"] <= timings["decide"]
+
+
+@pytest.mark.asyncio
+async def test_chat_timings_with_sync_fsm_query_flag(fsm):
+    async with await _client() as client:
+        response = await client.post("/chat?timings=1", json=rent_turn("timed_sync", "", "button", RENT_BUTTON))
+    assert PHASES <= set(response.json()["debug"]["timings_us"])
+
+
+def test_profiler_sees_busy_thread():
+    stop = threading.Event()
+
+    def busy_loop_for_profiler():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_loop_for_profiler)
+    worker.start()
+    try:
+        result = SamplingProfiler().run(0.2, interval=0.002)
+    finally:
+        stop.set()
+        worker.join()
+    assert result["samples"] > 10
+    assert any("busy_loop_for_profiler" in stack for stack in result["collapsed"])
+
+
+@pytest.mark.asyncio
+async def test_admin_profile_requires_token(monkeypatch):
+    async with await _client() as client:
+        monkeypatch.setattr(main, "ADMIN_TOKEN", "")
+        assert (await client.post("/admin/profile?seconds=0.1")).status_code == 403
+
+        monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+        assert (await client.post("/admin/profile?seconds=0.1",
+                                  headers={"X-Admin-Token": "wrong"})).status_code == 403
+        assert (await client.post("/admin/profile?seconds=600",
+                                  headers={"X-Admin-Token": "secret"})).status_code == 422
+        response = await client.post("/admin/profile?seconds=0.1&interval_ms=2",
+                                     headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json()["samples"] > 0
@@ -0,0 +1,227 @@
+"""
+Тесты устойчивого доступа к Redis: выключатель, повторы, локальный резерв
+"""
+import asyncio
+from pathlib import Path
+
+import pytest
+import redis
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from conftest import RENT_BUTTON, rent_turn_args  # type: ignore
+from app.fsm import FSM, AsyncFSM
+from app.main import process_state_machine, process_state_machine_async, set_async_fsm, set_fsm
+from app.resilience import (
+    CircuitBreaker, FallbackStore, RedisSettings, StoreUnavailable, acall_with_retry, call_with_retry
+)
+
+SETTINGS = RedisSettings(retry_attempts=1, retry_base_delay=0, breaker_threshold=2, breaker_reset=60)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_half_opens_and_closes():
+    clock = Clock()
+    breaker = CircuitBreaker(threshold=2, reset=5, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+
+    clock.now = 5
+    assert breaker.allow()  # один пробный вызов
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open and breaker.opened == 2
+
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_breaker_trial_released_on_other_errors():
+    clock = Clock()
+    breaker = CircuitBreaker(threshold=1, reset=5, clock=clock)
+    breaker.record_failure()
+    clock.now = 5
+
+    def oom():
+        raise redis.ResponseError("OOM command not allowed")
+
+    with pytest.raises(redis.ResponseError):
+        call_with_retry(oom, SETTINGS, breaker)
+    assert breaker.state == CircuitBreaker.CLOSED  # Redis ответил — он доступен
+
+    breaker.record_failure()
+    clock.now = 10
+
+    async def cancelled():
+        raise asyncio.CancelledError
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(acall_with_retry(cancelled, SETTINGS, breaker))
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()  # исход неизвестен: можно пробовать снова
+
+
+def test_retry_only_idempotent_calls():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise redis.ConnectionError("reset")
+        return "ok"
+
+    assert call_with_retry(flaky, SETTINGS, CircuitBreaker(5)) == "ok"
+    calls.clear()
+    with pytest.raises(StoreUnavailable):
+        call_with_retry(flaky, SETTINGS, CircuitBreaker(5), idempotent=False)
+    assert len(calls) == 1
+
+
+def test_fallback_keeps_dirty_entries():
+    fallback = FallbackStore(max_size=2)
+    fallback.write("a", "1")
+    fallback.remember("b", "2")
+    fallback.remember("c", "3")
+    fallback.remember("a", "stale")  # несверенная запись не перезаписывается
+    assert fallback.get("a") == "1" and fallback.get("b") is None
+    assert fallback.transition("a", "0", "set", "2") == [0, "1"]
+    assert fallback.transition("a", "1", "clear", None) == [1]
+    assert fallback.pending() == [("a", None, None)]
+
+
+def test_fallback_full_store_evicts_oldest_clean():
+    fallback = FallbackStore(max_size=100)
+    fallback.write("dirty", "1")
+    for i in range(1000):
+        fallback.remember(f"k{i}", str(i))
+    assert len(fallback) == 100
+    assert fallback.get("dirty") == "1"
+    assert fallback.get("k999") == "999" and fallback.get("k899") is None
+
+
+def test_fallback_caps_dirty_entries():
+    fallback = FallbackStore(max_size=2)
+    fallback.remember("clean", "0")
+    for key in ("a", "b", "c"):
+        fallback.write(key, key)
+    fallback.write("b", "b2")  # перезапись делает запись самой свежей
+    fallback.write("d", "d")
+    assert len(fallback) == 2 and fallback.dirty_evicted == 2
+    assert [key for key, _, _ in fallback.pending()] == ["b", "d"]
+
+
+def test_fallback_pending_skips_expired_entries():
+    clock = Clock()
+    fallback = FallbackStore(max_size=10, ttl_seconds=60, clock=clock)
+    fallback.write("old", "1")
+    clock.now += 30
+    fallback.write("new", "2")
+    clock.now += 31
+    assert fallback.pending(limit=1) == [("new", "2", None)]
+    assert not fallback.is_dirty("old") and fallback.dirty_expired == 1
+
+
+def test_dialog_survives_outage_and_reconciles():
+    import fakeredis
+    server = fakeredis.FakeServer()
+    fsm = FSM("redis://localhost:6379/0", settings=SETTINGS)
+    fsm.redis_client = fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+    set_fsm(fsm)
+    user = ("studio_nexa", "simulator", "outage")
+
+    process_state_machine(*rent_turn_args("outage", "", "button", RENT_BUTTON))
+    assert fsm.get_state(*user)["state"] == "rent_need_time"
+
+    server.connected = False
+    reply, _, debug = process_state_machine(*rent_turn_args("outage", "после 16"))
+    assert debug["state_before"] == "rent_need_time"
+    assert debug["state_after"] == "rent_need_people"
+    process_state_machine(*rent_turn_args("outage", "12"))
+    stats = fsm.store_stats()
+    assert stats["breaker"] == "open" and stats["fallback_pending"] == 1
+
+    server.connected = True
+    fsm.breaker.reset = 0
+    assert fsm.get_state(*user)["state"] == "rent_need_format"  # до сверки — из резерва
+    fsm.reconcile()  # дожидается фоновой сверки
+    assert fsm.store_stats()["reconciled"] == 1 and not fsm.fallback.dirty
+    raw = fakeredis.FakeStrictRedis(server=server, decode_responses=True).get(fsm.get_state_key(*user))
+    assert raw == fsm.get_state_raw(*user)
+
+
+def test_reconcile_keeps_newer_redis_value():
+    import fakeredis
+    server = fakeredis.FakeServer()
+    fsm = FSM("redis://localhost:6379/0", settings=SETTINGS)
+    fsm.redis_client = fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+    other = fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+    users = [("studio_nexa", "simulator", f"cas_{i}") for i in range(250)]
+    for user in users:
+        fsm.set_state(*user, "rent", "rent_need_time")
+
+    server.connected = False
+    for user in users:
+        fsm.set_state(*user, "rent", "rent_need_people")
+    assert fsm.store_stats()["fallback_pending"] == len(users)
+
+    # Пока экземпляр был отрезан, другой изменил первого пользователя
+    server.connected = True
+    other.set(fsm.get_state_key(*users[0]), "newer")
+    fsm.breaker.reset = 0
+    fsm.reconcile()
+    stats = fsm.store_stats()
+    assert stats["reconciled"] == len(users) - 1 and stats["reconcile_conflicts"] == 1
+    assert not fsm.fallback.dirty
+    assert other.get(fsm.get_state_key(*users[0])) == "newer"
+    assert fsm.get_state_raw(*users[0]) == "newer"
+    assert fsm.get_state(*users[-1])["state"] == "rent_need_people"
+
+
+@pytest.mark.asyncio
+async def test_async_users_continue_under_flapping_redis():
+    import fakeredis
+    server = fakeredis.FakeServer()
+    fsm = AsyncFSM("redis://localhost:6379/0", settings=SETTINGS)
+    fsm.redis_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    set_async_fsm(fsm)
+    users = [f"flap_{i}" for i in range(20)]
+
+    async def dialog(user_id):
+        states = []
+        for text, kind, name in (("", "button", RENT_BUTTON), ("после 16", "text", None),
+                                 ("12", "text", None), ("занятие", "text", None)):
+            reply, _, debug = await process_state_machine_async(*rent_turn_args(user_id, text, kind, name))
+            states.append(debug["state_after"])
+            await asyncio.sleep(0)
+        return states, reply
+
+    async def flap():
+        for _ in range(6):
+            server.connected = not server.connected
+            fsm.breaker.reset = 0
+            await asyncio.sleep(0)
+        server.connected = True
+
+    results, _ = await asyncio.gather(asyncio.gather(*(dialog(u) for u in users)), flap())
+    for states, reply in results:
+        assert states == ["rent_need_time", "rent_need_people", "rent_need_format", "idle"]
+        assert "1500 руб/час" in reply
+    assert fsm.store_stats()["degraded_calls"] > 0
+
+    await fsm.reconcile()
+    assert not fsm.fallback.dirty
+    for user_id in users:
+        assert await fsm.get_state("studio_nexa", "simulator", user_id) is None
@@ -0,0 +1,106 @@
+"""
+Тесты офлайн-прогона записанных диалогов (app.replay)
+"""
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.fsm import encode_state
+from app.replay import load_sessions, replay
+
+STUB_PATH = Path(__file__).parent.parent / "data" / "dikidi_stub.json"
+
+# Диалог аренды: (text, action_type, action_name, intent, state_after)
+RENT = [
+    ("", "button", "Рассчитать стоимость аренды", "calculate_rental", "rent_need_time"),
+    ("после 16", "text", None, "calculate_rental", "rent_need_people"),
+    ("12", "text", None, "calculate_rental", "rent_need_format"),
+]
+
+
+def _record(user_id, text, action_type, action_name, expected=None, session=None, tenant_id=None):
+    record = {"request": {"scenario": "Аренда зала", "text": text, "action_type": action_type,
+                          "action_name": action_name, "user_id": user_id}}
+    if tenant_id:
+        record["request"]["tenant_id"] = tenant_id
+    if expected:
+        record["expected"] = expected
+    if session:
+        record["session"] = session
+    return json.dumps(record, ensure_ascii=False)
+
+
+def _write(path: Path, lines) -> Path:
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+def _rent_corpus(path: Path, users: int) -> Path:
+    """Ходы пользователей вперемешку"""
+    lines = []
+    for text, action_type, action_name, intent, state_after in RENT:
+        for i in range(users):
+            lines.append(_record(f"u{i}", text, action_type, action_name,
+                                 {"intent": intent, "state_after": state_after}))
+    return _write(path, lines)
+
+
+def test_sessions_keep_turn_order(tmp_path):
+    sessions, invalid = load_sessions(_rent_corpus(tmp_path / "t.jsonl", 3))
+    assert invalid == []
+    assert len(sessions) == 3
+    for turns in sessions.values():
+        assert [json.loads(line)["request"]["text"] for _, line in turns] == [t[0] for t in RENT]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_replay_matches_recorded(tmp_path, workers):
+    report = replay(_rent_corpus(tmp_path / "t.jsonl", 20), workers=workers, chunk_turns=10,
+                    catalog_path=str(STUB_PATH))
+    assert (report.sessions, report.turns) == (20, 60)
+    assert report.diff_turns == 0 and report.errors == 0 and report.invalid_lines == 0
+
+
+def test_replay_reports_diffs(tmp_path):
+    path = _write(tmp_path / "t.jsonl", [
+        _record("u1", "", "button", "Рассчитать стоимость аренды", {"state_after": "rent_need_people"}),
+        "{не json",
+    ])
+    report_path = tmp_path / "diffs.jsonl"
+    report = replay(path, catalog_path=str(STUB_PATH), report_path=report_path)
+    assert report.diff_turns == 1 and report.invalid_lines == 1
+    assert report.diffs_by_field["state_after"] == 1
+    rows = [json.loads(line) for line in report_path.read_text(encoding="utf-8").splitlines()]
+    diff = next(row for row in rows if "field" in row)
+    assert diff == {"line": 1, "session": diff["session"], "field": "state_after",
+                    "expected": "rent_need_people", "actual": "rent_need_time"}
+
+
+def test_replay_seeds_session_state(tmp_path):
+    """Диалог, начатый до записи: состояние первого хода берется из "session" """
+    seed = encode_state("Аренда зала", "rent_need_people", {"rent_time_bucket": "evening"})
+    path = _write(tmp_path / "t.jsonl", [
+        _record("u1", "12", "text", None, {"state_after": "rent_need_format"}, session=seed),
+    ])
+    report = replay(path, catalog_path=str(STUB_PATH))
+    assert report.turns == 1 and report.diff_turns == 0
+
+
+def test_replay_counts_tenants_without_catalog(tmp_path):
+    catalog_dir = tmp_path / "catalogs"
+    catalog_dir.mkdir()
+    (catalog_dir / "studio_a.json").write_bytes(STUB_PATH.read_bytes())
+    (tmp_path / "escape.json").write_bytes(STUB_PATH.read_bytes())
+    button = ("", "button", "Рассчитать стоимость аренды", {"state_after": "rent_need_time"})
+    path = _write(tmp_path / "t.jsonl", [
+        _record("u1", *button, tenant_id="studio_a"),
+        _record("u2", *button, tenant_id="studio_b"),
+        _record("u3", *button, tenant_id="../escape"),
+    ])
+    report = replay(path, catalog_path=str(STUB_PATH), catalog_dir=str(catalog_dir))
+    assert report.turns == 3 and report.diff_turns == 0 and report.errors == 0
+    assert report.unknown_tenants == {"studio_b": 1, "../escape": 1}
@@ -0,0 +1,83 @@
+"""
+Тесты быстрого пути JSON (JSON_BACKEND): состояние в Redis и ответы /chat, /dikidi
+"""
+import json
+from pathlib import Path
+
+import httpx
+import pytest
+from httpx import ASGITransport
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app import serialization
+from app.catalog import CatalogStore
+from app.fsm import FSM
+from app.main import app, get_catalog_store, set_catalog_store, set_fsm
+from app.session import decode_session, encode_session
+
+STUB_PATH = Path(__file__).parent.parent / "data" / "dikidi_stub.json"
+BACKENDS = ["stdlib"] + (["orjson"] if serialization.orjson is not None else [])
+
+
+@pytest.fixture
+def restore_backend():
+    current = serialization.backend
+    yield
+    serialization.set_backend(current)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_session_encoding_is_backend_independent(backend, restore_backend):
+    serialization.set_backend("stdlib")
+    data = {"direction": "Азбука", "age": 6, "note": "с подругой", "tags": ["а", 1]}
+    reference = encode_session("Детские группы", "kids_need_age", data)
+
+    assert serialization.set_backend(backend) == backend
+    raw = encode_session("Детские группы", "kids_need_age", data)
+    assert raw == reference
+    assert "Азбука" in raw
+    assert decode_session(reference).data == data
+
+
+def test_unknown_or_missing_backend(restore_backend, monkeypatch):
+    with pytest.raises(ValueError):
+        serialization.set_backend("ujson")
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert serialization.set_backend("auto") == "stdlib"
+    assert serialization.set_backend("orjson") == "stdlib"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_chat_and_dikidi_responses(backend, restore_backend):
+    import fakeredis
+    serialization.set_backend(backend)
+    fsm = FSM("redis://localhost:6379/0")
+    fsm.redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+    set_fsm(fsm)
+    previous = get_catalog_store()
+    set_catalog_store(CatalogStore(STUB_PATH, poll_interval=0))
+    turns = [("", "button", "Рассчитать стоимость аренды"), ("после 16", "text", None),
+             ("12", "text", None), ("занятие", "text", None)]
+    try:
+        async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as client:
+            bodies = []
+            for text, action_type, action_name in turns:
+                response = await client.post("/chat", json={
+                    "user_id": f"json_{backend}", "text": text, "scenario": "Аренда зала",
+                    "action_type": action_type, "action_name": action_name})
+                assert response.headers["content-type"] == "application/json"
+                bodies.append(response.json())
+            dikidi = await client.get("/dikidi")
+            again = await client.get("/dikidi")
+    finally:
+        set_fsm(None)
+        set_catalog_store(previous)
+
+    assert set(bodies[0]) == {"reply", "intent", "version", "debug"}
+    assert "1500 руб/час" in bodies[-1]["reply"]
+    assert bodies[-1]["debug"]["data_collected"]["people_count"] == 12
+    assert dikidi.json() == json.loads(STUB_PATH.read_text(encoding="utf-8"))
+    assert dikidi.content == again.content
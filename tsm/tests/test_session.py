@@ -0,0 +1,81 @@
+"""
+Тесты компактного формата состояния диалога
+"""
+from pathlib import Path
+
+import pytest
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.fsm import FSM
+from app.main import process_state_machine, set_fsm
+from app.session import (
+    SessionState, decode_session, encode_session, encode_session_json, session_state
+)
+
+USER = ("studio_nexa", "simulator", "session_user")
+
+
+def test_roundtrip_known_fields():
+    data = {"rent_time_bucket": "evening", "people_count": 12, "format": "training"}
+    raw = encode_session("Аренда зала", "rent_need_format", data)
+
+    assert raw == '2;5;2;{"t":"evening","p":12,"f":"training"}'
+    assert decode_session(raw) == SessionState("Аренда зала", "rent_need_format", data)
+
+
+def test_roundtrip_unknown_names_and_fields():
+    data = {"age": 8, "selected_day": "среда"}
+    raw = encode_session("Новый сценарий", "custom_state", data)
+    session = decode_session(raw)
+
+    assert session.scenario == "Новый сценарий"
+    assert session.state == "custom_state"
+    assert session.data == data
+
+
+def test_empty_data_has_no_body():
+    raw = encode_session("Детские группы", "kids_need_age", {})
+    assert raw == "2;2;1;"
+    assert decode_session(raw).data == {}
+
+
+def test_session_state_reads_prefix_and_falls_back_to_full_decode():
+    assert session_state('2;5;2;{"t":"evening"') == "rent_need_format"  # тело не разбирается
+    for raw in (encode_session("Новый сценарий", "custom_state", {"age": 8}),
+                encode_session_json("Аренда зала", "rent_need_time", {})):
+        assert session_state(raw) == decode_session(raw).state
+
+
+def test_compact_format_is_smaller_than_json():
+    data = {"rent_time_bucket": "evening", "people_count": 12}
+    compact = encode_session("Аренда зала", "rent_need_format", data).encode("utf-8")
+    legacy = encode_session_json("Аренда зала", "rent_need_format", data).encode("utf-8")
+    assert len(compact) * 2 < len(legacy)
+
+
+def test_legacy_json_record_upgraded_on_next_transition():
+    import fakeredis
+    fsm = FSM("redis://localhost:6379/0")
+    fsm.redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+    set_fsm(fsm)
+
+    key = fsm.get_state_key(*USER)
+    fsm.redis_client.set(key, encode_session_json("Аренда зала", "rent_need_people",
+                                                  {"rent_time_bucket": "daytime"}))
+
+    # Старая запись читается как есть
+    assert fsm.get_state(*USER)["data"] == {"rent_time_bucket": "daytime"}
+
+    _, _, debug = process_state_machine("Аренда зала", "8", "text", None, *USER)
+    assert debug["state_before"] == "rent_need_people"
+    assert debug["state_after"] == "rent_need_format"
+
+    # После перехода запись хранится в новом формате
+    assert fsm.redis_client.get(key).startswith("2;")
+    assert fsm.get_state(*USER)["data"] == {"rent_time_bucket": "daytime", "people_count": 8}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,222 @@
+"""
+Тесты L1-кэша состояний и его когерентности между экземплярами FSM
+"""
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.fsm import FSM, AsyncFSM, StateChange
+from app.keyspace import TtlPolicy
+from app.main import process_state_machine, set_fsm
+from app.state_cache import INVALIDATION_CHANNEL, StateCache
+
+USER = ("studio_nexa", "simulator", "l1_user")
+
+
+def _fsm(server, cache_size=100):
+    import fakeredis
+    fsm = FSM("redis://localhost:6379/0", cache=StateCache(max_size=cache_size))
+    fsm.redis_client = fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+    return fsm
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def server():
+    import fakeredis
+    return fakeredis.FakeServer()
+
+
+def test_lru_eviction_and_counters():
+    cache = StateCache(max_size=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == (True, "1")
+    cache.put("c", "3")  # вытесняет b — он использовался раньше всех
+
+    assert cache.get("b") == (False, None)
+    assert cache.get("c") == (True, "3")
+    assert cache.stats() == {"size": 2, "hits": 2, "misses": 1, "evictions": 1, "invalidations": 0}
+
+
+def test_put_skipped_after_concurrent_invalidation():
+    cache = StateCache()
+    epoch = cache.epoch
+    cache.invalidate("k")
+    cache.put("k", "stale", epoch)
+    assert cache.get("k") == (False, None)
+
+
+def test_l1_entry_expires_with_state_ttl(server):
+    import fakeredis
+    now = [0.0]
+    fsm = FSM("redis://localhost:6379/0", cache=StateCache(clock=lambda: now[0]),
+              ttl_policy=TtlPolicy(24 * 60 * 60, {"rent_need_time": 60}))
+    fsm.redis_client = fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+    fsm.set_state(*USER, "Аренда зала", "rent_need_time", {})
+    assert fsm.get_state(*USER)["state"] == "rent_need_time"
+    assert fsm.cache.hits == 1
+
+    # Redis удалил ключ по TTL состояния; инвалидации при этом не бывает
+    fakeredis.FakeStrictRedis(server=server).delete(fsm.get_state_key(*USER))
+    now[0] = 61
+    assert fsm.get_state(*USER) is None
+    assert fsm.cache.misses == 1
+
+
+def test_repeated_turns_hit_l1(server):
+    fsm = _fsm(server)
+    set_fsm(fsm)
+
+    process_state_machine("Аренда зала", "", "button", "Рассчитать стоимость аренды", *USER)
+    process_state_machine("Аренда зала", "после 16", "text", None, *USER)
+
+    # Первый ход — промах, второй читает состояние, записанное первым
+    assert fsm.cache.misses == 1
+    assert fsm.cache.hits == 1
+    l1 = fsm.store_stats()["l1_cache"]
+    assert l1["hits"] == 1 and l1["misses"] == 1 and l1["size"] == 1
+
+
+def test_coherence_across_two_instances(server):
+    a = _fsm(server)
+    b = _fsm(server)
+    a.start_invalidation_listener()
+    b.start_invalidation_listener()
+    try:
+        change = StateChange()
+        change.set_state("Аренда зала", "rent_need_time", {})
+        a.transition(*USER, None, change)
+
+        # b кэширует состояние, записанное a
+        assert b.get_state(*USER)["state"] == "rent_need_time"
+        raw = b.get_state_raw(*USER)
+
+        change = StateChange()
+        change.set_state("Аренда зала", "rent_need_people", {"rent_time_bucket": "evening"})
+        b.transition(*USER, raw, change)
+
+        # a получает инвалидацию и перестает отдавать старое значение
+        assert _wait_for(lambda: a.get_state(*USER)["state"] == "rent_need_people")
+        assert a.cache.invalidations >= 1
+    finally:
+        a.stop_invalidation_listener()
+        b.stop_invalidation_listener()
+
+
+def test_listener_resubscribes_after_disconnect(server):
+    a = _fsm(server)
+    b = _fsm(server)
+    a.start_invalidation_listener()
+    try:
+        time.sleep(0.2)
+        server.connected = False
+        time.sleep(0.3)
+        # Инвалидации за время обрыва потеряны: после переподписки кэш пуст
+        a.cache.put("stale", "1")
+        server.connected = True
+        assert _wait_for(lambda: len(a.cache) == 0)
+
+        assert b.get_state(*USER) is None
+        assert a.get_state(*USER) is None
+        b.set_state(*USER, "Аренда зала", "rent_need_time", {})
+        assert _wait_for(lambda: a.get_state(*USER) is not None)
+    finally:
+        a.stop_invalidation_listener()
+
+
+def test_stale_l1_entry_is_corrected_by_transition(server):
+    """Даже до прихода инвалидации устаревший кэш не откатывает диалог"""
+    a = _fsm(server)
+    b = _fsm(server)
+    set_fsm(a)
+
+    process_state_machine("Аренда зала", "", "button", "Рассчитать стоимость аренды", *USER)
+    assert a.get_state(*USER)["state"] == "rent_need_time"
+
+    # Другая реплика продвигает диалог; a не подписан и об этом не знает
+    b.set_state(*USER, "Аренда зала", "rent_need_people", {"rent_time_bucket": "evening"})
+
+    _, _, debug = process_state_machine("Аренда зала", "12", "text", None, *USER)
+    assert debug["state_before"] == "rent_need_people"
+    assert debug["state_after"] == "rent_need_format"
+
+
+@pytest.mark.asyncio
+async def test_async_coherence_across_two_instances(server):
+    import fakeredis
+
+    def make():
+        fsm = AsyncFSM("redis://localhost:6379/0", cache=StateCache())
+        fsm.redis_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        return fsm
+
+    a, b = make(), make()
+    await a.set_state(*USER, "Детские группы", "kids_need_age", {})
+    assert (await b.get_state(*USER))["state"] == "kids_need_age"
+
+    await a.clear_state(*USER)
+    for _ in range(200):
+        if await b.get_state(*USER) is None:
+            break
+        await asyncio.sleep(0.01)
+    assert await b.get_state(*USER) is None
+
+    await a.stop_invalidation_listener()
+    await b.stop_invalidation_listener()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
+
+
+@pytest.mark.asyncio
+async def test_async_listener_resubscribes_after_disconnect(server):
+    import fakeredis
+    import redis
+    fsm = AsyncFSM("redis://localhost:6379/0", cache=StateCache())
+    fsm.redis_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    make_pubsub = fsm.redis_client.pubsub
+    subscribed = []
+
+    def pubsub():
+        # Первое соединение обрывается сразу после подписки
+        real = make_pubsub()
+        if subscribed:
+            return real
+
+        async def listen():
+            message = {"type": "subscribe", "pattern": None, "channel": INVALIDATION_CHANNEL, "data": 1}
+            subscribed.append(message)
+            yield message
+            raise redis.ConnectionError("Connection reset by peer")
+
+        real.listen = listen
+        return real
+
+    fsm.redis_client.pubsub = pubsub
+    await fsm.start_invalidation_listener()
+    for _ in range(200):
+        if subscribed:
+            break
+        await asyncio.sleep(0.01)
+    fsm.cache.put("stale", "1")
+    for _ in range(200):
+        if len(fsm.cache) == 0:
+            break
+        await asyncio.sleep(0.01)
+    assert len(fsm.cache) == 0 and not fsm._listener.done()
+    await fsm.stop_invalidation_listener()
@@ -0,0 +1,138 @@
+"""
+Тесты каталогов тенантов: загрузка по требованию, LRU, метрики
+"""
+import asyncio
+import json
+import os
+import threading
+from pathlib import Path
+
+import pytest
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.catalog import CatalogSnapshot
+from app.dialogs import engine as dialog_engine
+from app.fsm import StateChange
+from app.session import SessionState
+from app.tenants import TenantCatalogs
+
+DEFAULT = CatalogSnapshot.build({"directions": [{"id": "shared", "name": "Общий"}]})
+
+
+def _write(directory: Path, tenant_id: str, data: dict) -> Path:
+    path = directory / f"{tenant_id}.json"
+    existed = path.exists()
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    if existed:
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    return path
+
+
+def _catalog(name: str, **extra) -> dict:
+    return {"directions": [{"id": name, "name": name.title()}], **extra}
+
+
+@pytest.fixture
+def catalogs(tmp_path):
+    return TenantCatalogs(tmp_path, lambda: DEFAULT, poll_interval=0)
+
+
+@pytest.mark.asyncio
+async def test_own_catalog_and_shared_fallback(tmp_path, catalogs):
+    _write(tmp_path, "studio_a", _catalog("salsa", keywords={"directions": {"salsa": ["сальс"]}},
+                                          rental={"prices": {"bulk": {"up_to_10_people": 1}}}))
+
+    own = await catalogs.get("studio_a")
+    assert own.direction("salsa") is not None
+    assert own.extractor.extract("хочу на сальсу").direction_id == "salsa"
+    assert own.pricing.quote("daytime", 2, "training", hours=9).price_per_hour == 1
+
+    assert await catalogs.get("studio_b") is DEFAULT  # файла нет
+    assert await catalogs.get("../etc") is DEFAULT  # недопустимый id
+    assert await catalogs.get("studio_a") is own
+
+    stats = catalogs.stats()
+    assert (stats["loads"], stats["misses"], stats["hits"], stats["shared"]) == (1, 2, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_lru_evicts_by_count_and_size(tmp_path):
+    for i in range(4):
+        _write(tmp_path, f"t{i}", _catalog(f"d{i}"))
+    size = (tmp_path / "t0.json").stat().st_size
+
+    catalogs = TenantCatalogs(tmp_path, lambda: DEFAULT, max_tenants=3, max_bytes=size * 2 + 1, poll_interval=0)
+    for tenant in ("t0", "t1"):
+        await catalogs.get(tenant)
+    await catalogs.get("t0")  # t0 горячий
+    await catalogs.get("t2")  # по размеру помещаются два: вытесняется t1
+
+    assert catalogs.cached("t1") is None
+    assert catalogs.cached("t0") is not None
+    stats = catalogs.stats()
+    assert stats["evictions"] == 1
+    assert stats["size_bytes"] == size * 2
+
+
+@pytest.mark.asyncio
+async def test_cold_load_is_shared_and_does_not_block_hot(tmp_path, catalogs):
+    _write(tmp_path, "hot", _catalog("hot"))
+    _write(tmp_path, "cold", _catalog("cold"))
+    await catalogs.get("hot")
+
+    release = threading.Event()
+    original = catalogs._load
+
+    def slow_load(tenant_id):
+        release.wait(5)
+        return original(tenant_id)
+
+    catalogs._load = slow_load
+    cold = [asyncio.create_task(catalogs.get("cold")) for _ in range(5)]
+    await asyncio.sleep(0.01)
+
+    hot = await asyncio.wait_for(catalogs.get("hot"), timeout=1)
+    assert hot.direction("hot") is not None
+    assert not any(task.done() for task in cold)
+
+    release.set()
+    snapshots = await asyncio.gather(*cold)
+    assert all(snapshot is snapshots[0] for snapshot in snapshots)
+    assert catalogs.stats()["loads"] == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh_reloads_changed_and_new_tenants(tmp_path, catalogs):
+    _write(tmp_path, "studio_a", _catalog("salsa"))
+    old = await catalogs.get("studio_a")
+    assert await catalogs.get("studio_new") is DEFAULT
+
+    _write(tmp_path, "studio_a", _catalog("tango"))
+    _write(tmp_path, "studio_new", _catalog("hiphop"))
+    catalogs.refresh()
+
+    assert (await catalogs.get("studio_a")).version == old.version + 1
+    assert (await catalogs.get("studio_a")).direction("tango") is not None
+    assert (await catalogs.get("studio_new")).direction("hiphop") is not None
+
+
+@pytest.mark.asyncio
+async def test_broken_catalog_falls_back_to_shared(tmp_path, catalogs):
+    (tmp_path / "broken.json").write_text("{", encoding="utf-8")
+    assert await catalogs.get("broken") is DEFAULT
+    assert catalogs.stats()["load_errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_tenant_keywords_drive_dialog(tmp_path, catalogs):
+    _write(tmp_path, "studio_a", _catalog("salsa", keywords={"directions": {"salsa": ["сальса"]}},
+                                          schedule=[{"direction_id": "salsa", "day": "Пн", "time": "19:00"}]))
+    catalog = await catalogs.get("studio_a")
+    session = SessionState("Запись на занятие", "booking_need_direction", {})
+    reply, _, debug = dialog_engine.run("Запись на занятие", "сальса", "text", None,
+                                        session, catalog, StateChange())
+    assert "Пн, 19:00 — Salsa" in reply
+    assert debug["data_collected"] == {"direction": "salsa"}
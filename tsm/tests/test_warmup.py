@@ -0,0 +1,91 @@
+"""
+Тесты прогрева при старте и готовности (GET /ready)
+"""
+import asyncio
+from pathlib import Path
+
+import fakeredis
+import httpx
+import pytest
+from httpx import ASGITransport
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "services" / "orchestrator"))
+
+from app.catalog import CatalogStore
+from app.fsm import AsyncFSM
+from app.main import (
+    app, get_catalog, get_catalog_store, get_readiness, lifespan, set_async_fsm, set_catalog_store,
+    warmup_steps
+)
+from app.warmup import Readiness, retry_failed, warm_up
+
+STUB_PATH = Path(__file__).parent.parent / "data" / "dikidi_stub.json"
+
+
+@pytest.fixture
+def stub_catalog():
+    previous = get_catalog_store()
+    set_catalog_store(CatalogStore(STUB_PATH, poll_interval=0))
+    yield
+    set_catalog_store(previous)
+
+
+def _async_fsm(server=None) -> AsyncFSM:
+    fsm = AsyncFSM("redis://localhost:6379/0")
+    fsm.redis_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    return fsm
+
+
+@pytest.mark.asyncio
+async def test_lifespan_warms_everything_before_ready(stub_catalog):
+    set_async_fsm(_async_fsm())
+    try:
+        async with lifespan(app):
+            async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as client:
+                response = await client.get("/ready")
+    finally:
+        set_async_fsm(None)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "ready"
+    assert set(body["steps"]) == {"catalog", "engine", "redis"}
+    assert all(step["ok"] for step in body["steps"].values())
+    catalog = get_catalog()
+    assert catalog.fragments.warmed
+    assert len(catalog.fragments) > 0
+
+
+@pytest.mark.asyncio
+async def test_not_ready_until_redis_comes_up(stub_catalog):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    set_async_fsm(_async_fsm(server))
+    readiness = Readiness()
+    steps = warmup_steps()
+    try:
+        assert not await warm_up(readiness, steps)
+        assert readiness.as_dict()["status"] == "warming_up"
+        assert readiness.steps["catalog"].ok and not readiness.steps["redis"].ok
+        assert "ConnectionError" in readiness.steps["redis"].error
+
+        server.connected = True
+        await asyncio.wait_for(retry_failed(readiness, steps, interval=0.01), timeout=5)
+    finally:
+        set_async_fsm(None)
+    assert readiness.ready
+    assert readiness.steps["redis"].attempts >= 2
+    assert readiness.steps["catalog"].attempts == 1
+
+
+@pytest.mark.asyncio
+async def test_ready_endpoint_reports_warming_up(monkeypatch):
+    readiness = get_readiness()
+    monkeypatch.setattr(readiness, "ready_after_ms", None)
+    async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as client:
+        response = await client.get("/ready")
+        health = await client.get("/health")
+    assert response.status_code == 503
+    assert response.json()["status"] == "warming_up"
+    assert health.status_code == 200